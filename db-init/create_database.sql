@@ -114,6 +114,11 @@ CREATE TABLE `file` (
   `deleted` tinyint(1) NOT NULL DEFAULT 0,
   `hash` binary(32) DEFAULT NULL,
   `to_be_deleted` tinyint(1) NOT NULL DEFAULT 0,
+  `audio_sampling_rate` int(11) DEFAULT NULL,
+  `audio_channels` int(11) DEFAULT NULL,
+  `audio_sample_width` int(11) DEFAULT NULL,
+  `audio_frames` bigint(20) DEFAULT NULL,
+  `audio_duration` double DEFAULT NULL,
   PRIMARY KEY (`id`),
   KEY `fk_updated_by_id_file` (`updated_by_id`),
   CONSTRAINT `fk_updated_by_id_file` FOREIGN KEY (`updated_by_id`) REFERENCES `user` (`id`)
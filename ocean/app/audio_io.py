@@ -0,0 +1,180 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Reading of WAV (RIFF/WAVE and RF64) audio files without decoding them.
+
+The header of a file is parsed once by `read_info()` (or `parse_header()`), after which
+its samples are available as a read-only `np.memmap` of shape `(frames, channels)`
+from `open_samples()`, so only the parts of the file that are used are read from disk.
+The samples are stored as:
+
+- 8 bit PCM: `uint8` (offset by 128)
+- 16 and 32 bit PCM: `int16` and `int32`
+- 24 bit PCM: `uint8` with an extra last axis of the 3 bytes of each sample
+- 32 and 64 bit IEEE float: `float32` and `float64`
+
+`to_float()` converts samples to `float32` in the range [-1, 1) and `load()` reads a
+whole file as such, only resampling it if a different sampling rate is requested.
+"""
+
+# Standard library imports
+import os
+import struct
+import typing
+
+# Third-party imports
+import numpy as np
+
+# Local application imports
+from . import exception_handler
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# The dtypes of the samples of each supported (format, bits per sample)
+_SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype('u1'),
+    (WAVE_FORMAT_PCM, 16): np.dtype('<i2'),
+    (WAVE_FORMAT_PCM, 24): np.dtype('u1'),
+    (WAVE_FORMAT_PCM, 32): np.dtype('<i4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype('<f8'),
+}
+
+
+class WavInfo(typing.NamedTuple):
+    """The format of a WAV file and the position of its samples (see `read_info()`)."""
+    sampling_rate: int
+    channels: int
+    # `WAVE_FORMAT_PCM` or `WAVE_FORMAT_IEEE_FLOAT` (extensible formats are resolved)
+    format_tag: int
+    bits_per_sample: int
+    frames: int
+    # The position and size in bytes of the samples within the file
+    data_offset: int
+    data_size: int
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sampling_rate
+
+    @property
+    def bytes_per_frame(self) -> int:
+        return self.channels * self.bits_per_sample // 8
+
+
+def _invalid(name: str, reason: str) -> exception_handler.WarningException:
+    return exception_handler.WarningException(f"Unable to read '{name}' as a WAV file: {reason}.")
+
+def read_info(path: str) -> WavInfo:
+    """Parse the header of the WAV file at `path`. Raises a `WarningException` if the file
+    is not a WAV file or its sample format is not supported. The samples of a truncated
+    file end at the end of the file."""
+    with open(path, 'rb') as f:
+        return parse_header(f, os.path.getsize(path), os.path.basename(path))
+
+def parse_header(stream: typing.BinaryIO, file_size: int, name: str = 'file') -> WavInfo:
+    """Parse the header of a WAV file of `file_size` bytes from `stream`, which is
+    positioned at the start of the file (see `read_info()`). Only the header is read, so
+    `stream` may hold just the start of the file. `name` is used in error messages."""
+    header = stream.read(12)
+    if len(header) < 12 or header[:4] not in (b'RIFF', b'RF64') or header[8:12] != b'WAVE':
+        raise _invalid(name, "not a RIFF/WAVE file")
+    rf64_data_size = None
+    fmt = None
+    while True:
+        chunk_header = stream.read(8)
+        if len(chunk_header) < 8: raise _invalid(name, "no data chunk")
+        chunk_id, chunk_size = chunk_header[:4], struct.unpack('<I', chunk_header[4:])[0]
+        if chunk_id == b'ds64':
+            rf64_data_size = struct.unpack('<Q', stream.read(chunk_size)[8:16])[0]
+        elif chunk_id == b'fmt ':
+            fmt = stream.read(chunk_size)
+            if len(fmt) < 16: raise _invalid(name, "truncated format chunk")
+        elif chunk_id == b'data':
+            data_offset = stream.tell()
+            data_size = rf64_data_size if header[:4] == b'RF64' and rf64_data_size is not None else chunk_size
+            break
+        else:
+            stream.seek(chunk_size, os.SEEK_CUR)
+        # Chunks are padded to an even size
+        if chunk_size % 2: stream.seek(1, os.SEEK_CUR)
+    if fmt is None: raise _invalid(name, "no format chunk before the data chunk")
+
+    format_tag, channels, sampling_rate, _, _, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        if len(fmt) < 40: raise _invalid(name, "truncated extensible format chunk")
+        # The format is the first two bytes of the sub-format GUID
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+    if (format_tag, bits_per_sample) not in _SAMPLE_DTYPES:
+        raise _invalid(name, f"unsupported sample format {format_tag} with {bits_per_sample} bits per sample")
+    if channels == 0 or sampling_rate == 0: raise _invalid(name, "no channels or sampling rate")
+
+    data_size = max(0, min(data_size, file_size - data_offset))
+    frames = data_size // (channels * bits_per_sample // 8)
+    return WavInfo(sampling_rate=sampling_rate, channels=channels, format_tag=format_tag, bits_per_sample=bits_per_sample,
+                   frames=frames, data_offset=data_offset, data_size=data_size)
+
+def open_samples(path: str, info: WavInfo = None) -> np.ndarray:
+    """A read-only memory map of the samples of the WAV file at `path` with the shape
+    `(frames, channels)` (and 3 bytes per sample for 24 bit PCM). `info` is the result of
+    `read_info()`, which is called if it is not given."""
+    info = info or read_info(path)
+    dtype = _SAMPLE_DTYPES[(info.format_tag, info.bits_per_sample)]
+    shape = (info.frames, info.channels, 3) if info.bits_per_sample == 24 else (info.frames, info.channels)
+    # Empty files cannot be memory mapped
+    if info.frames == 0: return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=info.data_offset, shape=shape)
+
+def to_float(samples: np.ndarray, info: WavInfo) -> np.ndarray:
+    """Convert `samples` (from `open_samples()`, or a slice of it along the first axis)
+    to `float32` in the range [-1, 1). Float samples are not rescaled."""
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return samples.astype(np.float32)
+    if info.bits_per_sample == 8:
+        return (samples.astype(np.float32) - 128) / 128
+    if info.bits_per_sample == 24:
+        # Place the three bytes in the upper bytes of an int32 to keep the sign
+        samples = samples.astype(np.int32)
+        samples = (samples[..., 0] << 8) | (samples[..., 1] << 16) | (samples[..., 2] << 24)
+        return samples.astype(np.float32) / 2 ** 31
+    return samples.astype(np.float32) / 2 ** (info.bits_per_sample - 1)
+
+def load(path: str, sampling_rate: int = None, mono: bool = True) -> typing.Tuple[np.ndarray, int]:
+    """
+    Read the WAV file at `path` as `float32` (see `to_float()`), resampled to
+    `sampling_rate` if it is given and differs from the sampling rate of the file.
+
+    Returns:
+        tuple: The audio (of shape `(frames,)` if `mono`, in which case the channels are
+        averaged, otherwise `(frames, channels)`) and its sampling rate.
+    """
+    info = read_info(path)
+    samples = open_samples(path, info)
+    if mono and info.channels == 1:
+        audio = to_float(samples[:, 0], info)
+    elif mono:
+        audio = to_float(samples, info).mean(axis=1)
+    else:
+        audio = to_float(samples, info)
+    del samples
+    if sampling_rate is None or sampling_rate == info.sampling_rate:
+        return audio, info.sampling_rate
+    import librosa
+    return librosa.resample(audio, orig_sr=info.sampling_rate, target_sr=sampling_rate, axis=0), sampling_rate
@@ -0,0 +1,155 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A bounded pool of background threads for work which does not need to finish before a
+response is sent, such as pre-rendering the plot of a selection after its files are
+uploaded (see `submit_plot_prerender()`). Tasks are typically submitted from
+`TransactionProxy.on_success` so that they only run once the transaction has been
+committed.
+
+The queue of the pool is bounded: when it is full, new tasks are dropped (and counted)
+rather than blocking the request that submitted them. The number of queued, running,
+completed, failed and dropped tasks and the time spent running them are available
+through `get_statistics()`.
+"""
+
+# Standard library imports
+import queue
+import threading
+import time
+import typing
+
+# Local application imports
+from .logger import logger
+
+
+class WorkerPoolStatistics(typing.NamedTuple):
+    """The state of a `WorkerPool` (the counters are since the pool was created)."""
+    workers: int
+    queued: int
+    running: int
+    completed: int
+    failed: int
+    dropped: int
+    # Total and maximum time spent running tasks (in seconds)
+    total_seconds: float
+    max_seconds: float
+    last_failure: typing.Optional[str]
+
+    @property
+    def mean_seconds(self) -> float:
+        finished = self.completed + self.failed
+        return self.total_seconds / finished if finished else 0.0
+
+
+class WorkerPool:
+    """A pool of `workers` daemon threads running the tasks submitted with `submit()`,
+    which holds at most `max_queued` tasks waiting to run."""
+
+    def __init__(self, workers: int, max_queued: int):
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._counters = {'running': 0, 'completed': 0, 'failed': 0, 'dropped': 0}
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+        self._last_failure = None
+        self._threads = [threading.Thread(target=self._run, name=f"ocean-worker-{i}", daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, description: str, function: typing.Callable, *args, **kwargs) -> bool:
+        """Queue `function(*args, **kwargs)` to be run in the background. Returns `False`
+        (and drops the task) if the queue is full or the pool has no workers.
+        `description` is used when logging failures."""
+        if self._workers == 0:
+            return False
+        try:
+            self._queue.put_nowait((description, function, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._counters['dropped'] += 1
+            logger.warning(f"Background task queue full, dropped: {description}")
+            return False
+        return True
+
+    def join(self) -> None:
+        """Block until all queued tasks have finished."""
+        self._queue.join()
+
+    def get_statistics(self) -> WorkerPoolStatistics:
+        with self._lock:
+            return WorkerPoolStatistics(workers=self._workers, queued=self._queue.qsize(), total_seconds=self._total_seconds,
+                                        max_seconds=self._max_seconds, last_failure=self._last_failure, **self._counters)
+
+    def _run(self) -> None:
+        while True:
+            description, function, args, kwargs = self._queue.get()
+            with self._lock:
+                self._counters['running'] += 1
+            start = time.perf_counter()
+            failure = None
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                failure = f"{description}: {e}"
+                logger.exception(f"Background task failed: {failure}")
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._counters['running'] -= 1
+                self._counters['failed' if failure else 'completed'] += 1
+                self._total_seconds += seconds
+                self._max_seconds = max(self._max_seconds, seconds)
+                if failure: self._last_failure = failure
+            self._queue.task_done()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> WorkerPool:
+    """The worker pool of the application, created on first use with
+    `BACKGROUND_WORKERS` threads and a queue of `BACKGROUND_QUEUE_SIZE` tasks."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from flask import current_app
+            _pool = WorkerPool(current_app.config.get('BACKGROUND_WORKERS', 2), current_app.config.get('BACKGROUND_QUEUE_SIZE', 100))
+        return _pool
+
+def get_statistics() -> typing.Optional[WorkerPoolStatistics]:
+    """The statistics of the application worker pool, or `None` if it has not been created."""
+    return _pool.get_statistics() if _pool else None
+
+def _prerender_plot(app, selection_id: str) -> None:
+    from . import database_handler
+    from . import models
+    from . import plot_cache
+    from . import spectrogram
+    with app.app_context(), database_handler.get_session() as session:
+        selection = session.query(models.Selection).filter_by(id=selection_id).first()
+        # Plots of selection files without a hash cannot be cached
+        if selection is None or selection.selection_file is None or selection.selection_file.hash is None: return
+        selection.get_plot(max_cache_size=app.config.get('PLOT_CACHE_MAX_SIZE', plot_cache.DEFAULT_MAX_SIZE), renderer=app.config.get('PLOT_RENDERER', spectrogram.DEFAULT_RENDERER))
+
+def submit_plot_prerender(selection_id: str) -> bool:
+    """Render the plot of the selection with the ID `selection_id` into the plot cache in
+    the background (see `Selection.get_plot()`), using the configured renderer. Must be
+    called within an application context. Returns whether the task was queued."""
+    from flask import current_app
+    return get_pool().submit(f"Pre-render plot of selection {selection_id}", _prerender_plot, current_app._get_current_object(), selection_id)
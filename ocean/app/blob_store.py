@@ -0,0 +1,153 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Content-addressed deduplication of the files in the file space. When enabled (with
+`DEDUPLICATE_FILES`), the content of each file is stored once per hash (`File.hash`) as
+a blob in the blob space (see `database_handler.get_blob_space()`), and every file in the
+data and deleted spaces with that content is a hard link to the blob (see
+`deduplicate()`).
+
+As files are hard links, moving a file (see `File._move()`) and moving it to the trash
+are unaffected, and permanently deleting a file only removes its link. The number of
+files referencing a blob is the link count of the blob less one (the blob itself), so
+blobs with a link count of one are no longer referenced and are removed by `release()`
+and `collect_garbage()`.
+
+Files in the file space are only ever replaced, never modified in place, which
+deduplication relies on: modifying a file would modify every file sharing its blob.
+"""
+
+# Standard library imports
+import os
+import typing
+import uuid
+
+# Local application imports
+from . import database_handler
+from .logger import logger
+
+
+class DeduplicationStatistics(typing.NamedTuple):
+    """The number and total size in bytes of the blobs, the number of files referencing
+    them, the bytes reclaimed by storing each blob once rather than once per file, and the
+    number of blobs which are no longer referenced."""
+    blobs: int
+    size: int
+    references: int
+    reclaimed: int
+    unreferenced: int
+
+
+def is_enabled() -> bool:
+    """Whether files are deduplicated when inserted (the `DEDUPLICATE_FILES` setting of
+    the current application, or `False` outside of an application context)."""
+    from flask import current_app, has_app_context
+    return has_app_context() and bool(current_app.config.get('DEDUPLICATE_FILES', False))
+
+def _get_blob_path(file_hash: bytes, blob_space: str = None) -> str:
+    file_hash = file_hash.hex()
+    return os.path.join(blob_space or database_handler.get_blob_space(), file_hash[:2], file_hash)
+
+def deduplicate(path: str, file_hash: bytes) -> int:
+    """
+    Replace the file at `path`, whose content has the hash `file_hash`, with a hard link
+    to the blob of `file_hash`, or make the file the blob if there is none. The file is
+    left as it is if it cannot be linked (such as on file systems without hard links),
+    which is logged rather than raised.
+
+    Returns:
+        int: The number of bytes reclaimed (the size of the file if it was replaced).
+    """
+    if file_hash is None: return 0
+    blob = _get_blob_path(file_hash)
+    temporary = None
+    try:
+        stat = os.stat(path)
+        try:
+            blob_stat = os.stat(blob)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)
+                return 0
+            except FileExistsError:
+                # The blob was created by another insert in the meantime
+                blob_stat = os.stat(blob)
+        if os.path.samestat(stat, blob_stat): return 0
+        if stat.st_size != blob_stat.st_size:
+            logger.warning(f"Not deduplicating {path} as its size differs from the blob {blob} of the same hash")
+            return 0
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.link(blob, temporary)
+        os.replace(temporary, path)
+        return stat.st_size
+    except OSError as e:
+        logger.warning(f"Unable to deduplicate {path}: {e}")
+        if temporary and os.path.exists(temporary): os.remove(temporary)
+        return 0
+
+def is_deduplicated(path: str, file_hash: bytes) -> bool:
+    """Whether the file at `path` is a link to the blob of `file_hash`."""
+    if file_hash is None: return False
+    try:
+        return os.path.samefile(path, _get_blob_path(file_hash))
+    except FileNotFoundError:
+        return False
+
+def release(file_hash: bytes) -> None:
+    """Remove the blob of `file_hash` if no file references it. Called after a file with
+    the hash is permanently deleted."""
+    if file_hash is None: return
+    blob = _get_blob_path(file_hash, os.path.join(database_handler.get_file_space(), database_handler.BLOB_DIR))
+    try:
+        if os.stat(blob).st_nlink == 1: os.remove(blob)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Unable to release blob {blob}: {e}")
+
+def _scan_blobs() -> typing.Iterator[os.DirEntry]:
+    for directory in os.scandir(database_handler.get_blob_space()):
+        if not directory.is_dir(): continue
+        for entry in os.scandir(directory.path):
+            if entry.is_file(): yield entry
+
+def collect_garbage() -> typing.Tuple[int, int]:
+    """Remove the blobs which are no longer referenced by any file. Returns the number of
+    blobs removed and their total size in bytes."""
+    removed = size = 0
+    for entry in _scan_blobs():
+        stat = entry.stat()
+        if stat.st_nlink == 1:
+            os.remove(entry.path)
+            removed += 1
+            size += stat.st_size
+    return removed, size
+
+def get_statistics() -> typing.Optional[DeduplicationStatistics]:
+    """The statistics of the blob space, or `None` if files have never been deduplicated."""
+    if not os.path.exists(os.path.join(database_handler.get_file_space(), database_handler.BLOB_DIR)): return None
+    blobs = size = references = reclaimed = unreferenced = 0
+    for entry in _scan_blobs():
+        stat = entry.stat()
+        blobs += 1
+        size += stat.st_size
+        references += stat.st_nlink - 1
+        if stat.st_nlink == 1: unreferenced += 1
+        else: reclaimed += stat.st_size * (stat.st_nlink - 2)
+    return DeduplicationStatistics(blobs=blobs, size=size, references=references, reclaimed=reclaimed, unreferenced=unreferenced)
@@ -0,0 +1,136 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A persistent cache of contour statistics and CTR data, stored in the cache space of
+the file space (see `database_handler.get_cache_space()`). Entries are keyed by the
+SHA-256 hash of the contour file (`File.hash`) and `contour_statistics.ALGORITHM_VERSION`,
+so a contour file is only ever processed once per version of the algorithm. When the
+version changes, entries of all other versions are deleted.
+"""
+
+# Standard library imports
+import json
+import os
+import shutil
+import tempfile
+import typing
+
+# Third-party imports
+import numpy as np
+
+# Local application imports
+from . import contour_statistics
+from . import database_handler
+from . import exception_handler
+from .logger import logger
+
+CACHE_NAME = 'contour_statistics'
+
+
+class ContourCacheEntry(typing.NamedTuple):
+    """The cached results of processing a contour file.
+
+    - `statistics`: the output of `contour_statistics.calculate_contour_statistics()`,
+      or `None` if the calculation raised a `WarningException`
+    - `statistics_error`: the message of that `WarningException` (otherwise `None`)
+    - `mat_data`: the output of `ContourFileHandler.get_ctr_data()`
+    """
+    statistics: typing.Optional[dict]
+    statistics_error: typing.Optional[str]
+    mat_data: dict
+
+
+def _get_version_directory(version: int = None) -> str:
+    version = contour_statistics.ALGORITHM_VERSION if version is None else version
+    return os.path.join(database_handler.get_cache_space(), CACHE_NAME, f"v{version}")
+
+def _get_entry_path(file_hash: bytes) -> str:
+    file_hash = file_hash.hex()
+    return os.path.join(_get_version_directory(), file_hash[:2], f"{file_hash}.npz")
+
+def _to_native(value):
+    """Convert NumPy scalars into their Python equivalent (so that they can be stored as JSON)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+def get(file_hash: bytes) -> typing.Optional[ContourCacheEntry]:
+    """Get the cached entry for the contour file with the hash `file_hash`, or `None`
+    if there is no entry (or if `file_hash` is `None`)."""
+    if file_hash is None: return None
+    path = _get_entry_path(file_hash)
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            metadata = json.loads(str(data["metadata"]))
+            mat_data = {'tempres': metadata["tempres"], 'freqContour': data["freq_contour"], 'ctrlength': metadata["ctrlength"]}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # A corrupt entry is treated as a miss (and will be overwritten)
+        logger.warning(f"Unable to read contour cache entry {path}: {e}")
+        return None
+    return ContourCacheEntry(statistics=metadata["statistics"], statistics_error=metadata["statistics_error"], mat_data=mat_data)
+
+def put(file_hash: bytes, entry: ContourCacheEntry) -> None:
+    """Store `entry` as the cached entry for the contour file with the hash `file_hash`.
+    Nothing is stored if `file_hash` is `None`. The entry is written to a temporary file
+    first so that a partially written entry is never read. As the cache is only an
+    optimisation, failing to write the entry is logged rather than raised."""
+    if file_hash is None: return
+    try:
+        _put(file_hash, entry)
+    except OSError as e:
+        logger.warning(f"Unable to write contour cache entry for {file_hash.hex()}: {e}")
+
+def _put(file_hash: bytes, entry: ContourCacheEntry) -> None:
+    if not os.path.exists(_get_version_directory()):
+        os.makedirs(_get_version_directory(), exist_ok=True)
+        invalidate_stale_versions()
+    path = _get_entry_path(file_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    metadata = {
+        "statistics": None if entry.statistics is None else {attr: _to_native(value) for attr, value in entry.statistics.items()},
+        "statistics_error": entry.statistics_error,
+        "tempres": _to_native(entry.mat_data['tempres']),
+        "ctrlength": _to_native(entry.mat_data['ctrlength']),
+    }
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npz", delete=False) as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), freq_contour=np.asarray(entry.mat_data['freqContour']))
+    os.replace(f.name, path)
+
+def invalidate(file_hash: bytes) -> None:
+    """Delete the cached entry for the contour file with the hash `file_hash`."""
+    if file_hash is None: return
+    if os.path.exists(_get_entry_path(file_hash)): os.remove(_get_entry_path(file_hash))
+
+def invalidate_stale_versions() -> None:
+    """Delete the cached entries of all versions other than `contour_statistics.ALGORITHM_VERSION`."""
+    cache_directory = os.path.join(database_handler.get_cache_space(), CACHE_NAME)
+    if not os.path.exists(cache_directory): return
+    current = os.path.basename(_get_version_directory())
+    for name in os.listdir(cache_directory):
+        if name != current:
+            logger.info(f"Deleting stale contour cache {name}")
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
+
+def calculate(contour_file_handler: contour_statistics.ContourFileHandler) -> ContourCacheEntry:
+    """Process a parsed contour file into a (not yet cached) `ContourCacheEntry`."""
+    data = contour_file_handler.contour_data
+    try:
+        statistics, statistics_error = contour_statistics.calculate_contour_statistics(data.time_milliseconds, data.peak_frequency, data.duty_cycle), None
+    except exception_handler.WarningException as e:
+        statistics, statistics_error = None, str(e)
+    return ContourCacheEntry(statistics=statistics, statistics_error=statistics_error, mat_data=contour_file_handler.get_ctr_data())
@@ -16,12 +16,29 @@
 # along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
 
 # Standard library imports
+import concurrent.futures
+import csv
+import io
+import multiprocessing
 import numpy as np
 import pandas as pd
 import os
+import struct
+import threading
+import time
+import typing
+import warnings
 from enum import Enum
 
 from . import exception_handler
+from . import summary_statistics
+
+try:
+    import numba
+except ImportError:
+    # Numba is optional, without it the NumPy implementation of the sweep, step and
+    # inflection calculations is used (see `calculate_sweeps_steps_inflections()`)
+    numba = None
 
 
 def round_to_nearest_whole(num):
@@ -51,26 +68,697 @@ class Step(Enum):
     FLAT=1
     UP=2
 
-class ContourDataUnit:
+# The version of the contour statistics and CTR algorithms. This MUST be incremented
+# whenever a change is made that alters their output, as it invalidates all cached
+# results (see `contour_cache`).
+ALGORITHM_VERSION = 1
+
+# The percentage change in peak frequency between two consecutive rows needed for
+# the change to count as a step (see `_calculate_steps()`)
+STEP_SENSITIVITY = 11
+
+# The names of all statistics calculated by `calculate_contour_statistics()` (these
+# correspond to the contour statistics attributes of a selection)
+STATISTICS = (
+    "duration", "dc_quarter1mean", "dc_quarter2mean", "dc_quarter3mean", "dc_quarter4mean",
+    "num_sweepsdownflat", "num_sweepsdownup", "num_sweepsflatdown", "num_sweepsflatup", "num_sweepsupdown", "num_sweepsupflat",
+    "num_inflections", "inflection_maxdelta", "inflection_mindelta", "inflection_maxmindelta", "inflection_meandelta",
+    "inflection_standarddeviationdelta", "inflection_mediandelta", "inflection_duration",
+    "freq_sweepuppercent", "freq_sweepdownpercent", "freq_sweepflatpercent",
+    "freq_sloperatio", "freq_negslopemean", "freq_posslopemean", "freq_slopemean", "freq_absslopemean",
+    "freq_begsweep", "freq_begup", "freq_begdown", "freq_endsweep", "freq_endup", "freq_enddown",
+    "dc_mean", "dc_standarddeviation",
+    "freq_max", "freq_min", "freq_range", "freq_median", "freq_center", "freq_relbw", "freq_maxminratio",
+    "freq_begin", "freq_end", "freq_begendratio", "freq_mean", "freq_standarddeviation",
+    "freq_quarter1", "freq_quarter2", "freq_quarter3", "freq_spread",
+    "freq_numsteps", "freq_stepup", "freq_stepdown", "step_duration", "freq_cofm",
+)
+
+# The minimum number of rows needed to calculate contour statistics (the beginning
+# and end sweeps each consider three slopes, excluding the first and last rows)
+MIN_CONTOUR_LENGTH = 5
+
+
+def most_common_difference(values: np.ndarray):
+    """
+    Find the most common difference between consecutive values (for example the
+    temporal resolution of a contour) using a histogram of the differences.
+
+    Ties are broken in the same way as `max(set(differences), key=differences.count)`:
+    the first tied difference in the iteration order of the set of differences.
+
+    Raises:
+        ValueError: If there are fewer than two values.
+    """
+    differences = np.diff(values)
+    if len(differences) == 0: raise ValueError("At least two values are needed to find the most common difference.")
+    unique, counts = np.unique(differences, return_counts=True)
+    tied = unique[counts == counts.max()].tolist()
+    if len(tied) == 1: return tied[0]
+    tied = set(tied)
+    return next(difference for difference in set(differences.tolist()) if difference in tied)
+
+def _sequential_sum(values: np.ndarray):
+    """Sum `values` from left to right. Unlike `np.sum()`, which uses pairwise
+    summation, this gives the same rounding as accumulating the values one at
+    a time in a Python loop (as the legacy algorithm does)."""
+    if len(values) == 0: return 0
+    return np.cumsum(values)[-1]
+
+def _forward_fill_index(mask: np.ndarray) -> np.ndarray:
+    """For each position in `mask` return the index of the last position (at or
+    before it) which is `True`, or -1 if there is no such position."""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+def _calculate_slopes(time_milliseconds: np.ndarray, peak_frequency: np.ndarray):
+    """Calculate the slope (frequency difference over time difference) between each
+    pair of consecutive rows.
+
+    Returns a tuple of the slopes of all pairs with a positive time difference (in
+    order) and the slope attributed to each row. The first row has a slope of zero
+    and, as in the legacy algorithm, a row with the same time as the one before it
+    keeps the slope of the previous row.
+    """
+    time_diff = np.diff(time_milliseconds)
+    freq_diff = np.diff(peak_frequency)
+    valid = time_diff > 0
+    slopes = freq_diff[valid] / time_diff[valid]
+
+    row_slopes = np.zeros(len(peak_frequency))
+    row_slopes[1:][valid] = slopes
+    row_slopes = row_slopes[_forward_fill_index(np.concatenate(([True], valid)))]
+    return slopes, row_slopes
+
+def _calculate_steps(peak_frequency: np.ndarray):
+    """Count the number of frequency steps up and down in the contour.
+
+    A row is a step candidate if its frequency is at least `STEP_SENSITIVITY` percent
+    above (UP) or below (DOWN) that of the previous row. A step can only follow a
+    FLAT row, so in a run of consecutive candidates only the first, third, fifth (and
+    so on) rows are counted as steps.
+
+    Returns a tuple of the number of steps up and the number of steps down.
+    """
+    prev_freq, freq = peak_frequency[:-1], peak_frequency[1:]
+    up = freq >= prev_freq * (1 + STEP_SENSITIVITY / 100)
+    down = ~up & (freq <= prev_freq * (1 - STEP_SENSITIVITY / 100))
+    candidate = up | down
+
+    # Distance of each candidate from the start of its run (the first row is always FLAT)
+    positions = np.arange(1, len(peak_frequency))
+    last_flat = np.maximum.accumulate(np.where(candidate, 0, positions))
+    step = candidate & ((positions - last_flat - 1) % 2 == 0)
+    return int(np.count_nonzero(step & up)), int(np.count_nonzero(step & down))
+
+def _calculate_sweeps(peak_frequency: np.ndarray):
+    """Calculate the sweep of each row in the contour by comparing its frequency
+    with that of the previous and next rows.
+
+    - UP if the frequency does not decrease (previous <= current <= next)
+    - DOWN if the frequency does not increase (previous >= current >= next)
+    - FLAT if the frequency does not change (previous == current == next)
+    - otherwise (a peak or a trough) the sweep of the previous row, or FLAT if
+      there is no previous sweep
+
+    The first row is not given a sweep (-1 is used as a placeholder) and, to maintain
+    the legacy algorithm, the last row is always considered a DOWN sweep.
+
+    Returns a tuple of the sweep values (`Sweep.value`) of each row, and the number of
+    rows matching the UP, DOWN and FLAT conditions respectively. Note that a FLAT row
+    also matches the UP and DOWN conditions and is counted three times.
+    """
+    prev_freq, freq, next_freq = peak_frequency[:-2], peak_frequency[1:-1], peak_frequency[2:]
+    sweep_up = (prev_freq <= freq) & (freq <= next_freq)
+    sweep_down = (prev_freq >= freq) & (freq >= next_freq)
+    sweep_flat = (prev_freq == freq) & (freq == next_freq)
+
+    interior = np.full(len(freq), -1)
+    interior[sweep_up] = Sweep.UP.value
+    interior[sweep_down] = Sweep.DOWN.value
+    interior[sweep_flat] = Sweep.FLAT.value
+    last_sweep = _forward_fill_index(interior >= 0)
+    interior = np.where(last_sweep >= 0, interior[last_sweep], Sweep.FLAT.value)
+
+    sweeps = np.concatenate(([-1], interior, [Sweep.DOWN.value]))
+    return sweeps, int(np.count_nonzero(sweep_up)), int(np.count_nonzero(sweep_down)), int(np.count_nonzero(sweep_flat))
+
+def _count_sweep_transitions(sweeps: np.ndarray, prev_sweep: Sweep, curr_sweep: Sweep) -> int:
+    """Count the number of consecutive rows (from the second row onwards) going from
+    `prev_sweep` to `curr_sweep`."""
+    return int(np.count_nonzero((sweeps[1:-1] == prev_sweep.value) & (sweeps[2:] == curr_sweep.value)))
+
+def _calculate_inflections(sweeps: np.ndarray) -> np.ndarray:
+    """Find the rows at which the contour changes direction.
+
+    The direction is first set by the sweep of the second row and is only ever
+    changed by an UP or DOWN sweep (a FLAT sweep leaves the direction unchanged).
+    An inflection occurs whenever an UP sweep follows a DOWN direction, or vice versa.
+    As the last row is always considered a DOWN sweep (legacy algorithm), a contour
+    with an UP direction will always end with an inflection.
+
+    Returns the indices of the rows at which an inflection occurs.
+    """
+    directional = np.flatnonzero(sweeps[1:] != Sweep.FLAT.value) + 1
+    return directional[1:][np.diff(sweeps[directional]) != 0]
+
+# The sweep transitions counted by `calculate_sweeps_steps_inflections()` (in order)
+SWEEP_TRANSITIONS = (
+    (Sweep.DOWN, Sweep.FLAT), (Sweep.DOWN, Sweep.UP), (Sweep.FLAT, Sweep.DOWN),
+    (Sweep.FLAT, Sweep.UP), (Sweep.UP, Sweep.DOWN), (Sweep.UP, Sweep.FLAT),
+)
+_SWEEP_DOWN, _SWEEP_FLAT, _SWEEP_UP = Sweep.DOWN.value, Sweep.FLAT.value, Sweep.UP.value
+# Index into the counts of `calculate_sweeps_steps_inflections()` for each pair of
+# (previous, current) sweep values, or -1 if the transition is not counted
+_SWEEP_TRANSITION_INDEX = np.full((3, 3), -1, dtype=np.int64)
+for _i, (_prev_sweep, _curr_sweep) in enumerate(SWEEP_TRANSITIONS):
+    _SWEEP_TRANSITION_INDEX[_prev_sweep.value, _curr_sweep.value] = 5 + _i
+_NUM_SEQUENTIAL_COUNTS = 5 + len(SWEEP_TRANSITIONS)
+
+def _sweeps_steps_inflections_numpy(peak_frequency: np.ndarray) -> tuple:
+    """NumPy implementation of `calculate_sweeps_steps_inflections()`."""
+    freq_stepup, freq_stepdown = _calculate_steps(peak_frequency)
+    sweeps, sweep_up_count, sweep_down_count, sweep_flat_count = _calculate_sweeps(peak_frequency)
+    transitions = [_count_sweep_transitions(sweeps, prev_sweep, curr_sweep) for prev_sweep, curr_sweep in SWEEP_TRANSITIONS]
+    counts = np.array([freq_stepup, freq_stepdown, sweep_up_count, sweep_down_count, sweep_flat_count, *transitions], dtype=np.int64)
+    return counts, _calculate_inflections(sweeps)
+
+def _sweeps_steps_inflections_loop(peak_frequency: np.ndarray, step_up_factor: float, step_down_factor: float) -> tuple:
+    """Single pass implementation of `calculate_sweeps_steps_inflections()` over a
+    contiguous float64 array. This is compiled with Numba (when available), as a plain
+    Python loop it is much slower than `_sweeps_steps_inflections_numpy()`.
+
+    The step, sweep and inflection rules are those documented in `_calculate_steps()`,
+    `_calculate_sweeps()` and `_calculate_inflections()`.
+    """
+    num_points = len(peak_frequency)
+    counts = np.zeros(_NUM_SEQUENTIAL_COUNTS, dtype=np.int64)
+    inflections = np.empty(num_points, dtype=np.int64)
+    num_inflections = 0
+
+    step_flat = True
+    prev_sweep = -1
+    sweep = _SWEEP_FLAT
+    direction = -1
+    for i in range(1, num_points):
+        prev_freq = peak_frequency[i - 1]
+        freq = peak_frequency[i]
+
+        # Steps (a step can only follow a FLAT step)
+        step_up = freq >= prev_freq * step_up_factor
+        step_down = not step_up and freq <= prev_freq * step_down_factor
+        if (step_up or step_down) and step_flat:
+            if step_up: counts[0] += 1
+            else: counts[1] += 1
+            step_flat = False
+        else:
+            step_flat = True
+
+        # Sweeps (the last row is always DOWN, see `_calculate_sweeps()`)
+        if i < num_points - 1:
+            next_freq = peak_frequency[i + 1]
+            sweep_up = prev_freq <= freq and freq <= next_freq
+            sweep_down = prev_freq >= freq and freq >= next_freq
+            sweep_flat = prev_freq == freq and freq == next_freq
+            if sweep_up: counts[2] += 1
+            if sweep_down: counts[3] += 1
+            if sweep_flat: counts[4] += 1
+            if sweep_flat: sweep = _SWEEP_FLAT
+            elif sweep_down: sweep = _SWEEP_DOWN
+            elif sweep_up: sweep = _SWEEP_UP
+        else:
+            sweep = _SWEEP_DOWN
+        if prev_sweep >= 0:
+            index = _SWEEP_TRANSITION_INDEX[prev_sweep, sweep]
+            if index >= 0: counts[index] += 1
+        prev_sweep = sweep
+
+        # Inflections (a FLAT sweep does not change the direction)
+        if sweep != _SWEEP_FLAT:
+            if direction >= 0 and sweep != direction:
+                inflections[num_inflections] = i
+                num_inflections += 1
+            direction = sweep
+
+    return counts, inflections[:num_inflections]
+
+# Compiled on first use and cached to disk, so that later processes (including the
+# contour statistics worker processes) do not pay the compilation cost
+_sweeps_steps_inflections_compiled = numba.njit(cache=True, nogil=True)(_sweeps_steps_inflections_loop) if numba else None
+
+def calculate_sweeps_steps_inflections(peak_frequency: np.ndarray) -> tuple:
+    """
+    Calculate the sequential (row by row) statistics of a contour: the number of
+    steps, sweeps and sweep transitions, and the rows at which inflections occur. This
+    uses a Numba compiled loop when Numba is installed and a NumPy implementation
+    otherwise (both give identical results).
+
+    Args:
+        peak_frequency (np.ndarray): The peak frequency of each row in Hz (sorted by time).
+
+    Returns:
+        tuple: An int64 array of the number of steps up, steps down, rows matching the
+        UP, DOWN and FLAT sweep conditions (see `_calculate_sweeps()`) and each of the
+        `SWEEP_TRANSITIONS`, followed by an array of the indices of the inflection rows.
+    """
+    peak_frequency = np.ascontiguousarray(peak_frequency, dtype=np.float64)
+    if _sweeps_steps_inflections_compiled is None:
+        return _sweeps_steps_inflections_numpy(peak_frequency)
+    return _sweeps_steps_inflections_compiled(peak_frequency, 1 + STEP_SENSITIVITY / 100, 1 - STEP_SENSITIVITY / 100)
+
+def calculate_contour_statistics(time_milliseconds: np.ndarray, peak_frequency: np.ndarray, duty_cycle: np.ndarray) -> dict:
+    """
+    Calculate the contour statistics of a contour given as three equal length arrays.
+    The rows of the contour are sorted by time before the statistics are calculated.
+
+    The calculation reproduces the legacy Java algorithm exactly, including its
+    known errors (the last row is considered a DOWN sweep and the end sweep is
+    calculated from the second, third and fourth last slopes).
+
+    Args:
+        time_milliseconds (np.ndarray): The time of each row in milliseconds.
+        peak_frequency (np.ndarray): The peak frequency of each row in Hz.
+        duty_cycle (np.ndarray): The duty cycle of each row.
+
+    Returns:
+        dict: The contour statistics attribute names (see `ISelection.get_contour_statistics_attrs()`)
+        as the keys and the calculated statistics as the values.
+    """
+    order = np.argsort(time_milliseconds, kind='stable')
+    time_milliseconds = np.asarray(time_milliseconds)[order]
+    peak_frequency = np.asarray(peak_frequency, dtype=np.float64)[order]
+    duty_cycle = np.asarray(duty_cycle, dtype=np.float64)[order]
+
+    num_points = len(peak_frequency)
+    if num_points < MIN_CONTOUR_LENGTH:
+        raise exception_handler.WarningException(f"Contour must contain at least {MIN_CONTOUR_LENGTH} rows to calculate contour statistics.")
+
+    statistics = {}
+    # Length of recording based on first and last row
+    statistics["duration"] = (time_milliseconds[-1] - time_milliseconds[0]) / 1000
+
+    # Calculating the quarter means of the duty cycle. For example, the quarter1mean
+    # is the mean of the first quarter of the duty cycles in the contour
+    start = 0
+    for attr, end in [("dc_quarter1mean", num_points // 4), ("dc_quarter2mean", num_points // 2), ("dc_quarter3mean", 3 * num_points // 4), ("dc_quarter4mean", num_points - 1)]:
+        statistics[attr] = _sequential_sum(duty_cycle[start:end + 1]) / (end + 1 - start)
+        start = end + 1
+
+    # Step, sweep and inflection calculations
+    counts, inflections = calculate_sweeps_steps_inflections(peak_frequency)
+    freq_stepup, freq_stepdown, sweep_up_count, sweep_down_count, sweep_flat_count = (int(count) for count in counts[:5])
+    statistics["num_sweepsdownflat"] = int(counts[5])
+    statistics["num_sweepsdownup"] = int(counts[6])
+    statistics["num_sweepsflatdown"] = int(counts[7])
+    statistics["num_sweepsflatup"] = int(counts[8])
+    statistics["num_sweepsupdown"] = int(counts[9])
+    statistics["num_sweepsupflat"] = int(counts[10])
+
+    # Inflection calculations
+    num_inflections = len(inflections)
+    statistics["num_inflections"] = num_inflections
+    if num_inflections > 1:
+        inflection_delta_array = np.sort(np.diff(time_milliseconds[inflections]) / 1000)
+        # Max and min are first and last of sorted list
+        statistics["inflection_maxdelta"] = inflection_delta_array[-1]
+        statistics["inflection_mindelta"] = inflection_delta_array[0]
+        if statistics["inflection_mindelta"] != 0:
+            statistics["inflection_maxmindelta"] = statistics["inflection_maxdelta"] / statistics["inflection_mindelta"]
+        statistics["inflection_meandelta"] = _sequential_sum(inflection_delta_array) / len(inflection_delta_array)
+        inflection_delta_summary = summary_statistics.summarise(inflection_delta_array)
+        if len(inflection_delta_array) > 1:
+            statistics["inflection_standarddeviationdelta"] = inflection_delta_summary.std
+        else:
+            statistics["inflection_standarddeviationdelta"] = 0
+        statistics["inflection_mediandelta"] = inflection_delta_summary.median
+        statistics["inflection_duration"] = num_inflections / statistics["duration"]
+    else:
+        # Default values
+        statistics["inflection_maxdelta"] = 0
+        statistics["inflection_mindelta"] = 0
+        statistics["inflection_maxmindelta"] = 0
+        statistics["inflection_meandelta"] = 0
+        statistics["inflection_standarddeviationdelta"] = 0
+        statistics["inflection_mediandelta"] = 0
+        statistics["inflection_duration"] = 0
+
+    # determine sweep up, down, and flat percentages
+    sweep_count = sweep_up_count + sweep_down_count + sweep_flat_count
+    statistics["freq_sweepuppercent"] = (sweep_up_count / sweep_count) * 100
+    statistics["freq_sweepdownpercent"] = (sweep_down_count / sweep_count) * 100
+    statistics["freq_sweepflatpercent"] = (sweep_flat_count / sweep_count) * 100
+
+    # Slope summary calculations
+    slopes, row_slopes = _calculate_slopes(time_milliseconds, peak_frequency)
+    positive_slopes = slopes[slopes > 0]
+    negative_slopes = slopes[slopes < 0]
+    statistics["freq_sloperatio"] = 0
+    statistics["freq_negslopemean"] = 0
+    statistics["freq_posslopemean"] = 0
+    if len(positive_slopes) > 0:
+        statistics["freq_posslopemean"] = (_sequential_sum(positive_slopes) / len(positive_slopes)) * 1000
+    if len(negative_slopes) > 0:
+        statistics["freq_negslopemean"] = (_sequential_sum(negative_slopes) / len(negative_slopes)) * 1000
+        statistics["freq_sloperatio"] = statistics["freq_posslopemean"] / statistics["freq_negslopemean"]
+    statistics["freq_slopemean"] = (_sequential_sum(slopes) / (num_points - 1)) * 1000
+    statistics["freq_absslopemean"] = (_sequential_sum(np.abs(slopes)) / (num_points - 1)) * 1000
+
+    # calculate beginning slope as an average of the first three non-zero slopes,
+    # skipping the first row as the slope will always be zero
+    beg_slope_avg = (row_slopes[1] + row_slopes[2] + row_slopes[3]) / 3
+    # NOTE: to maintain the legacy algorithm, the end sweep is calculated using the second,
+    # third, and fourth last slopes, rather than the last, second, and third last.
+    end_slope_avg = (row_slopes[-4] + row_slopes[-3] + row_slopes[-2]) / 3
+    for prefix, slope_avg in [("freq_beg", beg_slope_avg), ("freq_end", end_slope_avg)]:
+        if slope_avg > 0: sweep = Sweep.UP
+        elif slope_avg < 0: sweep = Sweep.DOWN
+        else: sweep = Sweep.FLAT
+        statistics[f"{prefix}sweep"] = sweep.value
+        statistics[f"{prefix}up"] = sweep == Sweep.UP
+        statistics[f"{prefix}down"] = sweep == Sweep.DOWN
+
+    duty_cycle_summary = summary_statistics.summarise(duty_cycle)
+    statistics["dc_mean"] = duty_cycle_summary.mean
+    statistics["dc_standarddeviation"] = duty_cycle_summary.std
+
+    peak_frequency_summary = summary_statistics.summarise(peak_frequency)
+    statistics["freq_max"] = peak_frequency_summary.max
+    statistics["freq_min"] = peak_frequency_summary.min
+    statistics["freq_range"] = statistics["freq_max"] - statistics["freq_min"]
+    statistics["freq_median"] = peak_frequency_summary.median
+    statistics["freq_center"] = (statistics["freq_max"] + statistics["freq_min"]) / 2
+    statistics["freq_relbw"] = statistics["freq_range"] / statistics["freq_center"]
+    statistics["freq_maxminratio"] = statistics["freq_max"] / statistics["freq_min"]
+    statistics["freq_begin"] = peak_frequency[0]
+    statistics["freq_end"] = peak_frequency[-1]
+    statistics["freq_begendratio"] = statistics["freq_begin"] / statistics["freq_end"]
+    statistics["freq_mean"] = peak_frequency_summary.mean
+    statistics["freq_standarddeviation"] = peak_frequency_summary.std
+    # frequency quarters are the peak_frequency at one, two and three quarters of the duration
+    statistics["freq_quarter1"] = peak_frequency[int(round_to_nearest_whole(num_points/4))-1]
+    statistics["freq_quarter2"] = peak_frequency[int(round_to_nearest_whole(num_points/2))-1]
+    statistics["freq_quarter3"] = peak_frequency[int(round_to_nearest_whole(3*(num_points/4)))-1]
+    # frequency spread is the difference between the third and first quartiles
+    statistics["freq_spread"] = peak_frequency_summary.quartile3 - peak_frequency_summary.quartile1
+
+    statistics["freq_numsteps"] = freq_stepup + freq_stepdown
+    statistics["freq_stepup"] = freq_stepup
+    statistics["freq_stepdown"] = freq_stepdown
+    statistics["step_duration"] = statistics["freq_numsteps"] / statistics["duration"]
+
+    # Calculate the Coefficient of Frequency Modulation (COFM) from the absolute
+    # difference of every third row (starting at the seventh) with the row three before
+    cofm_rows = peak_frequency[6::3]
+    statistics["freq_cofm"] = _sequential_sum(np.abs(cofm_rows - peak_frequency[3:3 + 3 * len(cofm_rows):3])) / 10000
+
+    return statistics
+
+class ContourData:
+    """
+    The rows of a contour stored as columns, with one contiguous NumPy array per
+    column (see `ContourFileHandler.contour_file_attrs()`). All arrays are of equal
+    length, with the row at index `i` made up of the `i`th element of each array.
+    """
+
     def __init__(self, time_milliseconds, peak_frequency, duty_cycle, energy, window_RMS):
-        self.time_milliseconds = time_milliseconds
-        self.peak_frequency = peak_frequency
-        self.duty_cycle = duty_cycle
-        self.energy = energy
-        self.window_RMS = window_RMS
-
-        self.sweep = None
-        self.step = Step.FLAT
-        self.slope = 0
-    
-    def time_seconds(self):
+        self.time_milliseconds = np.ascontiguousarray(time_milliseconds, dtype=np.int64)
+        self.peak_frequency = np.ascontiguousarray(peak_frequency, dtype=np.float64)
+        self.duty_cycle = np.ascontiguousarray(duty_cycle, dtype=np.float64)
+        self.energy = np.ascontiguousarray(energy, dtype=np.float64)
+        self.window_RMS = np.ascontiguousarray(window_RMS, dtype=np.float64)
+        if not (len(self.time_milliseconds) == len(self.peak_frequency) == len(self.duty_cycle) == len(self.energy) == len(self.window_RMS)):
+            raise ValueError("All contour columns must be of the same length.")
+
+    @classmethod
+    def empty(cls) -> 'ContourData':
+        return cls(*([] for _ in range(5)))
+
+    def __len__(self):
+        return len(self.time_milliseconds)
+
+    def time_seconds(self) -> np.ndarray:
         return self.time_milliseconds / 1000
 
-    def set_slope(self, value):
-        self.slope = value
-    
-    def set_sweep(self, value):
-        self.sweep = value
+def concatenate_contours(contours: list) -> tuple:
+    """
+    Concatenate many contours into a single ragged `ContourData` (see
+    `calculate_contour_statistics_batch()`).
+
+    Args:
+        contours (list[ContourData]): The contours to concatenate.
+
+    Returns:
+        tuple[np.ndarray, ContourData]: The offsets of each contour and the
+        concatenated contour data. Contour `i` is made up of the rows between
+        `offsets[i]` (inclusive) and `offsets[i+1]` (exclusive).
+    """
+    offsets = np.zeros(len(contours) + 1, dtype=np.int64)
+    np.cumsum([len(contour) for contour in contours], out=offsets[1:])
+    if len(contours) == 0: return offsets, ContourData.empty()
+    return offsets, ContourData(*(
+        np.concatenate([getattr(contour, column) for contour in contours])
+        for column in ['time_milliseconds', 'peak_frequency', 'duty_cycle', 'energy', 'window_RMS']
+    ))
+
+def _segment_sequential_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Sum each segment `values[starts[i]:ends[i]]` from left to right (see `_sequential_sum()`).
+    The legacy rounding can only be reproduced by summing each segment separately."""
+    return np.array([values[start:end].cumsum()[-1] if end > start else 0 for start, end in zip(starts.tolist(), ends.tolist())], dtype=np.float64)
+
+def _segment_offsets(segments: np.ndarray, num_segments: int) -> np.ndarray:
+    """The offsets of the segments of an array whose elements belong to the (non-decreasing)
+    `segments`, including any empty segments."""
+    offsets = np.zeros(num_segments + 1, dtype=np.int64)
+    np.cumsum(np.bincount(segments, minlength=num_segments), out=offsets[1:])
+    return offsets
+
+def _calculate_segment_statistics(offsets: np.ndarray, time_milliseconds: np.ndarray, peak_frequency: np.ndarray, duty_cycle: np.ndarray) -> tuple:
+    """
+    Vectorised implementation of `calculate_contour_statistics()` over the contours of
+    `calculate_contour_statistics_batch()`. Every row is processed in one pass over the
+    concatenated arrays: the step, sweep, inflection and slope rules are applied to all
+    rows at once (masking the pairs of rows either side of a contour boundary) and the
+    results are counted per contour with `np.bincount()`.
+
+    Only the sums are calculated per contour (see `_segment_sequential_sums()` and
+    `summary_statistics.segment_sums()`), as no vectorised sum rounds as the scalar
+    implementation does. Contours containing NaN values, and those with no sweeps (which
+    `calculate_contour_statistics()` rejects), cannot be calculated here.
+
+    Returns a tuple of a dictionary of each statistic as an array of one value per contour,
+    and a boolean array of the contours which could not be calculated.
+    """
+    num_contours = len(offsets) - 1
+    starts, ends = offsets[:-1], offsets[1:]
+    lengths = ends - starts
+    rows = np.arange(offsets[-1])
+    segments = np.repeat(np.arange(num_contours), lengths)
+    position = rows - starts[segments]
+    first = position == 0
+    last = position == lengths[segments] - 1
+
+    # Sort the rows of each contour by time (a stable sort, as `calculate_contour_statistics()`),
+    # unless they already are (as they are in contour files)
+    if np.any((np.diff(time_milliseconds) < 0) & ~first[1:]):
+        order = summary_statistics.segment_argsort(time_milliseconds, segments)
+        time_milliseconds = time_milliseconds[order]
+        peak_frequency = peak_frequency[order]
+        duty_cycle = duty_cycle[order]
+
+    statistics = {}
+    statistics["duration"] = (time_milliseconds[ends - 1] - time_milliseconds[starts]) / 1000
+
+    quarter_start = np.zeros(num_contours, dtype=np.int64)
+    for attr, quarter_end in [("dc_quarter1mean", lengths // 4), ("dc_quarter2mean", lengths // 2), ("dc_quarter3mean", 3 * lengths // 4), ("dc_quarter4mean", lengths - 1)]:
+        statistics[attr] = _segment_sequential_sums(duty_cycle, starts + quarter_start, starts + quarter_end + 1) / (quarter_end + 1 - quarter_start)
+        quarter_start = quarter_end + 1
+
+    # Steps (see `_calculate_steps()`): the first row of each contour is never a candidate,
+    # so it ends any run of candidates from the previous contour
+    prev_freq, freq = peak_frequency[:-1], peak_frequency[1:]
+    up = np.concatenate(([False], freq >= prev_freq * (1 + STEP_SENSITIVITY / 100))) & ~first
+    down = np.concatenate(([False], freq <= prev_freq * (1 - STEP_SENSITIVITY / 100))) & ~up & ~first
+    candidate = up | down
+    last_flat = np.maximum.accumulate(np.where(candidate, 0, rows))
+    step = candidate & ((rows - last_flat - 1) % 2 == 0)
+
+    # Sweeps (see `_calculate_sweeps()`) of the rows which are neither first nor last
+    interior = np.flatnonzero(~first & ~last)
+    prev_freq, freq, next_freq = peak_frequency[interior - 1], peak_frequency[interior], peak_frequency[interior + 1]
+    sweep_up = (prev_freq <= freq) & (freq <= next_freq)
+    sweep_down = (prev_freq >= freq) & (freq >= next_freq)
+    sweep_flat = (prev_freq == freq) & (freq == next_freq)
+    sweeps = np.full(len(rows), -1)
+    sweeps[interior[sweep_up]] = Sweep.UP.value
+    sweeps[interior[sweep_down]] = Sweep.DOWN.value
+    sweeps[interior[sweep_flat]] = Sweep.FLAT.value
+    last_sweep = _forward_fill_index(sweeps >= 0)
+    sweeps = np.where(last_sweep >= starts[segments], sweeps[last_sweep], Sweep.FLAT.value)
+    sweeps[first] = -1
+    sweeps[last] = Sweep.DOWN.value
+
+    counts = np.zeros((num_contours, _NUM_SEQUENTIAL_COUNTS), dtype=np.int64)
+    counts[:, 0] = np.bincount(segments[step & up], minlength=num_contours)
+    counts[:, 1] = np.bincount(segments[step & down], minlength=num_contours)
+    for i, mask in enumerate((sweep_up, sweep_down, sweep_flat)):
+        counts[:, 2 + i] = np.bincount(segments[interior[mask]], minlength=num_contours)
+    # Sweep transitions are counted from the second row of each contour onwards
+    transition_rows = np.flatnonzero(position >= 2)
+    transitions = _SWEEP_TRANSITION_INDEX[sweeps[transition_rows - 1], sweeps[transition_rows]]
+    counted = transitions >= 0
+    counts += np.bincount(segments[transition_rows[counted]] * _NUM_SEQUENTIAL_COUNTS + transitions[counted],
+                          minlength=num_contours * _NUM_SEQUENTIAL_COUNTS).reshape(num_contours, _NUM_SEQUENTIAL_COUNTS)
+    freq_stepup, freq_stepdown, sweep_up_count, sweep_down_count, sweep_flat_count = counts[:, :5].T
+    for i, attr in enumerate(["num_sweepsdownflat", "num_sweepsdownup", "num_sweepsflatdown", "num_sweepsflatup", "num_sweepsupdown", "num_sweepsupflat"]):
+        statistics[attr] = counts[:, 5 + i]
+
+    # Inflections (see `_calculate_inflections()`) between consecutive directional rows of the same contour
+    directional = np.flatnonzero(~first & (sweeps != Sweep.FLAT.value))
+    same_contour = segments[directional[1:]] == segments[directional[:-1]]
+    inflections = directional[1:][same_contour & (sweeps[directional[1:]] != sweeps[directional[:-1]])]
+    num_inflections = np.bincount(segments[inflections], minlength=num_contours)
+    statistics["num_inflections"] = num_inflections
+    same_contour = segments[inflections[1:]] == segments[inflections[:-1]]
+    inflection_deltas = (np.diff(time_milliseconds[inflections]) / 1000)[same_contour]
+    delta_segments = segments[inflections[1:]][same_contour]
+    inflection_deltas = inflection_deltas[summary_statistics.segment_argsort(inflection_deltas, delta_segments, stable=False)]
+    delta_offsets = _segment_offsets(delta_segments, num_contours)
+    delta_summary = summary_statistics.summarise_segments(inflection_deltas, delta_offsets)
+    has_inflections = num_inflections > 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistics["inflection_maxdelta"] = np.where(has_inflections, delta_summary.max, 0)
+        statistics["inflection_mindelta"] = np.where(has_inflections, delta_summary.min, 0)
+        # The ratio is not calculated (NaN) if the minimum is zero
+        statistics["inflection_maxmindelta"] = np.where(has_inflections, np.where(delta_summary.min != 0, delta_summary.max / delta_summary.min, np.nan), 0)
+        statistics["inflection_meandelta"] = np.where(has_inflections, _segment_sequential_sums(inflection_deltas, delta_offsets[:-1], delta_offsets[1:]) / delta_summary.count, 0)
+        statistics["inflection_standarddeviationdelta"] = np.where(delta_summary.count > 1, delta_summary.std, 0)
+        statistics["inflection_mediandelta"] = np.where(has_inflections, delta_summary.median, 0)
+        statistics["inflection_duration"] = np.where(has_inflections, num_inflections / statistics["duration"], 0)
+
+        sweep_count = sweep_up_count + sweep_down_count + sweep_flat_count
+        statistics["freq_sweepuppercent"] = (sweep_up_count / sweep_count) * 100
+        statistics["freq_sweepdownpercent"] = (sweep_down_count / sweep_count) * 100
+        statistics["freq_sweepflatpercent"] = (sweep_flat_count / sweep_count) * 100
+
+        # Slopes (see `_calculate_slopes()`) of the pairs of rows of the same contour with a positive time difference
+        time_diff = np.diff(time_milliseconds)
+        valid = (time_diff > 0) & ~first[1:]
+        slopes = np.diff(peak_frequency)[valid] / time_diff[valid]
+        slope_rows = rows[1:][valid]
+        slope_offsets = _segment_offsets(segments[slope_rows], num_contours)
+        slope_sums = _segment_sequential_sums(slopes, slope_offsets[:-1], slope_offsets[1:])
+        signed_counts, signed_means = [], []
+        for mask in (slopes > 0, slopes < 0):
+            signed_offsets = _segment_offsets(segments[slope_rows[mask]], num_contours)
+            signed_counts.append(np.diff(signed_offsets))
+            signed_means.append(np.where(signed_counts[-1] > 0, (_segment_sequential_sums(slopes[mask], signed_offsets[:-1], signed_offsets[1:]) / signed_counts[-1]) * 1000, 0))
+        statistics["freq_posslopemean"], statistics["freq_negslopemean"] = signed_means
+        statistics["freq_sloperatio"] = np.where(signed_counts[1] > 0, statistics["freq_posslopemean"] / statistics["freq_negslopemean"], 0)
+        statistics["freq_slopemean"] = (slope_sums / (lengths - 1)) * 1000
+        statistics["freq_absslopemean"] = (_segment_sequential_sums(np.abs(slopes), slope_offsets[:-1], slope_offsets[1:]) / (lengths - 1)) * 1000
+
+    # Each row keeps the slope of the previous row if it has the same time (the first row has no slope)
+    row_slopes = np.zeros(len(rows))
+    row_slopes[slope_rows] = slopes
+    has_slope = first.copy()
+    has_slope[slope_rows] = True
+    row_slopes = row_slopes[_forward_fill_index(has_slope)]
+    beg_slope_avg = (row_slopes[starts + 1] + row_slopes[starts + 2] + row_slopes[starts + 3]) / 3
+    end_slope_avg = (row_slopes[ends - 4] + row_slopes[ends - 3] + row_slopes[ends - 2]) / 3
+    for prefix, slope_avg in [("freq_beg", beg_slope_avg), ("freq_end", end_slope_avg)]:
+        sweep = np.where(slope_avg > 0, Sweep.UP.value, np.where(slope_avg < 0, Sweep.DOWN.value, Sweep.FLAT.value))
+        statistics[f"{prefix}sweep"] = sweep
+        statistics[f"{prefix}up"] = sweep == Sweep.UP.value
+        statistics[f"{prefix}down"] = sweep == Sweep.DOWN.value
+
+    duty_cycle_summary = summary_statistics.summarise_segments(duty_cycle, offsets)
+    statistics["dc_mean"] = duty_cycle_summary.mean
+    statistics["dc_standarddeviation"] = duty_cycle_summary.std
+
+    peak_frequency_summary = summary_statistics.summarise_segments(peak_frequency, offsets)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistics["freq_max"] = peak_frequency_summary.max
+        statistics["freq_min"] = peak_frequency_summary.min
+        statistics["freq_range"] = statistics["freq_max"] - statistics["freq_min"]
+        statistics["freq_median"] = peak_frequency_summary.median
+        statistics["freq_center"] = (statistics["freq_max"] + statistics["freq_min"]) / 2
+        statistics["freq_relbw"] = statistics["freq_range"] / statistics["freq_center"]
+        statistics["freq_maxminratio"] = statistics["freq_max"] / statistics["freq_min"]
+        statistics["freq_begin"] = peak_frequency[starts]
+        statistics["freq_end"] = peak_frequency[ends - 1]
+        statistics["freq_begendratio"] = statistics["freq_begin"] / statistics["freq_end"]
+        statistics["freq_mean"] = peak_frequency_summary.mean
+        statistics["freq_standarddeviation"] = peak_frequency_summary.std
+        for attr, quarter in [("freq_quarter1", lengths / 4), ("freq_quarter2", lengths / 2), ("freq_quarter3", 3 * (lengths / 4))]:
+            # As `round_to_nearest_whole()`
+            quarter = np.where(quarter % 1 < 0.5, quarter.astype(np.int64), quarter.astype(np.int64) + 1)
+            statistics[attr] = peak_frequency[starts + quarter - 1]
+        statistics["freq_spread"] = peak_frequency_summary.quartile3 - peak_frequency_summary.quartile1
+
+        statistics["freq_numsteps"] = freq_stepup + freq_stepdown
+        statistics["freq_stepup"] = freq_stepup
+        statistics["freq_stepdown"] = freq_stepdown
+        statistics["step_duration"] = statistics["freq_numsteps"] / statistics["duration"]
+
+    # The COFM compares every third row (from the seventh) with the row three before it
+    cofm_rows = np.flatnonzero((position >= 6) & (position % 3 == 0))
+    cofm_offsets = _segment_offsets(segments[cofm_rows], num_contours)
+    statistics["freq_cofm"] = _segment_sequential_sums(np.abs(peak_frequency[cofm_rows] - peak_frequency[cofm_rows - 3]), cofm_offsets[:-1], cofm_offsets[1:]) / 10000
+
+    unhandled = sweep_count == 0
+    unhandled[segments[np.isnan(peak_frequency) | np.isnan(duty_cycle)]] = True
+    return statistics, unhandled
+
+def calculate_contour_statistics_batch(ids: list, offsets: np.ndarray, time_milliseconds: np.ndarray, peak_frequency: np.ndarray, duty_cycle: np.ndarray) -> pd.DataFrame:
+    """
+    Calculate the contour statistics of many contours at once. The contours are given
+    as ragged arrays: the values of all contours are concatenated into three arrays
+    and `offsets` marks where each contour begins and ends (see `concatenate_contours()`).
+
+    The statistics of all contours are calculated together in one vectorised pass over
+    the concatenated arrays (see `_calculate_segment_statistics()`), giving the same
+    values as `calculate_contour_statistics()` would for each contour. Contours containing
+    NaN values or without any sweeps are passed to `calculate_contour_statistics()`
+    instead (which raises for the latter). A contour which is too short to calculate
+    statistics for raises a `WarningException` naming its ID.
+
+    Args:
+        ids (list): The ID of each contour (for example the selection ID).
+        offsets (np.ndarray): An array of `len(ids) + 1` non-decreasing offsets, starting
+            with 0 and ending with the total number of rows.
+        time_milliseconds (np.ndarray): The time of each row in milliseconds.
+        peak_frequency (np.ndarray): The peak frequency of each row in Hz.
+        duty_cycle (np.ndarray): The duty cycle of each row.
+
+    Returns:
+        pd.DataFrame: A table with one row per contour (indexed by ID) and one column per
+        contour statistic (see `STATISTICS`). Statistics which could not be calculated (such as the
+        `inflection_maxmindelta` when the `inflection_mindelta` is zero) are NaN.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    time_milliseconds = np.asarray(time_milliseconds)
+    peak_frequency = np.asarray(peak_frequency, dtype=np.float64)
+    duty_cycle = np.asarray(duty_cycle, dtype=np.float64)
+    if len(offsets) != len(ids) + 1:
+        raise ValueError("There must be exactly one more offset than there are contours.")
+    if len(offsets) > 0 and (offsets[0] != 0 or offsets[-1] != len(time_milliseconds) or np.any(np.diff(offsets) < 0)):
+        raise ValueError("Offsets must be non-decreasing, starting at 0 and ending at the number of rows.")
+    if not (len(time_milliseconds) == len(peak_frequency) == len(duty_cycle)):
+        raise ValueError("All contour columns must be of the same length.")
+
+    lengths = np.diff(offsets)
+    too_short = np.flatnonzero(lengths < MIN_CONTOUR_LENGTH)
+    if len(too_short) > 0:
+        raise exception_handler.WarningException(f"Contour {ids[too_short[0]]} must contain at least {MIN_CONTOUR_LENGTH} rows to calculate contour statistics.")
+    if len(ids) == 0:
+        return pd.DataFrame([], index=pd.Index(ids, name="id"), columns=list(STATISTICS))
+
+    statistics, unhandled = _calculate_segment_statistics(offsets, time_milliseconds, peak_frequency, duty_cycle)
+    for i in np.flatnonzero(unhandled):
+        start, end = offsets[i], offsets[i + 1]
+        contour = calculate_contour_statistics(time_milliseconds[start:end], peak_frequency[start:end], duty_cycle[start:end])
+        for attr in STATISTICS:
+            statistics[attr][i] = contour.get(attr, np.nan)
+    return pd.DataFrame({attr: statistics[attr] for attr in STATISTICS}, index=pd.Index(ids, name="id"))
 
 class ContourFileHandler:
 
@@ -87,7 +775,7 @@ class ContourFileHandler:
 
 
     def __init__(self):
-        self.contour_rows = []
+        self.contour_data = ContourData.empty()
 
     def insert_dataframe(self, df):
         # remove whitespace from headers        
@@ -102,380 +790,235 @@ class ContourFileHandler:
             elif df[header].dtype != dtype:
                 datatype_mismatch[header] = (df[header].dtype, dtype)
                 raise exception_handler.WarningException(f"Incorrect data type for column '{header}'. This may be due to opening and saving the CSV in a spreadsheeting program.")
-        for index, row in df.iterrows():
-            contour_data_unit = ContourDataUnit(row['Time [ms]'], row['Peak Frequency [Hz]'], row['Duty Cycle'], row['Energy'], row['WindowRMS'])
-            self.add_contour_data_unit(contour_data_unit)
+        self.contour_data = ContourData(**{column: df[header].to_numpy() for column, (dtype, header, nullable) in self.contour_file_attrs().items()})
 
-    def get_ctr_data(self):
+    def insert_csv(self, file):
+        """
+        Parse a contour CSV file directly into NumPy arrays (without pandas). The file is
+        read once and each column is validated against `contour_file_attrs()` as it is
+        parsed. Surrounding whitespace and quotes in the headers and values are ignored, as
+        are any additional columns.
+
+        Args:
+            file (str | typing.TextIO): The path to the CSV file or an open text stream.
+
+        Raises:
+            exception_handler.WarningException: If the file is empty, a column is missing
+                or a value cannot be parsed as the type of its column.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "r", encoding="utf-8-sig", newline="") as f:
+                return self.insert_csv(f)
+
+        header_line = file.readline()
+        if header_line.strip() == "":
+            raise exception_handler.WarningException("Contour file is empty.")
+        # Headers (and values) may be quoted, as written by spreadsheet programs and pandas
+        headers = [header.strip() for header in next(csv.reader([header_line], skipinitialspace=True))]
+
+        columns = []
+        for column, (dtype, header, nullable) in self.contour_file_attrs().items():
+            if header not in headers:
+                raise exception_handler.WarningException(f"Missing column: {header}")
+            columns.append((column, np.int64 if dtype == int else np.float64, headers.index(header)))
 
-        def find_most_common_difference(arr):
-            differences = []
-            for i in range(len(arr) - 1):
-                differences.append(arr[i + 1] - arr[i])
-            most_common_difference = max(set(differences), key=differences.count)
-            return most_common_difference
-  
-        temp_res = find_most_common_difference([unit.time_milliseconds for unit in self.contour_rows])/1000
-        ctr_length = temp_res*len(self.contour_rows)
+        try:
+            with warnings.catch_warnings():
+                # A file with no rows is not an error here (the statistics calculation will reject it)
+                warnings.filterwarnings("ignore", message="loadtxt: input contained no data")
+                # NumPy (deprecated) truncates floats in integer columns rather than rejecting them
+                warnings.filterwarnings("error", message=r"loadtxt\(\): Parsing an integer via a float", category=DeprecationWarning)
+                data = np.loadtxt(
+                    file,
+                    delimiter=",",
+                    quotechar='"',
+                    dtype=[(column, dtype) for column, dtype, index in columns],
+                    usecols=[index for column, dtype, index in columns],
+                    ndmin=1
+                )
+        except (ValueError, DeprecationWarning) as e:
+            raise exception_handler.WarningException(f"Incorrect data type in contour file ({str(e).splitlines()[0]}). This may be due to opening and saving the CSV in a spreadsheeting program.")
+        self.contour_data = ContourData(**{column: data[column] for column, dtype, index in columns})
+
+    def get_ctr_data(self):
+        temp_res = most_common_difference(self.contour_data.time_milliseconds)/1000
+        ctr_length = temp_res*len(self.contour_data)
         # Create a dictionary to store the data in the .ctr format
-        mat_data = {'tempres':temp_res,'freqContour': np.array([unit.peak_frequency for unit in self.contour_rows]),'ctrlength':ctr_length}
+        mat_data = {'tempres':temp_res,'freqContour': self.contour_data.peak_frequency,'ctrlength':ctr_length}
         return mat_data
 
-    def add_contour_data_unit(self, unit: ContourDataUnit):
-        self.contour_rows.append(unit)
-    
     def get_dataframe(self):
         """Method to return a pandas dataframe of the contour data (taken from the contour file
         provided in the constructor)
         """
-        return self.contour_rows
+        return pd.DataFrame({header: getattr(self.contour_data, column) for column, (dtype, header, nullable) in self.contour_file_attrs().items()})
 
     def calculate_statistics(self, selection):
         """
         Calculate contour statistics using the data in contour_rows. The contour stats
-        are stored in the selection object (in the Database).
+        are stored in the selection object (in the Database). See
+        `calculate_contour_statistics()` for the calculation itself.
         
         Args:
             selection (Selection): The selection object to store the contour statistics in.
         """
+        statistics = calculate_contour_statistics(
+            time_milliseconds=self.contour_data.time_milliseconds,
+            peak_frequency=self.contour_data.peak_frequency,
+            duty_cycle=self.contour_data.duty_cycle
+        )
+        for attr, value in statistics.items():
+            setattr(selection, attr, value)
+        return self.contour_data
 
-        # Sort all CSV rows by the time in the first column
-        # Note the rows should already be sorted on the inputted data
-        self.contour_rows.sort(key=lambda row: row.time_milliseconds)
-
-        # Number of data points in the CSV file
-        num_points = len(self.contour_rows)
-        # Length of recording based on first and last row
-        selection.duration = (self.contour_rows[-1].time_milliseconds - self.contour_rows[0].time_milliseconds) / 1000
-
-        # Counter values for slope statistics calculated
-        # in the rows below
-        slope_sum = 0
-        slope_abs_sum = 0
-        slope_pos_counter = 0
-        slope_pos_sum = 0
-        slope_neg_counter = 0
-        slope_neg_sum = 0
-        for i, contour in enumerate(self.contour_rows):
-            if i > 0:
-                time_diff = contour.time_milliseconds - self.contour_rows[i-1].time_milliseconds
-                freq_diff = contour.peak_frequency - self.contour_rows[i-1].peak_frequency
-                # calculate the slope of each row in the contour
-                # Slopes differ from sweeps as they only take into account the
-                # one-step frequency difference rather than two.
-                if time_diff > 0:
-                    slope = freq_diff / time_diff
-                    slope_sum += slope
-                    slope_abs_sum += abs(slope)
-                    if slope > 0:
-                        slope_pos_sum += slope
-                        slope_pos_counter += 1
-                    elif slope < 0:
-                        slope_neg_sum += slope
-                        slope_neg_counter += 1
-                if freq_diff > 0:
-                    contour.set_slope(slope)
-                elif freq_diff < 0:
-                    contour.set_slope(slope)
-                else:
-                    contour.set_slope(slope)
-            else:
-                # Default slope value is DOWN
-                contour.set_slope(0)
-        
 
-        # See calculations in loop below to understand meaning of these variables
-        step_sensitivity = 11
-        freq_stepup = 0
-        freq_stepdown = 0
-        num_sweeps_up_flat = 0
-        num_sweeps_up_down = 0
-        num_sweeps_down_flat = 0
-        num_sweeps_down_up = 0
-        num_sweeps_flat_down = 0
-        num_sweeps_flat_up = 0
-        sweep_up_count = 0
-        sweep_down_count = 0
-        sweep_flat_count = 0
-        num_inflections = 0
-        inflection_delta_array = []
-        inflection_time_array = []
-        last_sweep = Sweep.FLAT
-        dc_quarter_sum = 0
-        dc_quarter_count = 0
-
-        i = 0
-        while i < num_points:
-            
-            contour = self.contour_rows[i]
-            # Calculating the quarter means of the duty cycle. For example, the 
-            # quarter1mean is the mean of the first quarter of the duty cycles 
-            # in the contour
-            dc_quarter_sum += contour.duty_cycle
-            dc_quarter_count += 1
-            if i == num_points // 4:
-                selection.dc_quarter1mean = dc_quarter_sum / dc_quarter_count
-                dc_quarter_sum = 0
-                dc_quarter_count = 0
-            if i == num_points // 2:
-                selection.dc_quarter2mean = dc_quarter_sum / dc_quarter_count
-                dc_quarter_sum = 0
-                dc_quarter_count = 0
-            if i == 3 * num_points // 4:
-                selection.dc_quarter3mean = dc_quarter_sum / dc_quarter_count
-                dc_quarter_sum = 0
-                dc_quarter_count = 0
-            if i == num_points - 1:
-                selection.dc_quarter4mean = dc_quarter_sum / dc_quarter_count
-                dc_quarter_sum = 0
-                dc_quarter_count = 0
-
-            
-            # Calculate frequency step up and step down counts. A step up occurs when
-            # the frequency increases and a step down occurs when the frequency decreases.
-            # However, two (or more) consecutive increases or decreases are counted as a 
-            # single step, rather than two or more separate steps. Step sensitivity is used
-            # to scale the difference in peak_frequency needed to count as a step.
-            if i >= 1:
-                prev_contour = self.contour_rows[i-1]
-                if (prev_contour.step == Step.FLAT) and (contour.peak_frequency >= prev_contour.peak_frequency*(1+step_sensitivity/100)):
-                    contour.step = Step.UP
-                    freq_stepup += 1
-                elif (prev_contour.step == Step.FLAT) and (contour.peak_frequency <= prev_contour.peak_frequency*(1-step_sensitivity/100)):
-                    contour.step = Step.DOWN
-                    freq_stepdown += 1
-                else:
-                    contour.step = Step.FLAT
-
-            # Calculate the Sweep for each row in the contour (except for the first and last).
-            # Sweep is calculated by looking at the slope of the previous and next rows. If either
-            # slopes are positive or negative, the contour is marked as UP or DOWN respectively.
-            # 
-            # If both slopes are equal, the sweep is marked as FLAT. As this calculation loops
-            # through through all rows, the first and last must be left as None (i.e. not given
-            # a sweep) as they are the start and end of the contour.
-            if i > 0 and i < num_points - 1:
-                
-                prev_contour = self.contour_rows[i-1]
-                next_contour = self.contour_rows[i+1]
-
-                # This catches UP-UP, FLAT-UP, UP-FLAT, and FLAT-FLAT (the latter is overridden in the final if statement below)
-                if (prev_contour.peak_frequency <= contour.peak_frequency) and (contour.peak_frequency <= next_contour.peak_frequency):
-                    sweep_up_count += 1
-                    last_sweep = Sweep.UP
-                
-                # This catches DOWN-DOWN, FLAT-DOWN, DOWN-FLAT, and FLAT-FLAT (the latter is overridden in the if statement below)
-                if (prev_contour.peak_frequency >= contour.peak_frequency) and (contour.peak_frequency >= next_contour.peak_frequency):
-                    sweep_down_count += 1
-                    last_sweep = Sweep.DOWN
-                
-                # This catches and overrides FLAT-FLAT
-                if (prev_contour.peak_frequency == contour.peak_frequency) and (contour.peak_frequency == next_contour.peak_frequency):
-                    sweep_flat_count += 1
-                    last_sweep = Sweep.FLAT  
-
-                contour.sweep = last_sweep
-            # The following if statement is to maintain a the legacy categorisation algorithms
-            # historically using the Java code. The Java code has an error where the last row
-            # is by default considered a DOWN sweep (even if this is not the case). This has 
-            # knock-on effects to other parameters in the Contour Statistics.
-            if i == num_points - 1:
-                contour.sweep = Sweep.DOWN
-            # Calculate the sweep comparison characteristics. This involves comparing
-            # the current sweep of a row to the previous row's sweep, and determining
-            # whether the characteristic resembles UP-DOWN, DOWN-UP, DOWN-FLAT, FLAT-DOWN,
-            # FLAT-UP, or UP-FLAT. This calculation merely increments counters for each
-            # of the aforementioned.
-            if i > 1 and i < num_points:
-                curr_sweep = contour.sweep
-                prev_sweep = self.contour_rows[i-1].sweep
-
-                if (prev_sweep == Sweep.UP and curr_sweep == Sweep.DOWN):
-                    num_sweeps_up_down += 1
-                elif (prev_sweep == Sweep.DOWN and curr_sweep == Sweep.UP):
-                    num_sweeps_down_up += 1
-                elif (prev_sweep == Sweep.DOWN and curr_sweep == Sweep.FLAT):
-                    num_sweeps_down_flat += 1
-                elif (prev_sweep == Sweep.FLAT and curr_sweep == Sweep.DOWN):
-                    num_sweeps_flat_down += 1
-                elif (prev_sweep == Sweep.FLAT and curr_sweep == Sweep.UP):
-                    num_sweeps_flat_up += 1
-                elif prev_sweep == Sweep.UP and curr_sweep == Sweep.FLAT:
-                    num_sweeps_up_flat += 1
-            
-            # Calculate the inflection characteristics. This involves comparing
-            # the current sweep of a row to the previous row's sweep, and determining
-            # whether the characteristic breaks an upward or a downward trend. This
-            # trend is stored in the direction variable, and only changes in the case
-            # of an UP-DOWN or DOWN-UP trend. The calculation is only started at i=2
-            # as the first sweep variable is meant simply to set the direction (at i=1).
-            if i == 1:
-                direction = self.contour_rows[1].sweep
-            elif i > 1:
-                # NOTE: the following line exists due to a bug in the legacy Java code, meaning an inflection is calculated
-                # in the final row of the contour when the direction is UP. This is because the Java code considered the
-                # final element, which was not actually calculated due to the nature of the sweep calculation, to have a
-                # downward Sweep The logic in this program is correct, however the bug has been manufactured to maintain
-                # legacy categorisation algorithms.
-                if i == num_points-1: curr_sweep = Sweep.DOWN
-                if (curr_sweep == Sweep.UP and direction == Sweep.DOWN) or (curr_sweep == Sweep.DOWN and direction == Sweep.UP):
-                    direction = curr_sweep
-                    num_inflections += 1
-                    inflection_time_array.append(contour.time_milliseconds)
-
-                    # Store the difference of the newly calculated inflection time with that of the previous inflection time
-                    # if it exists in a new array. 
-                    if num_inflections > 1:
-                        inflection_delta_array.append((inflection_time_array[-1] - inflection_time_array[-2])/1000)
-                elif (direction == Sweep.FLAT):
-                    direction = curr_sweep
-
-
-            i += 1
-
-        selection.num_inflections = num_inflections
-
-        # Calculations based on the list of inflection delta values
-        if num_inflections > 1:
-            inflection_delta_array.sort()
-            # Max and min are first and last of sorted list
-            selection.inflection_maxdelta = inflection_delta_array[-1]
-            selection.inflection_mindelta = inflection_delta_array[0]
-            if selection.inflection_mindelta != 0:
-                selection.inflection_maxmindelta = selection.inflection_maxdelta / selection.inflection_mindelta
-            selection.inflection_meandelta = sum(inflection_delta_array)/len(inflection_delta_array)
-            if len(inflection_delta_array) > 1:
-                selection.inflection_standarddeviationdelta = pd.Series(inflection_delta_array).std()
-            else:
-                selection.inflection_standarddeviationdelta = 0
-            selection.inflection_meandelta = sum(inflection_delta_array)/len(inflection_delta_array)
-            selection.inflection_mediandelta = pd.Series(inflection_delta_array).median()
-            selection.inflection_duration = num_inflections/selection.duration
-        else:
-            # Default values
-            selection.inflection_maxdelta = 0
-            selection.inflection_mindelta = 0
-            selection.inflection_maxmindelta = 0
-            selection.inflection_meandelta = 0
-            selection.inflection_standarddeviationdelta = 0
-            selection.inflection_mediandelta = 0
-            selection.inflection_duration = 0
-        
-        # determine sweep up, down, and flat percentages
-        sweep_count = sweep_up_count + sweep_down_count + sweep_flat_count
-        selection.freq_sweepuppercent = (sweep_up_count / sweep_count) * 100
-        selection.freq_sweepdownpercent = (sweep_down_count / sweep_count) * 100
-        selection.freq_sweepflatpercent = (sweep_flat_count / sweep_count) * 100
-        
-        # assign the two-unit sweep count values from above
-        selection.num_sweepsdownflat = num_sweeps_down_flat
-        selection.num_sweepsdownup = num_sweeps_down_up
-        selection.num_sweepsflatdown = num_sweeps_flat_down
-        selection.num_sweepsflatup = num_sweeps_flat_up
-        selection.num_sweepsupdown = num_sweeps_up_down
-        selection.num_sweepsupflat = num_sweeps_up_flat
-        
-        # Slope summary calculations
-        selection.freq_sloperatio = 0
-        selection.freq_slopemean = 0
-        selection.freq_negslopemean = 0
-        selection.freq_posslopemean = 0
-        selection.freq_negslopemean = 0
-        selection.freq_absslopemean = 0
-        if slope_pos_counter > 0:
-            selection.freq_posslopemean = (slope_pos_sum / slope_pos_counter)*1000
-        if slope_neg_counter > 0:
-            selection.freq_negslopemean = (slope_neg_sum / slope_neg_counter)*1000
-            selection.freq_sloperatio = selection.freq_posslopemean / selection.freq_negslopemean
-        if num_points > 0:
-            selection.freq_slopemean = (slope_sum / (num_points-1))*1000
-            selection.freq_absslopemean = (slope_abs_sum / (num_points-1))*1000
-        
-        # calculate beginning slope as an average of the first three non-zero slopes,
-        # skipping the first row as the slope will always be zero
-        beg_slope_avg = (self.contour_rows[1].slope + self.contour_rows[2].slope + self.contour_rows[3].slope)/3
-        if beg_slope_avg > 0:
-            selection.freq_begsweep = Sweep.UP.value
-            selection.freq_begup = True
-            selection.freq_begdown = False
-        elif beg_slope_avg < 0:
-            selection.freq_begsweep = Sweep.DOWN.value
-            selection.freq_begup = False
-            selection.freq_begdown = True
-        else:
-            selection.freq_begsweep = Sweep.FLAT.value
-            selection.freq_begup = False
-            selection.freq_begdown = False
-        
-        # NOTE: the following calculation for the end slope average has been replaced by the INCORRECT one below to 
-        # maintain the legacy algorithm. In the original Java code, the end sweep was calculated using the second, 
-        # third, and fourth last slopes, rather than the last, second, and third last.
-        # end_slope_avg = (self.contour_rows[-1].slope + self.contour_rows[-2].slope + self.contour_rows[-3].slope)/3
-        end_slope_avg = (self.contour_rows[-4].slope + self.contour_rows[-3].slope + self.contour_rows[-2].slope)/3
-        if end_slope_avg > 0:
-            selection.freq_endsweep = Sweep.UP.value
-            selection.freq_endup = True
-            selection.freq_enddown = False
-        elif end_slope_avg < 0:
-            selection.freq_endsweep = Sweep.DOWN.value
-            selection.freq_endup = False
-            selection.freq_enddown = True
+def load_contour_file(path: str, extension: str) -> ContourFileHandler:
+    """Read a contour file into a `ContourFileHandler`. CSV files are parsed directly
+    into NumPy arrays (see `ContourFileHandler.insert_csv()`) and XLSX files are read
+    with pandas. Raises `exception_handler.WarningException` if the file is in the wrong
+    format or is invalid."""
+    handler = ContourFileHandler()
+    if extension.lower() == "csv":
+        handler.insert_csv(path)
+    elif extension.lower() == "xlsx":
+        handler.insert_dataframe(pd.read_excel(path))
+    else:
+        raise exception_handler.WarningException(f"Unable to parse contour file as it is in the wrong format. Require CSV or XLSX")
+    if len(handler.contour_data) == 0:
+        raise exception_handler.WarningException("Contour file does not contain any rows.")
+    return handler
+
+# MAT-file data types and array classes used by `serialise_ctr()`
+_MI_INT8, _MI_INT32, _MI_UINT32, _MI_DOUBLE, _MI_MATRIX, _MI_UTF8 = 1, 5, 6, 9, 14, 16
+_MX_CHAR_CLASS, _MX_DOUBLE_CLASS = 4, 6
+
+def _mat_element(data_type: int, data: bytes) -> bytes:
+    """Pack `data` into a MAT-file data element, using the small data element format
+    where the data fits and padding to a multiple of eight bytes."""
+    if 0 < len(data) <= 4:
+        return struct.pack("<HH", data_type, len(data)) + data.ljust(4, b"\0")
+    return struct.pack("<II", data_type, len(data)) + data + bytes(-len(data) % 8)
+
+def serialise_ctr(mat_data: dict) -> bytes:
+    """
+    Serialise the output of `ContourFileHandler.get_ctr_data()` into the binary
+    .ctr format (a level 5 MAT-file). The output is the same as that of
+    `scipy.io.savemat()` but is written directly from the arrays.
+
+    Args:
+        mat_data (dict): The variable names as the keys and the values as the values.
+            Values may be floats, strings or one-dimensional float arrays (which are
+            stored as row vectors).
+
+    Returns:
+        bytes: The binary .ctr file.
+    """
+    header = f"MATLAB 5.0 MAT-file Platform: {os.name}, Created on: {time.asctime()}".encode()
+    parts = [header.ljust(116, b"\0"), bytes(8), struct.pack("<H", 0x0100), b"IM"]
+    for name, value in mat_data.items():
+        if isinstance(value, str):
+            data = value.encode("utf-8")
+            array_class, data_type, dims = _MX_CHAR_CLASS, _MI_UTF8, (1, len(value))
         else:
-            selection.freq_endsweep = Sweep.FLAT.value
-            selection.freq_endup = False
-            selection.freq_enddown = False
-        
+            data = np.ascontiguousarray(value, dtype="<f8")
+            if data.ndim > 1: raise TypeError(f"Unable to serialise '{name}' as it has more than one dimension.")
+            array_class, data_type, dims = _MX_DOUBLE_CLASS, _MI_DOUBLE, (1, data.size)
+            data = data.tobytes()
+        element = b"".join([
+            _mat_element(_MI_UINT32, struct.pack("<II", array_class, 0)),
+            _mat_element(_MI_INT32, struct.pack("<ii", *dims)),
+            _mat_element(_MI_INT8, name.encode("ascii")),
+            _mat_element(data_type, data),
+        ])
+        parts.append(struct.pack("<II", _MI_MATRIX, len(element)))
+        parts.append(element)
+    return b"".join(parts)
 
-        selection.dc_mean = pd.Series([row.duty_cycle for row in self.contour_rows]).mean()
-        selection.dc_standarddeviation = pd.Series([row.duty_cycle for row in self.contour_rows]).std()
-
-        dc_quarter_sum = [0.0, 0.0, 0.0, 0.0]
-        dc_quarter_count = [0, 0, 0, 0]
-
-        # maximum frequency is the maximum peak_frequency in the contour_rows
-        selection.freq_max = max(self.contour_rows, key=lambda x: x.peak_frequency).peak_frequency
-        # minimum frequency is the minimum peak_frequency in the contour_rows
-        selection.freq_min = min(self.contour_rows, key=lambda x: x.peak_frequency).peak_frequency
-        # frequency range is the difference between the maximum and minimum frequencies
-        selection.freq_range = selection.freq_max - selection.freq_min
-        # median frequency is the median peak_frequency in the contour_rows
-        selection.freq_median = pd.Series([row.peak_frequency for row in self.contour_rows]).median()
-        # frequency center is the average of the maximum and minimum frequencies
-        selection.freq_center = (selection.freq_max + selection.freq_min) / 2
-        # frequency relative bandwidth is the frequency range divided by the frequency center
-        selection.freq_relbw = selection.freq_range / selection.freq_center
-        # maximum-minimum ratio is the maximum frequency divided by the minimum frequency
-        selection.freq_maxminratio = selection.freq_max / selection.freq_min
-        # beginning frequency is the first peak_frequency in the contour_rows
-        selection.freq_begin = self.contour_rows[0].peak_frequency
-        # ending frequency is the last peak_frequency in the contour_rows
-        selection.freq_end = self.contour_rows[-1].peak_frequency
-        # beginning-end ratio is the beginning frequency divided by the ending frequency
-        selection.freq_begendratio = selection.freq_begin / selection.freq_end
-        # frequency mean is the average of all peak_frequencies in the contour_rows
-        selection.freq_mean = pd.Series([row.peak_frequency for row in self.contour_rows]).mean()
-        # frequency standard deviation is the standard deviation of all peak_frequencies in the contour_rows
-        selection.freq_standarddeviation = pd.Series([row.peak_frequency for row in self.contour_rows]).std()
-        # frequency quarter 1 is the peak_frequency at one quarter of the duration
-        selection.freq_quarter1 = self.contour_rows[int(round_to_nearest_whole(num_points/4))-1].peak_frequency
-        # frequency quarter 2 is the peak_frequency at two quarters of the duration
-        selection.freq_quarter2 = self.contour_rows[int(round_to_nearest_whole(num_points/2))-1].peak_frequency
-        # frequency quarter 3 is the peak_frequency at three quarters of the duration
-        selection.freq_quarter3 = self.contour_rows[int(round_to_nearest_whole(3*(num_points/4)))-1].peak_frequency
-        # frequency spread is the difference between the third and first quartiles
-        selection.freq_spread = pd.Series([row.peak_frequency for row in self.contour_rows]).quantile(0.75) - pd.Series([row.peak_frequency for row in self.contour_rows]).quantile(0.25)
-        
-        # step calculations (freq_stepup and freq_stepdown are incremented during the loop above)
-        selection.freq_numsteps = freq_stepup + freq_stepdown
-        selection.freq_stepup = freq_stepup
-        selection.freq_stepdown = freq_stepdown
-        selection.step_duration = selection.freq_numsteps / selection.duration       
+class ContourFileJob(typing.NamedTuple):
+    """A contour file to be recalculated by `recalculate_contour_files()`."""
+    id: str
+    name: str
+    path: str
+    extension: str
+
+def _recalculate_contour_files(jobs: list) -> tuple:
+    """Parse each contour file in `jobs`, calculate the contour statistics of all of
+    them (see `calculate_contour_statistics_batch()`) and their CTR data. This is the
+    unit of work of each process in `recalculate_contour_files()`."""
+    contours, ctr_data = [], []
+    for job in jobs:
+        try:
+            handler = load_contour_file(job.path, job.extension)
+        except FileNotFoundError:
+            raise exception_handler.WarningException(f"Contour file for {job.name} no longer exists.")
+        except exception_handler.WarningException as e:
+            raise exception_handler.WarningException(f"Contour file for {job.name} unable to be parsed: {e}")
+        contours.append(handler.contour_data)
+        ctr_data.append(handler.get_ctr_data())
+    offsets, contour_data = concatenate_contours(contours)
+    statistics = calculate_contour_statistics_batch(
+        ids=[job.id for job in jobs],
+        offsets=offsets,
+        time_milliseconds=contour_data.time_milliseconds,
+        peak_frequency=contour_data.peak_frequency,
+        duty_cycle=contour_data.duty_cycle
+    )
+    return statistics, ctr_data
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
 
-        # Calculate the Coefficient of Frequency Modulation (COFM)
-        freq_cofm = 0.0
-        for i in range(6, num_points, 3):
-            freq_cofm += abs(self.contour_rows[i].peak_frequency - self.contour_rows[i - 3].peak_frequency)
-        selection.freq_cofm = freq_cofm / 10000
+def _get_executor(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """The pool of `workers` processes used by `recalculate_contour_files()`. The pool is
+    created on first use and reused by later calls, so that each recalculation does not
+    start new processes (which each import NumPy, pandas and the application). It is only
+    replaced if a different number of workers is requested (or after `_discard_executor()`)."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None and _executor_workers != workers:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = workers
+        return _executor
 
+def _discard_executor(executor: concurrent.futures.ProcessPoolExecutor) -> None:
+    """Stop using `executor` (for example once one of its processes has died), so that the
+    next call to `_get_executor()` creates a new pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor: _executor = None
+    executor.shutdown(wait=False)
 
-        return self.contour_rows
+def recalculate_contour_files(jobs: list, workers: int = 1) -> tuple:
+    """
+    Recalculate the contour statistics and CTR data of many contour files. If `workers`
+    is greater than one the jobs are split into contiguous chunks which are processed
+    in a pool of `workers` processes (see `_get_executor()`). The results are combined in
+    the order of `jobs`, so they are identical regardless of the number of workers.
+
+    Args:
+        jobs (list[ContourFileJob]): The contour files to recalculate.
+        workers (int, optional): The number of processes to use. Defaults to 1 (no
+            additional processes).
+
+    Returns:
+        tuple[pd.DataFrame, list[dict]]: The contour statistics (see
+        `calculate_contour_statistics_batch()`) and the CTR data (see
+        `ContourFileHandler.get_ctr_data()`) of each job.
+    """
+    if min(workers, len(jobs)) <= 1:
+        return _recalculate_contour_files(jobs)
+    # Use several chunks per worker so that a few long contours do not hold up the pool
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(len(jobs)), min(workers, len(jobs)) * 4) if len(chunk) > 0]
+    executor = _get_executor(workers)
+    try:
+        results = list(executor.map(_recalculate_contour_files, [[jobs[i] for i in chunk] for chunk in chunks]))
+    except concurrent.futures.BrokenExecutor:
+        _discard_executor(executor)
+        raise
+    statistics = pd.concat([chunk_statistics for chunk_statistics, _ in results])
+    ctr_data = [mat_data for _, chunk_ctr_data in results for mat_data in chunk_ctr_data]
+    return statistics, ctr_data
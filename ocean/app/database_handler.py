@@ -44,6 +44,8 @@ from .logger import logger
 DATA_DIR = 'data'
 TEMP_DIR = 'temp_space'
 TRASH_DIR = 'trash'
+CACHE_DIR = 'cache'
+BLOB_DIR = 'blobs'
 FILE_SPACE_PATH = None
 
 def get_file_space() -> str:
@@ -103,6 +105,32 @@ def get_temp_space() -> str:
 
 get_tempdir = get_temp_space # LEGACY TODO: REMOVE
 
+def get_cache_space() -> str:
+    """The cache space is the location in which all derived data (which can be regenerated
+    from the files in the data space at any time) is stored. The cache space is a
+    subdirectory of the file space. This function returns the file space path joined with
+    the cache space path to create the path to the cache space.
+
+    :return: The path to the cache space
+    """
+
+    if not os.path.exists(os.path.join(get_file_space(), CACHE_DIR)):
+        os.makedirs(os.path.join(get_file_space(), CACHE_DIR))
+    return os.path.join(get_file_space(), CACHE_DIR)
+
+def get_blob_space() -> str:
+    """The blob space is the location in which the content of files is stored once per hash
+    when files are deduplicated (see `blob_store`). Files in the data and deleted spaces are
+    hard links to the blobs. The blob space is a subdirectory of the file space. This function
+    returns the file space path joined with the blob space path to create the path to the blob space.
+
+    :return: The path to the blob space
+    """
+
+    if not os.path.exists(os.path.join(get_file_space(), BLOB_DIR)):
+        os.makedirs(os.path.join(get_file_space(), BLOB_DIR))
+    return os.path.join(get_file_space(), BLOB_DIR)
+
 def get_root_directory(deleted: bool, temp: bool) -> str:
     """
     Returns the root directory path based on the status of the file. A file is stored in either
@@ -17,12 +17,16 @@
 
 # Standard library imports
 import os, datetime, uuid
+import time
+import typing
 
 # Third-party imports
 from flask import url_for
 from flask_login import current_user
+from sqlalchemy import func, literal, select, union_all
 
 # Local application imports
+from . import blob_store
 from . import database_handler
 from . import models
 from . import exception_handler
@@ -170,33 +174,101 @@ def check_file_orphaned(session, path: str, deleted: bool) -> None:
     
     return not models.File.has_record(session, path, deleted=deleted)
 
-def get_orphaned_files(deleted: bool, temp: bool) -> list:
-    """Search through all files in the database and check whether all links to the filespace are valid.
-    An invalid link is one where a path is defined in the database, but it does not point to a file 
-    in the filespace. The function will only check all files in the database pertaining to one of the
-    following categories:
-    - If deleted and temp are false, this function will check if the file exists in the data filespace.
-    - If deleted and temp are false, this function will check if the file exists in the deleted filespace.
-    - If temp is true, this function will check if the file exists in the temporary filespace.
+class Reconciliation(typing.NamedTuple):
+    """The result of `reconcile()`."""
+    # Paths (relative to the root directory) of files which are not referenced by any File object
+    orphans: typing.List[str]
+    # Paths (relative to the root directory) of File objects whose file does not exist, by ID
+    broken_links: typing.Dict[str, str]
+    # The number of files found and File objects compared
+    files: int
+    records: int
+    # Time spent querying the File objects and scanning the directory
+    query_seconds: float
+    scan_seconds: float
+
+def _normalise_path(path: str) -> str:
+    """Normalise `path` so that paths compare as the database compares them (the File
+    columns use a case-insensitive collation)."""
+    return os.path.normcase(os.path.normpath(path)).casefold() if path else path
+
+def scan_files(root_path: str) -> typing.Iterator[str]:
+    """Yield the path (relative to `root_path`) of every file below `root_path`, using
+    `os.scandir` so that no file other than directories is stat'ed."""
+    directories = [""]
+    while directories:
+        directory = directories.pop()
+        with os.scandir(os.path.join(root_path, directory)) as entries:
+            for entry in entries:
+                path = os.path.join(directory, entry.name)
+                if entry.is_dir(follow_symlinks=False): directories.append(path)
+                elif entry.is_file(): yield path
+
+def reconcile_records(records: typing.Iterable[typing.Tuple[str, str, str, str]], root_path: str) -> Reconciliation:
+    """Compare the files below `root_path` with `records` (tuples of the ID, directory,
+    filename and extension of File objects) in one pass over each, returning the files
+    without a record (orphans) and the records without a file (broken links). Paths are
+    compared case-insensitively, as the database compares them, and a record without an
+    extension expects a file without one."""
+    start = time.perf_counter()
+    # The ID and path of the records expecting each (normalised) path
+    expected = {}
+    for file_id, directory, filename, extension in records:
+        path = os.path.join(directory or "", f"{filename}.{extension}" if extension else filename)
+        expected.setdefault(_normalise_path(path), []).append((file_id, path))
+    query_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    orphans = []
+    found = set()
+    files = 0
+    for path in scan_files(root_path):
+        files += 1
+        normalised = _normalise_path(path)
+        if normalised in expected: found.add(normalised)
+        else: orphans.append(path)
+    scan_seconds = time.perf_counter() - start
+
+    broken_links = {file_id: path for normalised, references in expected.items() if normalised not in found for file_id, path in references}
+    return Reconciliation(orphans=sorted(orphans), broken_links=broken_links, files=files,
+                          records=sum(len(references) for references in expected.values()),
+                          query_seconds=query_seconds, scan_seconds=scan_seconds)
+
+def reconcile(session, deleted: bool, temp: bool = False, batch_size: int = 10000) -> Reconciliation:
+    """Reconcile the data (or deleted if `deleted`, or temporary if `temp`) filespace with
+    the File objects in the database (which are deleted if `deleted`). The File objects
+    are loaded in a single query streamed in batches of `batch_size`, rather than one
+    query per file, and the filespace is scanned once (see `reconcile_records()`).
 
     :param session: the SQLAlchemy session
+    :param deleted: whether to reconcile the deleted filespace and File objects
+    :param temp: whether to scan the temporary filespace instead
+    :param batch_size: the number of File objects fetched from the database at once
+    :return: the `Reconciliation`
+    """
+    records = session.query(models.File.id, models.File.directory, models.File.filename, models.File.extension)\
+        .filter(models.File.deleted == deleted).yield_per(batch_size)
+    reconciliation = reconcile_records(records, database_handler.get_root_directory(deleted, temp))
+    logger.info(f"Reconciled {reconciliation.files} files with {reconciliation.records} records (deleted={deleted}): "
+                f"{len(reconciliation.orphans)} orphaned, {len(reconciliation.broken_links)} broken links, "
+                f"{reconciliation.query_seconds:.2f} s querying, {reconciliation.scan_seconds:.2f} s scanning")
+    return reconciliation
+
+def get_orphaned_files(deleted: bool, temp: bool) -> list:
+    """Find all files in the filespace which are not referenced by any File object (see
+    `reconcile()`). The function will only check the files in one of the following categories:
+    - If deleted and temp are false, the files in the data filespace are checked against existing File objects.
+    - If deleted is true and temp is false, the files in the deleted filespace are checked against deleted File objects.
+    - If temp is true, the files in the temporary filespace are checked.
+
     :param deleted: whether to query deleted files
     :param temp: whether to query temporary files
-    :return: a list of dictionaries of orphaned files where the key is the models.File.id and the value is the models.File object
+    :return: a list of dictionaries of orphaned files, with their path and links to delete and download them
     """
-    # TODO: REMOVE ABSOLUTE PATHS FROM HERE
     with database_handler.get_session() as session:
-        orphaned_files = []
-        root_path = database_handler.get_root_directory(deleted, temp)
-        for root, dirs, files in os.walk(root_path):
-            for file in files:
-                file_path = os.path.relpath(os.path.join(root, file), root_path)
-
-                if check_file_orphaned(session, file_path, deleted):
-                    id = ""
-                    orphaned_files.append({'id':id,'path': file_path, 'link': url_for('filespace.delete_orphan_file', file_path=file_path, deleted=deleted), 'download': url_for('filespace.download_orphan_file', file_path=file_path, deleted=deleted) , 'deleted': deleted})
-
-    return orphaned_files
+        reconciliation = reconcile(session, deleted, temp)
+    return [{'id': '', 'path': file_path, 'link': url_for('filespace.delete_orphan_file', file_path=file_path, deleted=deleted), 'download': url_for('filespace.download_orphan_file', file_path=file_path, deleted=deleted), 'deleted': deleted}
+            for file_path in reconciliation.orphans]
 
 def delete_orphan_file(path: str, deleted: bool, temp: bool):
     """Delete an orphaned file in the data, delted, or temp space of the file space. 
@@ -217,56 +289,142 @@ def delete_orphan_file(path: str, deleted: bool, temp: bool):
         else:
             raise exception_handler.WarningException("An unexpected error ocurred.")
 
-def query_file_class(session, deleted: bool) -> dict:
+# The references from which the parent of a file is found, in order of precedence
+PARENT_REFERENCES = (
+    ('recording', 'recording_file_id'),
+    ('selection', 'selection_file_id'),
+    ('selection', 'contour_file_id'),
+    ('selection', 'ctr_file_id'),
+    ('recording', 'selection_table_file_id'),
+)
+
+def _parent_query(file_ids: list):
+    """A single UNION query of the (file ID, precedence, parent type, parent ID) of every
+    reference (see `PARENT_REFERENCES`) to the files with the IDs `file_ids`."""
+    parent_models = {'recording': models.Recording, 'selection': models.Selection}
+    return union_all(*[
+        select(getattr(parent_models[parent_type], column).label('file_id'), literal(precedence).label('precedence'),
+               literal(parent_type).label('parent_type'), parent_models[parent_type].id.label('parent_id'))
+        .where(getattr(parent_models[parent_type], column).in_(file_ids))
+        for precedence, (parent_type, column) in enumerate(PARENT_REFERENCES)
+    ])
+
+def _choose_parents(rows) -> dict:
+    """The (parent type, parent ID) of each file from the `rows` of `_parent_query()`,
+    taking the reference of highest precedence where a file has several."""
+    parents = {}
+    for file_id, precedence, parent_type, parent_id in sorted(rows, key=lambda row: row[1], reverse=True):
+        parents[file_id] = (parent_type, parent_id)
+    return parents
+
+def _resolve_parents(session, file_ids: list) -> dict:
+    """The parent object (Recording or Selection) of each of the files with the IDs
+    `file_ids` which has one, found with one query for the references (see
+    `_parent_query()`) and one per parent type."""
+    if not file_ids: return {}
+    references = _choose_parents(session.execute(_parent_query(file_ids)).all())
+    parents = {}
+    for parent_type, parent_model in (('recording', models.Recording), ('selection', models.Selection)):
+        parent_ids = {parent_id for reference_type, parent_id in references.values() if reference_type == parent_type}
+        if parent_ids:
+            parents.update({(parent_type, parent.id): parent for parent in session.query(parent_model).filter(parent_model.id.in_(parent_ids))})
+    return {file_id: parents.get(reference) for file_id, reference in references.items()}
+
+def query_file_class(session, deleted: bool, batch_size: int = 500) -> dict:
     """Query all files in the database and check whether all links to the filespace are valid.
     
     An invalid link is one where a path is defined in the database, but it does not point to a file 
     in the filespace.
 
+    The invalid links are the broken links found by reconciling the filespace with the File
+    objects (see `reconcile()`), so the filespace is scanned once rather than each file being
+    checked. The missing files are then loaded in batches of `batch_size`, and the parents of
+    each batch are found together with at most three queries however many files are missing:
+    one UNION query of every reference to the files, then one load of the referencing
+    Recording and Selection objects each (see `_resolve_parents()`).
+
     :param session: the SQLAlchemy session
     :param deleted: whether to query deleted files (True) or not (False)
-    :return: a dictionary of invalid files where the key is the models.File.id and the value is the models.File object
+    :param batch_size: the number of missing files loaded at once
+    :return: a dictionary of invalid files where the key is the models.File.id and the value is a dictionary of the file, its parent, and links to view the parent or delete the file
     """
-
     invalid_links = {}
-    offset = 0
-    while True:
-        files = session.query(models.File).filter(models.File.deleted == deleted).offset(offset).limit(100).all()
-        offset += 100
-        if not files:
-            break
-        for file in files:
-            absolute_path = file._path_with_root
-            if not os.path.exists(absolute_path):
-                invalid_links[file.id] = file
-                parent = None
-                link = None
-                delete_link = None
-
-                # Check if the file is referenced by a Recording                
-                if session.query(models.Recording).filter(models.Recording.recording_file_id == file.id).first():
-                    parent = session.query(models.Recording).filter(models.Recording.recording_file_id == file.id).first()
-                    link = url_for('recording.recording_view', recording_id=parent.id)
-                # Check if the file is referenced by a Selection
-                elif session.query(models.Selection).filter(models.Selection.selection_file_id == file.id).first():
-                    parent = session.query(models.Selection).filter(models.Selection.selection_file_id == file.id).first()
-                    link = url_for('selection.selection_view', selection_id=parent.id)
-                elif session.query(models.Selection).filter(models.Selection.contour_file_id == file.id).first():
-                    parent = session.query(models.Selection).filter(models.Selection.contour_file_id == file.id).first()
-                    link = url_for('selection.selection_view', selection_id=parent.id)
-                elif session.query(models.Selection).filter(models.Selection.ctr_file_id == file.id).first():
-                    parent = session.query(models.Selection).filter(models.Selection.ctr_file_id == file.id).first()
-                    link = url_for('selection.selection_view', selection_id=parent.id)
-                elif session.query(models.Recording).filter(models.Recording.selection_table_file_id == file.id).first():
-                    parent = session.query(models.Recording).filter(models.Recording.selection_table_file_id == file.id).first()
-                    link = url_for('recording.recording_view', recording_id=parent.id)
-                else:
-                    delete_link = url_for('filespace.filespace_delete_file', file_id=file.id)
-
-                invalid_links[file.id] = {"file": file.to_dict() if file else None, "parent": parent.to_dict() if parent else None, "link": link, "delete": delete_link}
+    missing_ids = sorted(reconcile(session, deleted).broken_links)
+    for start in range(0, len(missing_ids), batch_size):
+        missing = session.query(models.File).filter(models.File.id.in_(missing_ids[start:start + batch_size])).order_by(models.File.id).all()
+        parents = _resolve_parents(session, [file.id for file in missing])
+        for file in missing:
+            parent = parents.get(file.id)
+            link = None
+            delete_link = None
+            if isinstance(parent, models.Recording):
+                link = url_for('recording.recording_view', recording_id=parent.id)
+            elif isinstance(parent, models.Selection):
+                link = url_for('selection.selection_view', selection_id=parent.id)
+            else:
+                delete_link = url_for('filespace.filespace_delete_file', file_id=file.id)
+
+            invalid_links[file.id] = {"file": file.to_dict() if file else None, "parent": parent.to_dict() if parent else None, "link": link, "delete": delete_link}
 
     return invalid_links
 
+def backfill_audio_metadata(batch_size: int = 500, overwrite: bool = False) -> tuple:
+    """Extract and store the audio header metadata (see `models.File.calculate_audio_metadata()`)
+    of all WAV files in the database which do not have it (or all of them if `overwrite`).
+    Files are processed in batches of `batch_size` (ordered by ID), committing each batch.
+    Files which cannot be read are logged and skipped.
+
+    :param batch_size: the number of files to process per transaction
+    :param overwrite: whether to recalculate the metadata of files which already have it
+    :return: a tuple of the number of files updated and the number of files which could not be read
+    """
+    updated = failed = 0
+    last_id = ""
+    while True:
+        with database_handler.get_session() as session:
+            query = session.query(models.File).filter(func.lower(models.File.extension) == "wav", models.File.id > last_id)
+            if not overwrite: query = query.filter(models.File.audio_sampling_rate == None)
+            files = query.order_by(models.File.id).limit(batch_size).all()
+            if not files: break
+            for file in files:
+                try:
+                    file.calculate_audio_metadata()
+                    updated += 1
+                except (exception_handler.WarningException, OSError) as e:
+                    logger.warning(f"Unable to extract audio metadata of file {file.id}: {e}")
+                    failed += 1
+            session.commit()
+            last_id = files[-1].id
+    return updated, failed
+
+def deduplicate_files(batch_size: int = 500) -> tuple:
+    """Deduplicate the files in the database which were inserted before deduplication was
+    enabled (see `blob_store`), then remove any blobs no longer referenced. Each file is
+    re-hashed first, and files whose content does not match their stored hash are logged
+    and skipped so that a corrupted file can never become (or replace another file with)
+    the blob of its stored hash. Files are processed in batches of `batch_size` (ordered by ID).
+
+    :param batch_size: the number of files to query at once
+    :return: a tuple of the number of files deduplicated and the number of bytes reclaimed
+    """
+    deduplicated = reclaimed = 0
+    last_id = ""
+    while True:
+        with database_handler.get_session() as session:
+            files = session.query(models.File).filter(models.File.hash != None, models.File.id > last_id).order_by(models.File.id).limit(batch_size).all()
+            if not files: break
+            for file in files:
+                path = file._path_with_root
+                if not os.path.exists(path) or blob_store.is_deduplicated(path, file.hash): continue
+                if file.calculate_hash() != file.hash:
+                    logger.warning(f"Not deduplicating file {file.id} as its content does not match its hash")
+                    continue
+                reclaimed += blob_store.deduplicate(path, file.hash)
+                deduplicated += 1
+            last_id = files[-1].id
+    blob_store.collect_garbage()
+    return deduplicated, reclaimed
+
 def check_file_exists_in_filespace(file: models.File) -> bool:
     """Checks whether a file object exists in the filespace.
 
@@ -0,0 +1,325 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Verification of the integrity of the file space: every `File` is re-hashed and compared
+with the hash stored in the database (see `run()`).
+
+Files are read in chunks by a bounded pool of threads, optionally limited to a total
+number of bytes per second so that a verification can run while the system is in use.
+Files without a stored hash have it stored (written once per batch). Files are
+verified in batches ordered by ID, and the report (see `get_report()`) is saved in the
+cache space of the file space (see `database_handler.get_cache_space()`) after every
+batch, so an interrupted verification resumes from the last complete batch.
+
+A verification is started in the background from the filespace page (see `start()`),
+or run from the command line with `flask verify-filespace`. Only one verification runs
+at a time across all processes sharing the file space, as each holds an exclusive lock
+on a file next to the report (see `VerificationLock`).
+"""
+
+# Standard library imports
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Third-party imports
+from sqlalchemy import bindparam, update
+
+# Local application imports
+from . import database_handler
+from . import exception_handler
+from . import models
+from .logger import logger
+
+CACHE_NAME = 'integrity'
+REPORT_FILE = 'report.json'
+LOCK_FILE = 'lock'
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_SIZE = 200
+# The largest number of mismatches kept in the report (all are counted)
+MAX_REPORTED_MISMATCHES = 1000
+
+
+class FileResult(typing.NamedTuple):
+    """The outcome of verifying a file: its `actual` hash is `None` if it does not exist
+    in the file space."""
+    file_id: str
+    path: str
+    expected: typing.Optional[bytes]
+    actual: typing.Optional[bytes]
+    size: int
+
+    @property
+    def missing(self) -> bool:
+        return self.actual is None
+
+    @property
+    def mismatch(self) -> bool:
+        return self.expected is not None and self.actual is not None and self.expected != self.actual
+
+
+class RateLimiter:
+    """Limits the total rate at which the threads sharing it read to `bytes_per_second`
+    (unlimited if 0 or `None`)."""
+
+    def __init__(self, bytes_per_second: int = None):
+        self._bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def consume(self, size: int) -> None:
+        """Wait until `size` more bytes may be read."""
+        if not self._bytes_per_second: return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + size / self._bytes_per_second
+        if start > now: time.sleep(start - now)
+
+
+def hash_file(path: str, limiter: RateLimiter = None) -> typing.Tuple[typing.Optional[bytes], int]:
+    """The SHA-256 hash and size of the file at `path`, read in chunks of `CHUNK_SIZE`
+    (at the rate allowed by `limiter`), or `(None, 0)` if it does not exist."""
+    hash_value = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                if limiter: limiter.consume(len(chunk))
+                hash_value.update(chunk)
+                size += len(chunk)
+    except FileNotFoundError:
+        return None, 0
+    return hash_value.digest(), size
+
+def verify_files(files: typing.Iterable[typing.Tuple[str, str, typing.Optional[bytes]]], executor: concurrent.futures.Executor, limiter: RateLimiter = None) -> typing.List[FileResult]:
+    """Hash the files given as tuples of `(file_id, path, expected_hash)` using `executor`,
+    returning their results in the same order."""
+    files = list(files)
+    hashes = executor.map(lambda file: hash_file(file[1], limiter), files)
+    return [FileResult(file_id, path, expected, actual, size) for (file_id, path, expected), (actual, size) in zip(files, hashes)]
+
+
+class VerificationLock:
+    """An exclusive lock on the `LOCK_FILE` next to the report, held by whichever
+    verification is running. The lock is taken with `flock()` (or `msvcrt.locking()` on
+    Windows), so it is released by the operating system if its process dies."""
+
+    def __init__(self):
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock without waiting. Returns `False` if it is already held."""
+        path = os.path.join(database_handler.get_cache_space(), CACHE_NAME, LOCK_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, 'a+')
+        try:
+            if fcntl: fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self) -> None:
+        if self._file is None: return
+        if fcntl: fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+def _get_report_path() -> str:
+    return os.path.join(database_handler.get_cache_space(), CACHE_NAME, REPORT_FILE)
+
+def new_report(total: int = 0) -> dict:
+    return {
+        'started': _now(),
+        'updated': None,
+        'finished': None,
+        # The ID of the last file of the last complete batch, from which the verification resumes
+        'last_id': '',
+        'total': total,
+        'checked': 0,
+        'bytes': 0,
+        'missing': 0,
+        'backfilled': 0,
+        'mismatched': 0,
+        'mismatches': [],
+    }
+
+def get_report() -> typing.Optional[dict]:
+    """The report of the current (or last) verification, or `None` if there has been none.
+    A report whose `finished` is `None` is of an unfinished verification."""
+    try:
+        with open(_get_report_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to read the filespace integrity report: {e}")
+        return None
+
+def save_report(report: dict) -> None:
+    report['updated'] = _now()
+    directory = os.path.dirname(_get_report_path())
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+        json.dump(report, f)
+    os.replace(f.name, _get_report_path())
+
+def record_results(report: dict, results: typing.Iterable[FileResult]) -> None:
+    """Add the `results` of a batch to `report`."""
+    for result in results:
+        report['checked'] += 1
+        report['bytes'] += result.size
+        if result.missing:
+            report['missing'] += 1
+        elif result.expected is None:
+            report['backfilled'] += 1
+        elif result.mismatch:
+            report['mismatched'] += 1
+            logger.warning(f"Hash mismatch of file {result.file_id} ({result.path})")
+            if len(report['mismatches']) < MAX_REPORTED_MISMATCHES:
+                report['mismatches'].append({'id': result.file_id, 'path': result.path, 'expected': result.expected.hex(), 'actual': result.actual.hex(), 'detected': _now()})
+
+def store_hashes(results: typing.List[FileResult]) -> None:
+    """Store the hashes of the files of `results` in one short transaction. A hash is only
+    stored if the file still has none, so one stored since the file was read is kept."""
+    if not results: return
+    table = models.File.__table__
+    statement = update(table).where(table.c.id == bindparam('file_id'), table.c.hash.is_(None)).values(hash=bindparam('actual'))
+    with database_handler.get_session() as session:
+        session.execute(statement, [{'file_id': result.file_id, 'actual': result.actual} for result in results])
+        session.commit()
+
+
+def run(workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE, max_bytes_per_second: int = None, restart: bool = False, stop_event: threading.Event = None) -> dict:
+    """
+    Verify every file in the database (see the module documentation), resuming the last
+    verification unless it finished or `restart` is given. Stops after the current batch
+    once `stop_event` is set, leaving the report to be resumed. Raises `WarningException`
+    if a verification is already running (in any process).
+
+    :param workers: the number of threads hashing files
+    :param batch_size: the number of files verified per batch
+    :param max_bytes_per_second: the total read rate of all threads (unlimited if `None` or 0)
+    :param restart: whether to start a new verification even if the last one did not finish
+    :param stop_event: an event which stops the verification when set
+    :return: the report
+    """
+    lock = VerificationLock()
+    if not lock.acquire(): raise exception_handler.WarningException("A filespace verification is already running.")
+    try:
+        return _run(workers, batch_size, max_bytes_per_second, restart, stop_event)
+    finally:
+        lock.release()
+
+def _run(workers: int, batch_size: int, max_bytes_per_second: typing.Optional[int], restart: bool, stop_event: typing.Optional[threading.Event]) -> dict:
+    report = None if restart else get_report()
+    if report is None or report['finished']:
+        with database_handler.get_session() as session:
+            report = new_report(session.query(models.File).count())
+        logger.info("Starting filespace integrity verification")
+    else:
+        logger.info(f"Resuming filespace integrity verification after file {report['last_id']}")
+    limiter = RateLimiter(max_bytes_per_second)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='ocean-integrity') as executor:
+        while not (stop_event and stop_event.is_set()):
+            # The session is closed before hashing (which can take minutes at a limited
+            # rate), so that no connection or transaction is held while the files are read
+            with database_handler.get_session() as session:
+                files = [(file.id, file._path_with_root, file.hash) for file in
+                         session.query(models.File).filter(models.File.id > report['last_id']).order_by(models.File.id).limit(batch_size)]
+            if not files:
+                report['finished'] = _now()
+                break
+            results = verify_files(files, executor, limiter)
+            store_hashes([result for result in results if result.expected is None and result.actual is not None])
+            record_results(report, results)
+            report['last_id'] = files[-1][0]
+            save_report(report)
+    save_report(report)
+    logger.info(f"Filespace integrity verification {'finished' if report['finished'] else 'stopped'}: {report['checked']} checked, {report['mismatched']} mismatched, {report['missing']} missing, {report['backfilled']} hashes stored")
+    return report
+
+
+_thread = None
+_stop_event = threading.Event()
+_thread_lock = threading.Lock()
+
+def is_running() -> bool:
+    """Whether a verification is running in any process sharing the file space."""
+    if _thread is not None and _thread.is_alive(): return True
+    lock = VerificationLock()
+    if not lock.acquire(): return True
+    lock.release()
+    return False
+
+def _run_in_app(app, restart: bool, lock: VerificationLock) -> None:
+    with app.app_context():
+        try:
+            _run(app.config.get('INTEGRITY_WORKERS', DEFAULT_WORKERS), DEFAULT_BATCH_SIZE, app.config.get('INTEGRITY_MAX_BYTES_PER_SECOND', 0), restart, _stop_event)
+        except Exception:
+            logger.exception("Filespace integrity verification failed")
+        finally:
+            lock.release()
+
+def start(restart: bool = False) -> bool:
+    """Run (or resume) a verification in a background thread with the configured
+    `INTEGRITY_WORKERS` and `INTEGRITY_MAX_BYTES_PER_SECOND`. Must be called within an
+    application context. Returns `False` if a verification is already running (in any
+    process)."""
+    global _thread
+    from flask import current_app
+    with _thread_lock:
+        # The lock is taken here, rather than by the thread, so that it is known to be held
+        # before returning
+        lock = VerificationLock()
+        if not lock.acquire(): return False
+        _stop_event.clear()
+        _thread = threading.Thread(target=_run_in_app, args=(current_app._get_current_object(), restart, lock), name='ocean-integrity', daemon=True)
+        _thread.start()
+    return True
+
+def stop() -> bool:
+    """Stop the verification running in this process after its current batch. Returns
+    `False` if none is running in this process."""
+    if _thread is None or not _thread.is_alive(): return False
+    _stop_event.set()
+    return True
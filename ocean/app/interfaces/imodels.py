@@ -14,7 +14,7 @@ from .. import utils
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
 import typing
 import warnings
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, PrimaryKeyConstraint, LargeBinary, Double
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, ForeignKey, PrimaryKeyConstraint, LargeBinary, Double, BigInteger
 from .. import exception_handler
 from .. import logger
 import secrets
@@ -132,6 +132,14 @@ class IFile(AbstractModelBase, Serialisable, TableOperations):
     hash = Column(LargeBinary)
     to_be_deleted = Column(Boolean, nullable=False, default=False)
 
+    # Header metadata of audio (WAV) files, extracted when the file is inserted
+    audio_sampling_rate = Column(Integer)
+    audio_channels = Column(Integer)
+    # Bytes per sample of one channel
+    audio_sample_width = Column(Integer)
+    audio_frames = Column(BigInteger)
+    audio_duration = Column(Double)
+
     updated_by_id = Column(String(36), ForeignKey('user.id'))
     updated_by = database_handler.db.relationship("User", foreign_keys=[updated_by_id])
 
@@ -168,6 +176,11 @@ class IFile(AbstractModelBase, Serialisable, TableOperations):
             "deleted": self.deleted,
             "original_filename": self.original_filename,
             "hash": self.hash,
+            "audio_sampling_rate": self.audio_sampling_rate,
+            "audio_channels": self.audio_channels,
+            "audio_sample_width": self.audio_sample_width,
+            "audio_frames": self.audio_frames,
+            "audio_duration": self.audio_duration,
             "updated_by_id": self.updated_by_id,
             "path": self.path
         }
@@ -1136,12 +1149,13 @@ class ISelection(AbstractModelBase, Serialisable, TableOperations, Cascading, Fi
         raise NotImplementedError
 
     @abstractmethod
-    def ctr_file_generate(self):
+    def ctr_file_generate(self, ctr_file, contour_file_handler=None):
         """Generate a file made of the data in `contour_file`. If it is already populated
         raise `exception_handler.WarningException`. If not, generate it. Note that the session used
         to call this method needs to be committed by the caller. If a CTR file already exists, it
         is first deleted before being regenerated. The new file will be automatically
-        added to the provided session, but not comitted."""
+        added to the provided session, but not comitted. If the `contour_file` has already been
+        parsed, pass its `contour_file_handler` to avoid parsing it again."""
         raise NotImplementedError
 
     def get_contour_statistics_dict(self, use_headers=False) -> typing.Dict[str, typing.Any]:
@@ -1231,8 +1245,20 @@ class ISelection(AbstractModelBase, Serialisable, TableOperations, Cascading, Fi
         raise NotImplementedError
 
     @abstractmethod
-    def contour_statistics_calculate(self):
-        """Calculate contour statistics. Raises `ValueError` in the event of an error."""
+    def contour_statistics_calculate(self, contour_file_handler=None):
+        """Calculate contour statistics. Raises `ValueError` in the event of an error. If the
+        `contour_file` has already been parsed, pass its `contour_file_handler` to avoid
+        parsing it again."""
+        raise NotImplementedError()
+
+    @staticmethod
+    @abstractmethod
+    def contour_files_recalculate(selections: list, transaction_proxy, workers: int = 1) -> int:
+        """Regenerate the CTR file and recalculate the contour statistics of many selections
+        at once (see `contour_statistics.recalculate_contour_files()`). Selections without a
+        `contour_file` are skipped. The contour files are processed in a (reused) pool of
+        `workers` processes and the results are then applied to the selections, with new CTR files
+        tracked by `transaction_proxy`. Returns the number of selections recalculated."""
         raise NotImplementedError()
     
     @abstractmethod
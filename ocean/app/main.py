@@ -20,6 +20,7 @@ import os
 from datetime import datetime
 
 # Third-party imports
+import click
 from jinja2 import Environment
 from flask import Flask, flash, redirect, render_template, request, url_for, session as client_session, g
 from flask_login import LoginManager, login_user,login_required, current_user, login_manager, logout_user
@@ -31,6 +32,7 @@ from . import exception_handler
 from .logger import logger
 from . import database_handler
 from . import filespace_handler
+from . import integrity
 from .routes.routes_general import routes_general
 from .routes.routes_admin import routes_admin
 from .routes.routes_selection import routes_selection
@@ -252,6 +254,34 @@ def create_app(config_class):
     
     app.register_blueprint(api, url_prefix=CONFIG.URL_PREFIX + "/api/")
 
+    @app.cli.command('backfill-audio-metadata')
+    @click.option('--batch-size', default=500, show_default=True, help='Number of files to update per transaction.')
+    @click.option('--overwrite', is_flag=True, help='Recalculate the metadata of files which already have it.')
+    def backfill_audio_metadata(batch_size, overwrite):
+        """Store the audio header metadata of WAV files uploaded before it was recorded."""
+        updated, failed = filespace_handler.backfill_audio_metadata(batch_size=batch_size, overwrite=overwrite)
+        click.echo(f"Updated {updated} file(s), {failed} could not be read (see the log).")
+
+    @app.cli.command('deduplicate-filespace')
+    @click.option('--batch-size', default=500, show_default=True, help='Number of files to query at once.')
+    def deduplicate_filespace(batch_size):
+        """Store the content of identical existing files once (see OCEAN_DEDUPLICATE_FILES)."""
+        deduplicated, reclaimed = filespace_handler.deduplicate_files(batch_size=batch_size)
+        click.echo(f"Deduplicated {deduplicated} file(s), reclaiming {reclaimed} bytes.")
+
+    @app.cli.command('verify-filespace')
+    @click.option('--workers', default=CONFIG.INTEGRITY_WORKERS, show_default=True, help='Number of threads hashing files.')
+    @click.option('--batch-size', default=integrity.DEFAULT_BATCH_SIZE, show_default=True, help='Number of files to verify per transaction.')
+    @click.option('--max-bytes-per-second', default=CONFIG.INTEGRITY_MAX_BYTES_PER_SECOND, show_default=True, help='Total read rate (0 for unlimited).')
+    @click.option('--restart', is_flag=True, help='Start a new verification instead of resuming an unfinished one.')
+    def verify_filespace(workers, batch_size, max_bytes_per_second, restart):
+        """Re-hash every file and compare it with its stored hash, storing missing hashes."""
+        try:
+            report = integrity.run(workers=workers, batch_size=batch_size, max_bytes_per_second=max_bytes_per_second, restart=restart)
+        except exception_handler.WarningException as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Checked {report['checked']} file(s): {report['mismatched']} mismatched, {report['missing']} missing, {report['backfilled']} hash(es) stored.")
+
     env = Environment()
     env.globals['getattr'] = getattr
 
@@ -17,35 +17,37 @@
 
 #  Standard library imports
 from io import StringIO
+import hashlib
 import io
 import os
 import tempfile
 import uuid
 import datetime
+import typing
 import warnings
 
 # Third-party imports
-from flask import Response
+from flask import Response, has_app_context
 from sqlalchemy.event import listens_for
 from sqlalchemy.sql import func
 from flask_login import UserMixin
 import csv
-import scipy.io
 import numpy as np
 import pandas as pd
-import librosa
-import matplotlib
-import wave
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from werkzeug.utils import secure_filename
-import matplotlib.ticker as ticker
 
 # Local application imports
+from . import audio_io
+from . import blob_store
+from . import contour_cache
 from . import contour_statistics
 from . import database_handler
 from . import exception_handler
+from . import plot_cache
+from . import spectrogram
+from . import spectrogram_tiles
 from . import utils
+from . import waveform
 from .interfaces import imodels
 from .logger import logger
 
@@ -165,10 +167,13 @@ class Encounter(imodels.IEncounter):
         return utils.secure_fname(f"Location-{self.location}")
 
     def generate_ctr_files(self):
+        """Yield a function generating the CTR file (see `Selection.generate_ctr_binary()`) and
+        the name of the CTR file of every selection with a contour file, so that the CTR files
+        are only generated when they are needed (see `utils.stream_zip_file()`)."""
         for recording in self.recordings:
             for selection in recording.selections:
                 if selection.contour_file is not None:
-                    yield selection.generate_ctr_binary(), f"{selection.ctr_file_name}.ctr"    
+                    yield selection.generate_ctr_binary, f"{selection.ctr_file_name}.ctr"
 
     def generate_contour_files(self):
         for recording in self.recordings:
@@ -264,7 +269,14 @@ class File(imodels.IFile):
             if os.path.exists(src):
                 os.rename(src, dst)
 
-    def insert(self, file, directory: str, filename: str, original_filename: str = None, extension: str = None):
+    def insert(self, file, directory: str, filename: str, original_filename: str = None, extension: str = None, fsync_interval: int = 0):
+        """
+        Copy `file` (a path, a werkzeug `FileStorage` or a file-like object) into the file
+        space at `directory`/`filename`. The file is copied in 1 MB chunks and its hash
+        calculated from the same chunks as they are written, so it is read only once. If
+        `fsync_interval` is given, the copy is flushed to disk after every
+        `fsync_interval` bytes and once it is complete.
+        """
         if isinstance(file, str):  # If `file` is a file path string
             if not os.path.exists(file): raise exception_handler.CriticalException("File with given path does not exist.")
             f, e = utils.parse_filename(os.path.basename(file))
@@ -298,15 +310,83 @@ class File(imodels.IFile):
 
         dst = self.__prepare_destination(directory = self.directory, filename = self.filename)
         chunk_size = 1024 * 1024  # 1MB chunks
+        # The first chunk holds the header of audio files
+        header = None
+        size = 0
+        unsynced = 0
+        hash_value = hashlib.sha256()
         with open(dst, 'wb') as dest_file:
-            while True:
-                chunk = file_stream.read(chunk_size)
-                if chunk:
-                    dest_file.write(chunk)
-                else:
-                    break
+            while chunk := file_stream.read(chunk_size):
+                if header is None: header = chunk
+                size += len(chunk)
+                hash_value.update(chunk)
+                dest_file.write(chunk)
+                unsynced += len(chunk)
+                if fsync_interval and unsynced >= fsync_interval:
+                    self.__fsync(dest_file)
+                    unsynced = 0
+            if fsync_interval and unsynced: self.__fsync(dest_file)
         self.inserted = True
-        self.hash = self.calculate_hash()
+        self.hash = hash_value.digest()
+        if blob_store.is_enabled(): blob_store.deduplicate(dst, self.hash)
+        if self.is_audio:
+            self._extract_audio_metadata(header or b'', size)
+
+    @staticmethod
+    def __fsync(file):
+        file.flush()
+        os.fsync(file.fileno())
+
+    @property
+    def is_audio(self) -> bool:
+        return bool(self.extension) and self.extension.lower() == "wav"
+
+    def set_audio_metadata(self, info: audio_io.WavInfo = None):
+        """Set the audio header metadata of the file from `info` (or clear it if `None`)."""
+        self.audio_sampling_rate = info.sampling_rate if info else None
+        self.audio_channels = info.channels if info else None
+        self.audio_sample_width = info.bits_per_sample // 8 if info else None
+        self.audio_frames = info.frames if info else None
+        self.audio_duration = info.duration if info else None
+
+    def calculate_audio_metadata(self):
+        """Read the header of the (WAV) file and store its audio metadata. Raises
+        `WarningException` if the file is not a readable WAV file."""
+        if not self.is_audio: raise exception_handler.WarningException(f"File {self.filename_with_extension} is not an audio file.")
+        self.set_audio_metadata(audio_io.read_info(self._path_with_root))
+
+    def submit_waveform_build(self) -> bool:
+        """Build the waveform envelope of the (WAV) file in the background (see
+        `waveform.request_build()`), so that neither inserting nor viewing a long recording
+        waits for it. After an insert this should only be called once the transaction has
+        been committed (see `TransactionProxy.on_success`). Outside an application context
+        nothing is queued and `False` is returned. Returns whether the envelope is being
+        built."""
+        if not has_app_context(): return False
+        return waveform.request_build(self.hash, self._path_with_root)
+
+    def get_waveform(self, start: float = 0, end: float = None, pixels: int = 1000) -> typing.Optional[dict]:
+        """Get a slice of the waveform envelope of the file (see `waveform.get_slice()`), or
+        `None` if the envelope has not been built (see `submit_waveform_build()`)."""
+        if not self.is_audio: raise exception_handler.WarningException(f"File {self.filename_with_extension} is not an audio file.")
+        if self.hash is None: raise exception_handler.WarningException(f"File {self.filename_with_extension} does not have a hash.")
+        return waveform.get_slice(self.hash, start, end, pixels)
+
+    def _extract_audio_metadata(self, header: bytes, size: int):
+        """Store the audio metadata of the file from `header` (the start of the file, as it
+        was written) and the `size` of the file. The file is only read again if its header
+        is longer than `header`. A file which is not a readable WAV file is logged and left
+        without metadata rather than failing the insert."""
+        try:
+            try:
+                info = audio_io.parse_header(io.BytesIO(header), size, self.filename_with_extension)
+            except exception_handler.WarningException:
+                if len(header) >= size: raise
+                info = audio_io.read_info(self._path_with_root)
+        except exception_handler.WarningException as e:
+            logger.warning(f"Unable to extract audio metadata: {e}")
+            info = None
+        self.set_audio_metadata(info)
 
     def update(self, directory: str, filename: str):
         self._move(directory = directory, filename = filename)
@@ -329,12 +409,14 @@ class File(imodels.IFile):
         ).first() is not None
 
     def calculate_hash(self):
-        import hashlib
         if os.path.exists(self._path_with_root) == False:
             return None
+        hash_value = hashlib.sha256()
         with open(self._path_with_root, 'rb') as file:
-            hash_value = hashlib.sha256(file.read()).digest()
-        return hash_value
+            # Read in chunks so that large files are not held in memory
+            while chunk := file.read(1024 * 1024):
+                hash_value.update(chunk)
+        return hash_value.digest()
     
     def verify_hash(self, fix:bool=True):
         """
@@ -358,6 +440,20 @@ class File(imodels.IFile):
     
     def _delete_permanent(self):
         os.remove(self._path_with_root)
+        # Remove the blob of the file if it was deduplicated and no other file shares it
+        blob_store.release(self.hash)
+
+    def release_caches(self, session):
+        """Delete the data cached from the content of the file (its spectrogram tiles,
+        waveform envelope and contour cache entry, which are keyed by its hash) unless
+        another File object (including one in the trash) has the same hash. Call once the
+        file has been permanently deleted."""
+        if self.hash is None: return
+        with session.no_autoflush:
+            if session.query(File.id).filter(File.hash == self.hash, File.id != self.id).first() is not None: return
+        spectrogram_tiles.invalidate(self.hash)
+        waveform.invalidate(self.hash)
+        contour_cache.invalidate(self.hash)
 
     def rollback(self, session = None):
         """
@@ -374,6 +470,7 @@ class File(imodels.IFile):
             if self in session.new or (hasattr(self, 'just_inserted') and self.just_inserted == True):
                 self._delete_permanent()
                 session.delete(self)
+                self.release_caches(session)
         except Exception as e:
             pass
 
@@ -438,9 +535,10 @@ class Recording(imodels.IRecording):
             setattr(self, key, value)
 
     def generate_ctr_files(self):
+        """See `Encounter.generate_ctr_files()`."""
         for selection in self.selections:
             if selection.contour_file is not None:
-                yield selection.generate_ctr_binary(), f"{selection.ctr_file_name}.ctr"    
+                yield selection.generate_ctr_binary, f"{selection.ctr_file_name}.ctr"
 
     def recording_file_delete(self):
         if self.recording_file: self.recording_file.mark_for_deletion()
@@ -702,11 +800,13 @@ class Selection(imodels.ISelection):
     def contour_file_insert(self, contour_file, ctr_file):
         if self.contour_file or self.contour_file_id: raise exception_handler.WarningException(f"Contour file for selection {self.selection_number} already exists.")
         self.contour_file = contour_file
+        # The contour file is parsed once, with the results cached for the contour statistics
         self.ctr_file_generate(ctr_file = ctr_file)
         self.contour_statistics_calculate()
         self.update_traced()
 
     def contour_file_delete(self):
+        plot_cache.invalidate(self.id)
         self.ctr_file_delete()
         if self.contour_file: self.contour_file.mark_for_deletion()
         self.contour_file = None
@@ -714,6 +814,7 @@ class Selection(imodels.ISelection):
         self.clear_contour_statistics_attrs()
 
     def selection_file_delete(self):
+        plot_cache.invalidate(self.id)
         if self.selection_file: self.selection_file.mark_for_deletion()
         self.ctr_file = None
 
@@ -721,30 +822,37 @@ class Selection(imodels.ISelection):
         if self.ctr_file: self.ctr_file.mark_for_deletion()
         self.ctr_file = None
 
-    def generate_ctr_binary(self):
-        contour_file_handler = self.get_contour_file_handler()
-        if contour_file_handler:
-            mat_data = contour_file_handler.get_ctr_data()
+    def generate_ctr_binary(self, contour_file_handler: contour_statistics.ContourFileHandler = None):
+        if self.contour_file:
+            mat_data = self._contour_cache_entry(contour_file_handler).mat_data
             if mat_data:
-                f = io.BytesIO()
-                scipy.io.savemat(f, mat_data)
-                f.seek(0)
-                return f
-
-    def ctr_file_generate(self, ctr_file: File):
-        contour_file_handler = self.get_contour_file_handler()
-        if contour_file_handler:
-            mat_data = contour_file_handler.get_ctr_data()
+                return io.BytesIO(contour_statistics.serialise_ctr(mat_data))
+
+    def ctr_file_generate(self, ctr_file: File, contour_file_handler: contour_statistics.ContourFileHandler = None):
+        if self.contour_file:
+            mat_data = dict(self._contour_cache_entry(contour_file_handler).mat_data)
             mat_data["id"] = self.id
             if mat_data:
-                with io.BytesIO() as f:
-                    scipy.io.savemat(f, mat_data)
-                    f.seek(0)
-                    ctr_file.insert(file = f, directory = self.relative_directory, filename = self.ctr_file_name, extension="ctr")
-                self.ctr_file = ctr_file
+                self._ctr_file_insert(ctr_file, contour_statistics.serialise_ctr(mat_data))
         else:
             raise exception_handler.WarningException(f"Contour file for selection {self.selection_number} does not exist.")
 
+    def _contour_cache_entry(self, contour_file_handler: contour_statistics.ContourFileHandler = None) -> contour_cache.ContourCacheEntry:
+        """Get the contour statistics and CTR data of the `contour_file` from the cache, or
+        calculate (and cache) them if they are not there. The contour file is only parsed
+        (if `contour_file_handler` is not given) when there is no cached entry."""
+        entry = contour_cache.get(self.contour_file.hash)
+        if entry is None:
+            if contour_file_handler is None: contour_file_handler = self.get_contour_file_handler()
+            entry = contour_cache.calculate(contour_file_handler)
+            contour_cache.put(self.contour_file.hash, entry)
+        return entry
+
+    def _ctr_file_insert(self, ctr_file: File, ctr_binary: bytes):
+        with io.BytesIO(ctr_binary) as f:
+            ctr_file.insert(file = f, directory = self.relative_directory, filename = self.ctr_file_name, extension="ctr")
+        self.ctr_file = ctr_file
+
     def clear_contour_statistics_attrs(self):
         for attr in imodels.ISelection.get_contour_statistics_attrs():
             setattr(self, attr, None)
@@ -756,21 +864,11 @@ class Selection(imodels.ISelection):
         else:
             raise exception_handler.CriticalException("Cannot update selections.")
 
-    def contour_statistics_calculate(self):
-        self.clear_contour_statistics_attrs()
-        if self.contour_file is not None:
-            try:
-                contour_statistics_obj = contour_statistics.ContourFile(self.contour_file._path_with_root, self.selection_number)
-                contour_statistics_obj.calculate_statistics(self)
-            except ValueError as e:
-                raise exception_handler.WarningException(f"Error processing contour {self.selection_number}: " + str(e))
-            except FileNotFoundError as e:
-                raise exception_handler.WarningException(f"Error processing contour {self.selection_number} (file no longer exists)")
-
     def _calculate_sampling_rate(self):
         if self.selection_file:
-            with wave.open(self.selection_file._path_with_root, "rb") as wave_file:
-                self.sampling_rate = wave_file.getframerate()
+            # Files inserted before audio metadata was stored are read once
+            if self.selection_file.audio_sampling_rate is None: self.selection_file.calculate_audio_metadata()
+            self.sampling_rate = self.selection_file.audio_sampling_rate
         else: raise exception_handler.WarningException("Unable to calculate sampling rate as the selection file does not exist.")
 
     def deactivate(self):
@@ -791,111 +889,109 @@ class Selection(imodels.ISelection):
         elif not self.contour_file and (self.annotation == "N"): self.traced = False
         else: self.traced = None
             
-    def create_temp_plot(self):
+    def plot_parameters(self) -> dict:
+        """The parameters used to render the plot of the selection (see `create_temp_plot()`)."""
         # Sampling rate defaults to 44100 (otherwise use that from the selection file)
         sampling_rate = int(self.sampling_rate) if self.sampling_rate else 44100
         
-        # Adjustable: 20–50 ms (time between frequency bins)
-        bin_width = 25  
-        window_size = 2 ** int(round(np.log2((bin_width / 1000) * sampling_rate)))
-        hop_size = window_size // 4  # 75% overlap
-
-        # Set x-axis labels in milliseconds
-        def format_ms(x, pos):
-            """Convert x axis labels from seconds to milliseconds"""
-            return f"{x*1000:.0f}"
-
-        with open(self.selection_file._path_with_root, 'rb') as selection_file:
-            audio, sr = librosa.load(selection_file, sr=sampling_rate)
-            audio_length = len(audio)/sampling_rate
-        
-        spectrogram = librosa.stft(audio, n_fft=window_size, hop_length=hop_size)
-
-        # If there is no contour file, create just one subplot (spectrogram only)
-        # If there is a contour file, create two subplots (spectrogram and contour)
-        if self.contour_file: fig, axs = plt.subplots(1, 2, figsize=(30, 10))
-        else: fig, axs = plt.subplots(1, 1, figsize=(30, 5))
-        spectogram_axs = axs[0] if self.contour_file else axs
-        contour_axs = axs[1] if self.contour_file else None
-
-        # Plot the spectrogram
-        librosa.display.specshow(librosa.amplitude_to_db(np.abs(spectrogram), ref=np.max), ax=spectogram_axs, sr=sampling_rate, hop_length=hop_size, cmap='inferno', x_axis='time', y_axis='hz')
-        spectogram_axs.set_xlabel(f'Time (ms)', fontsize=20)
-        spectogram_axs.set_ylabel('Frequency (Hz)', fontsize=20)
-        spectogram_axs.tick_params(axis='both', labelsize=14)
-        spectrogram_y_min = spectogram_axs.get_ylim()[0]
-        sprectrogram_y_max = spectogram_axs.get_ylim()[1] if spectogram_axs.get_ylim()[1] < 20000 else 20000
-        spectogram_axs.set_xlim(0)
-        spectogram_axs.set_ylim(spectrogram_y_min, sprectrogram_y_max)
-        spectogram_axs.xaxis.set_major_formatter(ticker.FuncFormatter(format_ms))
-        spectrogram_x_min, spectrogram_x_max = [x * 1000 for x in spectogram_axs.get_xlim()]
-
-        # Plot the contour if it exists
-        if self.contour_file_id and contour_axs:
-            contour_file_handler = self.get_contour_file_handler()
-            contour_rows = contour_file_handler.contour_rows
-            contour_domain = [(unit.time_milliseconds - contour_rows[0].time_milliseconds) for unit in contour_rows]
-            contour_range = [unit.peak_frequency for unit in contour_rows]
-            contour_axs.plot(contour_domain, contour_range)
-            contour_axs.set_xlabel('Time (ms)', fontsize=20)
-            contour_axs.set_ylabel('Frequency (Hz)', fontsize=20)
-            contour_axs.tick_params(axis='both', labelsize=14)
-            contour_axs.set_ylim(spectrogram_y_min, sprectrogram_y_max)
-            contour_axs.set_xlim(spectrogram_x_min, spectrogram_x_max)
-        
-        fig.suptitle(f'{self.unique_name} spectrogram (Sampling Rate: {sampling_rate} Hz, Duration {audio_length:.2f} s, Window Size: {window_size}, Hop Size: {hop_size})', fontsize=26)
-        
-        # Layout so plots do not overlap
-        fig.tight_layout()
-
-        # Create a BytesIO object to store the plot
-        buf = io.BytesIO()
-
-        # Save the plot to the BytesIO object
-        plt.savefig(buf, format='png', bbox_inches='tight')
-
-        # Seek back to the beginning of the buffer
-        buf.seek(0)
+        window_size, hop_size = spectrogram.stft_parameters(sampling_rate)
+        return {'sampling_rate': sampling_rate, 'window_size': window_size, 'hop_size': hop_size}
+
+    def _plot_cache_key(self, renderer: str) -> tuple:
+        """The fingerprint and parameters identifying the plot of the selection in the plot cache."""
+        spectrogram.check_renderer(renderer)
+        fingerprint = plot_cache.make_fingerprint(self.selection_file.hash if self.selection_file else None, self.contour_file.hash if self.contour_file else None)
+        # The title of the plot includes the unique name of the selection
+        parameters = {**self.plot_parameters(), 'unique_name': self.unique_name, 'renderer': renderer}
+        return fingerprint, parameters
+
+    def plot_etag(self, renderer: str = spectrogram.DEFAULT_RENDERER) -> typing.Optional[str]:
+        """A strong ETag of the plot of the selection (see `plot_cache.make_etag()`), or
+        `None` if the selection file has no hash."""
+        return plot_cache.make_etag(*self._plot_cache_key(renderer))
+
+    def get_plot(self, max_cache_size: int = plot_cache.DEFAULT_MAX_SIZE, renderer: str = spectrogram.DEFAULT_RENDERER) -> bytes:
+        """Return the plot of the selection (see `create_temp_plot()`) from the plot cache,
+        or create and cache it if it is not there. Cached plots are invalidated when the
+        selection or contour file changes (see `plot_cache`)."""
+        fingerprint, parameters = self._plot_cache_key(renderer)
+        plot = plot_cache.get(self.id, fingerprint, parameters)
+        if plot is None:
+            plot = self.create_temp_plot(renderer)
+            plot_cache.put(self.id, fingerprint, parameters, plot, max_cache_size)
+        return plot
+
+    def create_temp_plot(self, renderer: str = spectrogram.DEFAULT_RENDERER):
+        """Render the spectrogram of the selection file (and the contour, if there is a
+        contour file) to a PNG using `renderer` (see `spectrogram.RENDERERS`)."""
+        spectrogram.check_renderer(renderer)
+        parameters = self.plot_parameters()
+        sampling_rate, window_size, hop_size = parameters['sampling_rate'], parameters['window_size'], parameters['hop_size']
+
+        audio, _ = audio_io.load(self.selection_file._path_with_root, sampling_rate)
+        audio_length = len(audio)/sampling_rate
+
+        contour = None
+        if self.contour_file_id and self.contour_file:
+            contour_data = self.get_contour_file_handler().contour_data
+            contour = spectrogram.Contour(contour_data.time_milliseconds - contour_data.time_milliseconds[0], contour_data.peak_frequency)
+
+        title = f'{self.unique_name} spectrogram (Sampling Rate: {sampling_rate} Hz, Duration {audio_length:.2f} s, Window Size: {window_size}, Hop Size: {hop_size})'
+        return spectrogram.render(renderer, spectrogram.compute_spectrogram(audio, window_size, hop_size), sampling_rate, hop_size, title, contour)
 
-        # Return the bytestream of the plot
-        return buf.getvalue()
-
-
-    def __contour_file_load_dataframe(self) -> pd.DataFrame:
-        """Read the `contour_file` into a pandas dataframe, validating columns and their types."""
-        if self.contour_file:
-            try:
-                self.contour_file.get_binary()
-                if self.contour_file.extension.lower() == "csv":
-                    df = pd.read_csv(self.contour_file._path_with_root)
-                elif self.contour_file.extension.lower() == "xlsx":
-                    df = pd.read_excel(self.contour_file._path_with_root)
-                else:
-                    raise exception_handler.WarningException(f"Unable to parse contour file as it is in the wrong format. Require CSV or XLSX")
-                return df
-            except FileNotFoundError as e:
-                raise exception_handler.WarningException(f"Contour file for selection {self.selection_number} no longer exists.")
-        else:
-            raise exception_handler.WarningException(f"Contour file for selection {self.selection_number} does not exist.")
 
     def get_contour_file_handler(self) -> contour_statistics.ContourFileHandler:
         if not self.contour_file: return None
-        # Get contour file dataframe
-        df = self.__contour_file_load_dataframe()
-        if not df.empty:
-            # Populate contour file handler with values from the dataframe
-            handler = contour_statistics.ContourFileHandler()
-            handler.insert_dataframe(df)
-            return handler
-        else:
-            raise exception_handler.WarningException(f"Contour file {self.selection_number} unable to be parsed.")
+        try:
+            return contour_statistics.load_contour_file(self.contour_file._path_with_root, self.contour_file.extension)
+        except FileNotFoundError as e:
+            raise exception_handler.WarningException(f"Contour file for selection {self.selection_number} no longer exists.")
 
-    def contour_statistics_calculate(self):
+    def contour_statistics_calculate(self, contour_file_handler: contour_statistics.ContourFileHandler = None):
         if self.contour_file:
             self._calculate_sampling_rate()
             self.clear_contour_statistics_attrs()
-            contour_file_handler = self.get_contour_file_handler()
-            contour_file_handler.calculate_statistics(self)
+            entry = self._contour_cache_entry(contour_file_handler)
+            if entry.statistics_error: raise exception_handler.WarningException(entry.statistics_error)
+            for attr, value in entry.statistics.items():
+                setattr(self, attr, value)
+
+    @staticmethod
+    def contour_files_recalculate(selections: list, transaction_proxy, workers: int = 1) -> int:
+        selections = [selection for selection in selections if selection.contour_file]
+        # Only contour files without a cached entry need to be processed
+        entries = {selection.id: contour_cache.get(selection.contour_file.hash) for selection in selections}
+        uncached = [selection for selection in selections if entries[selection.id] is None]
+        jobs = [
+            contour_statistics.ContourFileJob(
+                id=selection.id,
+                name=f"selection {selection.selection_number}",
+                path=selection.contour_file._path_with_root,
+                extension=selection.contour_file.extension
+            ) for selection in uncached
+        ]
+        statistics, ctr_data = contour_statistics.recalculate_contour_files(jobs, workers=workers)
+        statistics = statistics.to_dict(orient="index")
+        for selection, mat_data in zip(uncached, ctr_data):
+            entries[selection.id] = contour_cache.ContourCacheEntry(
+                statistics={attr: value for attr, value in statistics[selection.id].items() if not pd.isna(value)},
+                statistics_error=None,
+                mat_data=mat_data
+            )
+            contour_cache.put(selection.contour_file.hash, entries[selection.id])
+        for selection in selections:
+            entry = entries[selection.id]
+            if entry.statistics_error: raise exception_handler.WarningException(entry.statistics_error)
+            selection._calculate_sampling_rate()
+            selection.clear_contour_statistics_attrs()
+            mat_data = dict(entry.mat_data)
+            mat_data["id"] = selection.id
+            selection._ctr_file_insert(transaction_proxy.create_tracked_file(), contour_statistics.serialise_ctr(mat_data))
+            for attr, value in entry.statistics.items():
+                setattr(selection, attr, value)
+        # Write all the updates to the database at once
+        transaction_proxy.session.flush()
+        return len(selections)
 
     def upload_selection_table_data(self, st_df, coerce_annotations=True):
         missing_columns = []
@@ -0,0 +1,193 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A size-bounded persistent cache of rendered selection plots (see
+`Selection.get_plot()`), stored in the cache space of the file space (see
+`database_handler.get_cache_space()`).
+
+Entries are stored per selection and named by a fingerprint of the selection and
+contour file hashes (`File.hash`) and a digest of the plot parameters (such as the
+window and hop size). When a plot is stored, all entries of the same selection with a
+different fingerprint are deleted, so replacing the selection or contour file
+invalidates its plots. All entries are also invalidated when `RENDERER_VERSION` changes.
+
+The cache is evicted least recently used first (the modification time of an entry is
+updated whenever it is read) whenever it grows beyond its maximum size.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import typing
+
+# Local application imports
+from . import database_handler
+from .logger import logger
+
+CACHE_NAME = 'plots'
+# The version of the plot renderers. This MUST be incremented whenever a change is made
+# to the appearance of the plots, as it invalidates all cached plots.
+RENDERER_VERSION = 2
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2
+ENTRY_EXTENSION = '.png'
+
+
+class PlotCacheStatistics(typing.NamedTuple):
+    """The hit, miss and eviction counters (of this process, since it started) and the
+    number and total size in bytes of the entries currently in the cache."""
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+
+
+_counters_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _increment(counter: str, amount: int = 1) -> None:
+    with _counters_lock:
+        _counters[counter] += amount
+
+def _get_version_directory(version: int = None) -> str:
+    version = RENDERER_VERSION if version is None else version
+    return os.path.join(database_handler.get_cache_space(), CACHE_NAME, f"v{version}")
+
+def _get_selection_directory(selection_id: str) -> str:
+    return os.path.join(_get_version_directory(), selection_id)
+
+def _get_parameters_digest(parameters: dict) -> str:
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+def _get_entry_path(selection_id: str, fingerprint: str, parameters: dict) -> str:
+    return os.path.join(_get_selection_directory(selection_id), f"{fingerprint}-{_get_parameters_digest(parameters)}{ENTRY_EXTENSION}")
+
+def make_fingerprint(selection_file_hash: bytes, contour_file_hash: bytes = None) -> typing.Optional[str]:
+    """The fingerprint of the files a plot is rendered from, or `None` if the selection
+    file has no hash (in which case the plot cannot be cached)."""
+    if selection_file_hash is None: return None
+    return hashlib.sha256(selection_file_hash + (contour_file_hash or b'')).hexdigest()[:16]
+
+def make_etag(fingerprint: str, parameters: dict) -> typing.Optional[str]:
+    """A strong ETag of the plot rendered from the files with the fingerprint `fingerprint`
+    using `parameters` (plots are deterministic given these and `RENDERER_VERSION`), or
+    `None` if `fingerprint` is `None`."""
+    if fingerprint is None: return None
+    return f"v{RENDERER_VERSION}-{fingerprint}-{_get_parameters_digest(parameters)}"
+
+def get(selection_id: str, fingerprint: str, parameters: dict) -> typing.Optional[bytes]:
+    """Get the cached plot of the selection with the ID `selection_id` rendered from the
+    files with the fingerprint `fingerprint` (see `make_fingerprint()`) using
+    `parameters`, or `None` if there is no entry (or if `fingerprint` is `None`)."""
+    if fingerprint is None: return None
+    path = _get_entry_path(selection_id, fingerprint, parameters)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Mark the entry as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        _increment('misses')
+        return None
+    except OSError as e:
+        logger.warning(f"Unable to read plot cache entry {path}: {e}")
+        _increment('misses')
+        return None
+    _increment('hits')
+    return data
+
+def put(selection_id: str, fingerprint: str, parameters: dict, data: bytes, max_size: int = DEFAULT_MAX_SIZE) -> None:
+    """Store the plot `data` (see `get()` for the other arguments), deleting any entries of
+    the selection rendered from other files and then evicting the least recently used
+    entries if the cache is larger than `max_size` bytes. Nothing is stored if
+    `fingerprint` is `None`. As the cache is only an optimisation, failing to write the
+    entry is logged rather than raised."""
+    if fingerprint is None: return
+    try:
+        _put(selection_id, fingerprint, parameters, data)
+        evict(max_size)
+    except OSError as e:
+        logger.warning(f"Unable to write plot cache entry for selection {selection_id}: {e}")
+
+def _put(selection_id: str, fingerprint: str, parameters: dict, data: bytes) -> None:
+    if not os.path.exists(_get_version_directory()):
+        os.makedirs(_get_version_directory(), exist_ok=True)
+        invalidate_stale_versions()
+    path = _get_entry_path(selection_id, fingerprint, parameters)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(ENTRY_EXTENSION) and not entry.name.startswith(f"{fingerprint}-"):
+            os.remove(entry.path)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+def _scan_entries() -> list:
+    """Return a list of `(mtime, size, path)` of every entry in the cache."""
+    entries = []
+    version_directory = _get_version_directory()
+    if not os.path.exists(version_directory): return entries
+    for selection_directory in os.scandir(version_directory):
+        if not selection_directory.is_dir(): continue
+        for entry in os.scandir(selection_directory.path):
+            if entry.is_file() and entry.name.endswith(ENTRY_EXTENSION):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+def evict(max_size: int) -> int:
+    """Delete the least recently used entries until the cache is no larger than
+    `max_size` bytes. Returns the number of entries deleted."""
+    entries = _scan_entries()
+    size = sum(entry_size for _, entry_size, _ in entries)
+    evicted = 0
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size: break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+        evicted += 1
+    if evicted: _increment('evictions', evicted)
+    return evicted
+
+def invalidate(selection_id: str) -> None:
+    """Delete all cached plots of the selection with the ID `selection_id`."""
+    shutil.rmtree(_get_selection_directory(selection_id), ignore_errors=True)
+
+def invalidate_stale_versions() -> None:
+    """Delete the cached plots of all renderer versions other than `RENDERER_VERSION`."""
+    cache_directory = os.path.join(database_handler.get_cache_space(), CACHE_NAME)
+    if not os.path.exists(cache_directory): return
+    current = os.path.basename(_get_version_directory())
+    for name in os.listdir(cache_directory):
+        if name != current:
+            logger.info(f"Deleting stale plot cache {name}")
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
+
+def get_statistics() -> PlotCacheStatistics:
+    entries = _scan_entries()
+    with _counters_lock:
+        counters = dict(_counters)
+    return PlotCacheStatistics(entries=len(entries), size=sum(size for _, size, _ in entries), **counters)
@@ -15,10 +15,23 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
 
-from flask import jsonify
+from flask import Response, jsonify, request
 from urllib.parse import quote
+from werkzeug.http import is_resource_modified
 from .exception_handler import handle_exception
 import contextlib
+import datetime
+import typing
+
+# The `Cache-Control` directives of each type of resource sent with an ETag (see
+# `set_caching()`). Files and plots may be cached but are revalidated on every use (which
+# is answered with 304 Not Modified if they have not changed). Spectrogram tiles are
+# addressed by the hash of their file so never change.
+CACHE_POLICIES = {
+    'file': {'private': True, 'no_cache': True},
+    'plot': {'private': True, 'no_cache': True},
+    'tile': {'private': True, 'max_age': 365 * 24 * 3600, 'immutable': True},
+}
 
 
 class JSONResponse:
@@ -113,4 +126,28 @@ def json_response_context():
     try:
         yield response
     except Exception as e:
-        response.add_error(handle_exception(exception=e, prefix="An error occurred", show_flash=False))
\ No newline at end of file
+        response.add_error(handle_exception(exception=e, prefix="An error occurred", show_flash=False))
+
+
+def set_caching(response: Response, etag: str = None, last_modified: datetime.datetime = None, policy: str = 'file') -> Response:
+    """Set the (strong) `ETag`, `Last-Modified` and `Cache-Control` (see `CACHE_POLICIES`)
+    headers of `response`. `etag` and `last_modified` are not set if they are `None`."""
+    if etag: response.set_etag(etag)
+    if last_modified: response.last_modified = last_modified
+    for directive, value in CACHE_POLICIES[policy].items():
+        setattr(response.cache_control, directive, value)
+    return response
+
+
+def not_modified(etag: str, last_modified: datetime.datetime = None, policy: str = 'file') -> typing.Optional[Response]:
+    """Return a 304 Not Modified response (with the headers of `set_caching()`) if the
+    `If-None-Match` (or, without it, `If-Modified-Since`) header of the current request
+    shows the client already has the resource with the ETag `etag`, otherwise `None`.
+    Routes call this before reading the resource so that revalidation is free::
+
+        response = response_handler.not_modified(file.hash_hex, file.upload_datetime)
+        if response: return response
+    """
+    if not etag or not (request.if_none_match or request.if_modified_since): return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified): return None
+    return set_caching(Response(status=304), etag, last_modified, policy)
@@ -1,7 +1,7 @@
 from flask_restx import Resource, reqparse, marshal_with, fields, Namespace
-from flask import Response, request, jsonify
+from flask import Response, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, current_user
-from ... import utils, exception_handler, models
+from ... import utils, exception_handler, models, plot_cache, response_handler, spectrogram
 
 api = Namespace('filespace', 'All endpoints that serve files from OCEAN to the user' )
 
@@ -27,11 +27,13 @@ class FileResource(Resource):
         args = file_resource_parser.parse_args()
         file_id = args.get('id')
         file = models.File.query.filter_by(id=file_id).first()
+        if not file: raise exception_handler.DoesNotExistError("File")
         return utils.download_file(file, mimetype='audio/wav')
 
 
 spectrogram_resource_parser = reqparse.RequestParser()
 spectrogram_resource_parser.add_argument('selection_id', type=str, required=True, location='args')
+spectrogram_resource_parser.add_argument('renderer', type=str, required=False, location='args', choices=spectrogram.RENDERERS)
 @api.route('/spectrogram/')
 class SpectrogramResource(Resource):
     method_decorators = [jwt_required()]
@@ -41,7 +43,11 @@ class SpectrogramResource(Resource):
         args = spectrogram_resource_parser.parse_args()
         selection = models.Selection.query.filter_by(id = args.get('selection_id')).first()
         if not selection: raise exception_handler.DoesNotExistError("Selection")
-        plot_bytestream = selection.create_temp_plot()
+        renderer = args.get('renderer') or current_app.config.get('PLOT_RENDERER', spectrogram.DEFAULT_RENDERER)
+        etag = selection.plot_etag(renderer)
+        r = response_handler.not_modified(etag, policy='plot')
+        if r: return r
+        plot_bytestream = selection.get_plot(max_cache_size=current_app.config.get('PLOT_CACHE_MAX_SIZE', plot_cache.DEFAULT_MAX_SIZE), renderer=renderer)
         r = Response(plot_bytestream, mimetype='image/png')
         r.headers['Content-Disposition'] = f'attachment; filename="{selection.plot_file_name}.png"'
-        return r
+        return response_handler.set_caching(r, etag, policy='plot')
@@ -150,7 +150,8 @@ def download_ctr_files(encounter_id):
     with database_handler.get_session() as session:
         encounter = session.query(models.Encounter).filter_by(id=encounter_id).first()
         zip_filename = f"{encounter.species.scientific_name.replace(' ', '_')}-{encounter.encounter_name}-{encounter.location}_ctr_files.zip"
-        return utils.stream_zip_file(encounter.generate_ctr_files, zip_filename)
+        # The selections are listed while the session is open, and their CTR files generated as the zip file is streamed
+        return utils.stream_zip_file(list(encounter.generate_ctr_files()), zip_filename)
 
 @routes_encounter.route('/encounter/<encounter_id>/download-contour-files', methods=['GET'])
 @login_required
@@ -159,5 +160,5 @@ def download_contour_files(encounter_id):
     with database_handler.get_session() as session:
         encounter = session.query(models.Encounter).filter_by(id=encounter_id).first()
         zip_filename = f"{encounter.species.scientific_name.replace(' ', '_')}-{encounter.encounter_name}-{encounter.location}_contour_files.zip"
-        contour_files, contour_file_names = zip(*encounter.generate_contour_files())
-        return utils.download_files(contour_files, contour_file_names, zip_filename)
+        contour_files = list(encounter.generate_contour_files())
+        return utils.download_files([contour_file for contour_file, _ in contour_files], [name for _, name in contour_files], zip_filename)
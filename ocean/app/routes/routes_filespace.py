@@ -25,10 +25,14 @@ from sqlalchemy.exc import SQLAlchemyError
 from flask_login import login_required
 
 # Local application imports
+from .. import background_worker
+from .. import blob_store
 from .. import database_handler
 from .. import exception_handler
 from .. import models
 from .. import filespace_handler
+from .. import integrity
+from .. import plot_cache
 from .. import response_handler
 
 routes_filespace = Blueprint('filespace', __name__)
@@ -89,10 +93,15 @@ def filespace_delete_file(file_id):
 
 def get_directory_size(directory):
     total_size = 0
+    # Deduplicated files are hard links to the same blob, so each is only counted once
+    counted = set()
     for dirpath, dirnames, filenames in os.walk(directory):
         for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
+            stat = os.stat(os.path.join(dirpath, f))
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in counted: continue
+                counted.add((stat.st_dev, stat.st_ino))
+            total_size += stat.st_size
     return total_size
 
 def format_bytes(value):
@@ -174,7 +183,44 @@ def filespace_view():
     trash_dir_size = get_directory_size(trash_dir)
     formatted_trash_dir_size = format_bytes(trash_dir_size)
 
-    return render_template('filespace/filespace.html', storage=storage, file_space_size=formatted_file_space_size, trash_dir_size=formatted_trash_dir_size)
+    plot_cache_statistics = plot_cache.get_statistics()
+    background_statistics = background_worker.get_statistics()
+
+    integrity_report = integrity.get_report()
+    deduplication = blob_store.get_statistics()
+
+    return render_template('filespace/filespace.html', storage=storage, file_space_size=formatted_file_space_size, trash_dir_size=formatted_trash_dir_size, plot_cache=plot_cache_statistics, plot_cache_size=format_bytes(plot_cache_statistics.size), background=background_statistics,
+                           integrity=integrity_report, integrity_size=format_bytes(integrity_report['bytes']) if integrity_report else None, integrity_running=integrity.is_running(),
+                           deduplication=deduplication, deduplication_size=format_bytes(deduplication.size) if deduplication else None, deduplication_reclaimed=format_bytes(deduplication.reclaimed) if deduplication else None)
+
+@routes_filespace.route('/filespace/integrity/start', methods=['POST'])
+@login_required
+@database_handler.exclude_role_2
+@database_handler.exclude_role_3
+@database_handler.exclude_role_4
+def integrity_start():
+    """Start (or resume, unless the `restart` argument is 'true') verifying the integrity of the filespace in the background (see `integrity`)."""
+    response = response_handler.JSONResponse()
+    restart = process_boolean_string(request.args.get('restart', 'false'))
+    if integrity.start(restart=bool(restart)):
+        response.add_message("Filespace verification started. Refresh the page to see its progress.")
+    else:
+        response.add_error("Filespace verification is already running.")
+    return response.to_json()
+
+@routes_filespace.route('/filespace/integrity/stop', methods=['POST'])
+@login_required
+@database_handler.exclude_role_2
+@database_handler.exclude_role_3
+@database_handler.exclude_role_4
+def integrity_stop():
+    """Stop the running filespace verification after its current batch (it can be resumed)."""
+    response = response_handler.JSONResponse()
+    if integrity.stop():
+        response.add_message("Filespace verification will stop after its current batch.")
+    else:
+        response.add_error("Filespace verification is not running.")
+    return response.to_json()
 
 def trash_delete_file_helper(file_id):
     """
@@ -188,6 +234,7 @@ def trash_delete_file_helper(file_id):
             file = session.query(models.File).filter(models.File.id == file_id).first()
             if file:
                 file._delete_permanent()
+                file.release_caches(session)
                 session.delete(file)
             session.commit()
         except (Exception, SQLAlchemyError) as e:
@@ -246,7 +293,12 @@ def trash_delete_file():
 def trash_send_file(file_id):
     with database_handler.get_session() as session:
         file = session.query(models.File).filter(models.File.id == file_id).first()
-        return send_file(file._path_with_root, as_attachment=True)
+        if not file: raise exception_handler.DoesNotExistError("file")
+        response = response_handler.not_modified(file.hash_hex, file.upload_datetime, policy='file')
+        if response: return response
+        response = send_file(file._path_with_root, as_attachment=True, etag=file.hash_hex or True, last_modified=file.upload_datetime)
+        response.accept_ranges = 'bytes'
+        return response_handler.set_caching(response, policy='file')
 
 @routes_filespace.route('/filespace/trash', methods=['GET'])
 def trash_view():
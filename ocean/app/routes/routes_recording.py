@@ -19,8 +19,7 @@
 from functools import wraps
 import io
 import typing
-import zipfile
-from flask import Blueprint, Response, flash, jsonify, redirect, render_template, send_file, url_for, request
+from flask import Blueprint, Response, current_app, flash, jsonify, redirect, render_template, send_file, url_for, request
 from sqlalchemy.exc import SQLAlchemyError
 from flask_login import login_required, current_user
 
@@ -32,6 +31,7 @@ from .. import exception_handler
 from .. import utils
 from .. import contour_statistics
 from .. import response_handler
+from .. import spectrogram_tiles
 from .. import transaction_handler
 
 routes_recording = Blueprint('recording', __name__)
@@ -139,6 +139,8 @@ def recording_file_insert_helper(recording, transaction, form):
         recording_file = transaction.create_tracked_file()
         recording_file.insert(file=filespace_handler.get_complete_temporary_file(form['upload_recording_file_id'], form['upload_recording_file_name']), directory=recording.relative_directory, filename=recording.recording_file_name, original_filename=form['upload_recording_file_name'])
         recording.recording_file_insert(recording_file)
+        # Build the waveform envelope once the transaction is committed
+        if recording_file.audio_sampling_rate is not None: transaction.on_success = recording_file.submit_waveform_build
 
 @routes_recording.route('/encounter/<encounter_id>/recording/insert', methods=['POST'])
 @database_handler.require_live_session
@@ -191,6 +193,76 @@ def recording_view(recording_id: str) -> Response:
         recording_history = database_handler.create_all_time_request(session, models.Recording, filters={"id":recording_id}, order_by="row_start")
         return render_template('recording/recording-view.html', recording=recording, selections=selections, user=current_user,recording_history=recording_history, assigned_users=assigned_users, logged_in_user_assigned=logged_in_user_assigned)
 
+def _get_recording_file(session, recording_id: str) -> models.File:
+    recording = database_handler.create_system_time_request(session, models.Recording, {"id":recording_id}, one_result=True)
+    if not recording: raise exception_handler.DoesNotExistError("recording")
+    if not recording.recording_file: raise exception_handler.WarningException("Recording does not have a recording file.")
+    return recording.recording_file
+
+@routes_recording.route('/recording/<recording_id>/spectrogram-tiles', methods=['GET'])
+@login_required
+def recording_spectrogram_tiles(recording_id: str):
+    """GET route returning the metadata of the spectrogram tile pyramid of the recording
+    file (see `spectrogram_tiles.build()`) as `data.metadata`. If the pyramid has not been
+    built, a build is started in the background and `data.status` is 'building' (or
+    'unavailable' if the background queue is full) rather than 'ready'. If the last build
+    failed, `data.status` is 'failed' and an error is returned until the build is due to
+    be retried (see `spectrogram_tiles.get_failure()`)."""
+    with response_handler.json_response_context() as response:
+        with database_handler.get_session() as session:
+            recording_file = _get_recording_file(session, recording_id)
+            if recording_file.hash is None: raise exception_handler.WarningException("Recording file does not have a hash.")
+            metadata = spectrogram_tiles.get_metadata(recording_file.hash)
+            failure = spectrogram_tiles.get_failure(recording_file.hash)
+            if metadata:
+                response.data['status'] = 'ready'
+                response.data['metadata'] = metadata
+            elif failure:
+                response.data['status'] = 'failed'
+                response.add_error(f"Unable to build the spectrogram of the recording: {failure['error']}")
+            elif spectrogram_tiles.request_build(recording_file.hash, recording_file._path_with_root):
+                response.data['status'] = 'building'
+            else:
+                response.data['status'] = 'unavailable'
+    return response.to_json()
+
+@routes_recording.route('/recording/<recording_id>/spectrogram-tiles/<int:level>/<int:x>/<int:y>.png', methods=['GET'])
+@login_required
+def recording_spectrogram_tile(recording_id: str, level: int, x: int, y: int):
+    """GET route serving a tile of the spectrogram tile pyramid of the recording file.
+    Tiles never change (a changed file has a different hash), so they are sent with the
+    'tile' caching policy (see `response_handler.CACHE_POLICIES`)."""
+    with database_handler.get_session() as session:
+        recording_file = _get_recording_file(session, recording_id)
+        path = spectrogram_tiles.get_tile(recording_file.hash, level, x, y)
+        if path is None: raise exception_handler.DoesNotExistError("spectrogram tile")
+        return response_handler.set_caching(send_file(path, mimetype='image/png'), policy='tile')
+
+@routes_recording.route('/recording/<recording_id>/waveform', methods=['GET'])
+@login_required
+def recording_waveform(recording_id: str):
+    """GET route returning a slice of the waveform envelope of the recording file as `data`
+    (see `File.get_waveform()`), selected by the optional arguments `start` and `end` (in
+    seconds) and `pixels`, with `data.status` 'ready'. If the envelope has not been built
+    (the file was inserted before envelopes were stored), a build is started in the
+    background and 202 is returned with `data.status` 'pending' (or 503 with 'unavailable'
+    if the background queue is full)."""
+    status_code = 200
+    with response_handler.json_response_context() as response:
+        with database_handler.get_session() as session:
+            recording_file = _get_recording_file(session, recording_id)
+            envelope = recording_file.get_waveform(start=request.args.get('start', 0, type=float), end=request.args.get('end', None, type=float), pixels=request.args.get('pixels', 1000, type=int))
+            if envelope is not None:
+                response.data['status'] = 'ready'
+                response.data.update(envelope)
+            elif recording_file.submit_waveform_build():
+                response.data['status'] = 'pending'
+                status_code = 202
+            else:
+                response.data['status'] = 'unavailable'
+                status_code = 503
+    return response.to_json(), status_code
+
 @routes_recording.route('/recording/<recording_id>/update_notes', methods=['POST'])
 @database_handler.require_live_session
 @database_handler.exclude_role_4
@@ -447,11 +519,7 @@ def calculate_contour_statistics_for_recording(recording_id: str):
             session = transaction_proxy.session
             recording = session.query(models.Recording).filter_by(id=recording_id).first()
             check_editable(recording)
-            count = 0
-            for selection in recording.selections:
-                if selection.contour_file: selection.ctr_file_generate(transaction_proxy.create_tracked_file())
-                selection.contour_statistics_calculate()
-                if selection.contour_file: count += 1
+            count = models.Selection.contour_files_recalculate(recording.selections, transaction_proxy, workers=current_app.config.get('CONTOUR_STATISTICS_WORKERS', 1))
         response.add_message(f"{count} contour statistic(s) and CTR file(s) were regenerated.")
     return response.to_json()
 
@@ -462,7 +530,8 @@ def download_ctr_files(recording_id):
     with database_handler.get_session() as session:
         recording = session.query(models.Recording).filter_by(id=recording_id).first()
         zip_filename = f"{recording.encounter.species.scientific_name.replace(' ', '_')}-{recording.encounter.encounter_name}-{recording.encounter.location}-{filespace_handler.format_date_for_filespace(recording.start_time)}_ctr_files.zip"
-        return utils.stream_zip_file(recording.generate_ctr_files, zip_filename)
+        # The selections are listed while the session is open, and their CTR files generated as the zip file is streamed
+        return utils.stream_zip_file(list(recording.generate_ctr_files()), zip_filename)
 
 @routes_recording.route('/recording/<recording_id>/download-selection-files', methods=['GET'])
 @login_required
@@ -481,7 +550,6 @@ def download_selection_files(recording_id):
         selection_files = [selection.selection_file for selection in selections if selection.selection_file is not None]
         file_names = [selection.selection_file_name for selection in selections if selection.selection_file is not None]
         zip_filename = f"{recording.encounter.species.scientific_name.replace(' ', '_')}-{recording.encounter.encounter_name}-{recording.encounter.location}-{filespace_handler.format_date_for_filespace(recording.start_time)}_selection_files.zip"
-        file_paths = [selection_file._path_with_root for selection_file in selection_files]
         response = utils.download_files(selection_files, file_names, zip_filename)
         return response
 
@@ -509,7 +577,7 @@ def download_contour_files(recording_id):
 def download_recording_file(recording_id):
     with database_handler.get_session() as session:
         recording = database_handler.create_system_time_request(session, models.Recording, {"id":recording_id}, one_result=True)
-        return utils.download_file(recording.recording_file, filename = recording.recording_file_name)
+        return utils.download_file(recording.recording_file, filename = recording.recording_file_name, mimetype='audio/wav')
 
     
 @routes_recording.route('/recording/<recording_id>/mark_as_complete', methods=['GET'])
@@ -22,17 +22,20 @@ import re
 import tempfile
 
 # Third-party imports
-from flask import Blueprint, flash, jsonify, redirect,render_template,request, send_file,session, url_for, send_from_directory
+from flask import Blueprint, flash, jsonify, redirect,render_template,request, send_file,session, url_for, send_from_directory, current_app
 from sqlalchemy.exc import SQLAlchemyError
 from flask_login import login_required, current_user
 
 # Location application imports
+from .. import background_worker
 from .. import database_handler
 from .. import models
 from .. import exception_handler
 from .. import utils
 from .. import filespace_handler
+from .. import plot_cache
 from .. import response_handler
+from .. import spectrogram
 from .. import transaction_handler
 from .routes_recording import check_editable
 
@@ -234,10 +237,41 @@ def serve_plot(selection_id: str):
     with database_handler.get_session() as session:
         filespace_handler.clean_filespace_temp()
         selection = database_handler.create_system_time_request(session, models.Selection, {"id":selection_id}, one_result=True)
-        plot_bytestream = selection.create_temp_plot()
+        renderer = request.args.get('renderer', current_app.config.get('PLOT_RENDERER', spectrogram.DEFAULT_RENDERER))
+        etag = selection.plot_etag(renderer)
+        response = response_handler.not_modified(etag, policy='plot')
+        if response: return response
+        plot_bytestream = selection.get_plot(max_cache_size=current_app.config.get('PLOT_CACHE_MAX_SIZE', plot_cache.DEFAULT_MAX_SIZE), renderer=renderer)
         response = Response(plot_bytestream, mimetype='image/png')
         response.headers['Content-Disposition'] = f'attachment; filename="{selection.plot_file_name}"'
-        return response
+        return response_handler.set_caching(response, etag, policy='plot')
+
+@routes_selection.route('/selection/<selection_id>/waveform', methods=['GET'])
+@login_required
+def selection_waveform(selection_id: str):
+    """GET route returning a slice of the waveform envelope of the selection file as `data`
+    (see `File.get_waveform()`), selected by the optional arguments `start` and `end` (in
+    seconds) and `pixels`, with `data.status` 'ready'. If the envelope has not been built
+    (the file was inserted before envelopes were stored), a build is started in the
+    background and 202 is returned with `data.status` 'pending' (or 503 with 'unavailable'
+    if the background queue is full)."""
+    status_code = 200
+    with response_handler.json_response_context() as response:
+        with database_handler.get_session() as session:
+            selection = database_handler.create_system_time_request(session, models.Selection, {"id":selection_id}, one_result=True)
+            if not selection: raise exception_handler.DoesNotExistError("selection")
+            if not selection.selection_file: raise exception_handler.WarningException(f"Selection {selection.selection_number} does not have a selection file.")
+            envelope = selection.selection_file.get_waveform(start=request.args.get('start', 0, type=float), end=request.args.get('end', None, type=float), pixels=request.args.get('pixels', 1000, type=int))
+            if envelope is not None:
+                response.data['status'] = 'ready'
+                response.data.update(envelope)
+            elif selection.selection_file.submit_waveform_build():
+                response.data['status'] = 'pending'
+                status_code = 202
+            else:
+                response.data['status'] = 'unavailable'
+                status_code = 503
+    return response.to_json(), status_code
 
 @routes_selection.route('/recording/<recording_id>/contour-insert', methods=['POST'])
 @database_handler.require_live_session
@@ -256,6 +290,8 @@ def contour_file_insert(recording_id):
                 if not selection: raise exception_handler.WarningException(f"Could not find corresponding selection with selection number {selection_number}.")
                 contour_file.insert(file_stream, selection.relative_directory, selection.contour_file_name)
                 selection.contour_file_insert(contour_file = contour_file, ctr_file = ctr_file)
+                # Render the plot (which now includes the contour) once the transaction is committed
+                transaction.on_success = lambda: background_worker.submit_plot_prerender(selection.id)
             else:
                 raise exception_handler.WarningException("No contour file provided.")
     return response.to_json()
@@ -283,6 +319,12 @@ def selection_file_insert(recording_id):
                 selection_file = transaction.create_tracked_file()
                 selection_file.insert(request.files['file'], selection.relative_directory, selection.selection_file_name)
                 selection.selection_file_insert(file = selection_file)
+                # Build the waveform envelope and render the plot once the transaction is committed,
+                # so the first view is served from the caches
+                def on_success():
+                    if selection_file.audio_sampling_rate is not None: selection_file.submit_waveform_build()
+                    background_worker.submit_plot_prerender(selection.id)
+                transaction.on_success = on_success
             else: raise exception_handler.WarningException(f"Bad file in request.")
     return response.to_json()
 
@@ -290,7 +332,7 @@ def selection_file_insert(recording_id):
 def download_ctr_file(selection_id):
     with database_handler.get_session() as session:
         selection = database_handler.create_system_time_request(session, models.Selection, {"id":selection_id}, one_result=True)
-        return utils.download_BytesIO(selection.generate_ctr_file(), selection.ctr_file_name)
+        return utils.download_BytesIO(selection.generate_ctr_binary(), selection.ctr_file_name)
 
 @routes_selection.route('/selection/<selection_id>/download-contour', methods=['GET'])
 def download_contour_file(selection_id):
@@ -302,7 +344,7 @@ def download_contour_file(selection_id):
 def download_selection_file(selection_id):
     with database_handler.get_session() as session:
         selection = database_handler.create_system_time_request(session, models.Selection, {"id":selection_id}, one_result=True)
-        return utils.download_file(selection.selection_file, selection.selection_file_name)
+        return utils.download_file(selection.selection_file, selection.selection_file_name, mimetype='audio/wav')
 
 @routes_selection.route('/selection/<selection_id>/view', methods=['GET'])
 @login_required
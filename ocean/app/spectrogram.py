@@ -0,0 +1,232 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Render the spectrogram (and contour) plot of a selection to a PNG. There are two
+renderers (see `RENDERERS`):
+
+- `matplotlib`: the original figure, drawn with `librosa.display.specshow()`
+- `pillow`: maps the spectrogram through a colormap lookup table straight into an
+  image buffer and draws the axes with Pillow, which is considerably faster
+
+Both renderers only use objects local to the call (the matplotlib renderer uses the
+object-oriented API rather than the global pyplot state), so they are safe to call
+from concurrent requests.
+"""
+
+# Standard library imports
+import io
+import typing
+
+# Third-party imports
+import librosa
+import librosa.display
+import matplotlib
+import matplotlib.figure
+import matplotlib.ticker as ticker
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Local application imports
+from . import exception_handler
+
+RENDERERS = ('matplotlib', 'pillow')
+DEFAULT_RENDERER = 'matplotlib'
+COLORMAP = 'inferno'
+# Frequencies above this are not shown
+MAX_FREQUENCY = 20000
+
+# The colour of each of the 256 levels of the colormap (as RGB bytes)
+COLORMAP_LUT = matplotlib.colormaps[COLORMAP](np.linspace(0, 1, 256), bytes=True)[:, :3]
+
+# The layout of the Pillow renderer (in pixels)
+_PANEL_WIDTH = 1400
+_PANEL_HEIGHT = 460
+_MARGIN_LEFT = 120
+_MARGIN_RIGHT = 40
+_MARGIN_TOP = 80
+_MARGIN_BOTTOM = 80
+_TICK_LENGTH = 8
+_CONTOUR_COLOUR = (31, 119, 180)
+
+
+class Contour(typing.NamedTuple):
+    """The contour to plot alongside the spectrogram: the time of each point in
+    milliseconds (relative to the first point) and the peak frequency in Hz."""
+    time_milliseconds: np.ndarray
+    peak_frequency: np.ndarray
+
+
+def stft_parameters(sampling_rate: int, bin_width: float = 25) -> tuple:
+    """The STFT window size (a power of two spanning around `bin_width` milliseconds) and
+    hop size (75% overlap) used to plot audio sampled at `sampling_rate` Hz."""
+    window_size = 2 ** int(round(np.log2((bin_width / 1000) * sampling_rate)))
+    hop_size = window_size // 4  # 75% overlap
+    return window_size, hop_size
+
+def compute_spectrogram(audio: np.ndarray, window_size: int, hop_size: int) -> np.ndarray:
+    """Calculate the spectrogram of `audio` in decibels relative to its maximum."""
+    spectrogram = librosa.stft(audio, n_fft=window_size, hop_length=hop_size)
+    return librosa.amplitude_to_db(np.abs(spectrogram), ref=np.max)
+
+def check_renderer(renderer: str) -> str:
+    if renderer not in RENDERERS:
+        raise exception_handler.WarningException(f"Unknown plot renderer '{renderer}' (must be one of {', '.join(RENDERERS)}).")
+    return renderer
+
+def render(renderer: str, spectrogram_db: np.ndarray, sampling_rate: int, hop_size: int, title: str, contour: Contour = None) -> bytes:
+    """
+    Render a spectrogram (see `compute_spectrogram()`) and optionally its contour to a PNG.
+
+    Args:
+        renderer (str): The renderer to use (one of `RENDERERS`).
+        spectrogram_db (np.ndarray): The spectrogram in decibels (frequency bins by frames).
+        sampling_rate (int): The sampling rate of the audio in Hz.
+        hop_size (int): The number of samples between frames.
+        title (str): The title of the plot.
+        contour (Contour): The contour to plot in a second panel (if given).
+
+    Returns:
+        bytes: The PNG image.
+    """
+    check_renderer(renderer)
+    if renderer == 'pillow':
+        return _render_pillow(spectrogram_db, sampling_rate, hop_size, title, contour)
+    return _render_matplotlib(spectrogram_db, sampling_rate, hop_size, title, contour)
+
+
+def _render_matplotlib(spectrogram_db: np.ndarray, sampling_rate: int, hop_size: int, title: str, contour: Contour = None) -> bytes:
+    # Set x-axis labels in milliseconds
+    def format_ms(x, pos):
+        """Convert x axis labels from seconds to milliseconds"""
+        return f"{x*1000:.0f}"
+
+    # If there is no contour file, create just one subplot (spectrogram only)
+    # If there is a contour file, create two subplots (spectrogram and contour)
+    fig = matplotlib.figure.Figure(figsize=(30, 10) if contour else (30, 5))
+    axs = fig.subplots(1, 2 if contour else 1)
+    spectogram_axs = axs[0] if contour else axs
+    contour_axs = axs[1] if contour else None
+
+    # Plot the spectrogram
+    librosa.display.specshow(spectrogram_db, ax=spectogram_axs, sr=sampling_rate, hop_length=hop_size, cmap=COLORMAP, x_axis='time', y_axis='hz')
+    spectogram_axs.set_xlabel(f'Time (ms)', fontsize=20)
+    spectogram_axs.set_ylabel('Frequency (Hz)', fontsize=20)
+    spectogram_axs.tick_params(axis='both', labelsize=14)
+    spectrogram_y_min = spectogram_axs.get_ylim()[0]
+    sprectrogram_y_max = spectogram_axs.get_ylim()[1] if spectogram_axs.get_ylim()[1] < MAX_FREQUENCY else MAX_FREQUENCY
+    spectogram_axs.set_xlim(0)
+    spectogram_axs.set_ylim(spectrogram_y_min, sprectrogram_y_max)
+    spectogram_axs.xaxis.set_major_formatter(ticker.FuncFormatter(format_ms))
+    spectrogram_x_min, spectrogram_x_max = [x * 1000 for x in spectogram_axs.get_xlim()]
+
+    # Plot the contour if it exists
+    if contour_axs:
+        contour_axs.plot(contour.time_milliseconds, contour.peak_frequency)
+        contour_axs.set_xlabel('Time (ms)', fontsize=20)
+        contour_axs.set_ylabel('Frequency (Hz)', fontsize=20)
+        contour_axs.tick_params(axis='both', labelsize=14)
+        contour_axs.set_ylim(spectrogram_y_min, sprectrogram_y_max)
+        contour_axs.set_xlim(spectrogram_x_min, spectrogram_x_max)
+
+    fig.suptitle(title, fontsize=26)
+
+    # Layout so plots do not overlap
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    return buf.getvalue()
+
+
+def _nice_ticks(low: float, high: float, target: int = 8) -> np.ndarray:
+    """Evenly spaced tick values between `low` and `high` at a step of 1, 2 or 5 times a
+    power of ten, giving around `target` ticks."""
+    if high <= low: return np.array([low])
+    step = (high - low) / target
+    magnitude = 10 ** np.floor(np.log10(step))
+    step = min((m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= step), default=10 * magnitude)
+    ticks = np.arange(np.ceil(low / step) * step, high + step / 1e6, step)
+    return ticks[(ticks >= low) & (ticks <= high)]
+
+def _format_tick(value: float) -> str:
+    return f"{value:.0f}"
+
+def _draw_axes(image: Image.Image, draw: ImageDraw.ImageDraw, box: tuple, x_range: tuple, y_range: tuple, font: ImageFont.FreeTypeFont, label_font: ImageFont.FreeTypeFont):
+    """Draw the frame, ticks, tick labels and axis labels of a panel whose plot area is
+    `box` (left, top, right, bottom) showing `x_range` (ms) by `y_range` (Hz)."""
+    left, top, right, bottom = box
+    draw.rectangle(box, outline='black', width=1)
+    for value in _nice_ticks(*x_range):
+        x = left + (value - x_range[0]) / (x_range[1] - x_range[0]) * (right - left) if x_range[1] > x_range[0] else left
+        draw.line([(x, bottom), (x, bottom + _TICK_LENGTH)], fill='black')
+        draw.text((x, bottom + _TICK_LENGTH + 2), _format_tick(value), fill='black', font=font, anchor='mt')
+    for value in _nice_ticks(*y_range):
+        y = bottom - (value - y_range[0]) / (y_range[1] - y_range[0]) * (bottom - top) if y_range[1] > y_range[0] else bottom
+        draw.line([(left - _TICK_LENGTH, y), (left, y)], fill='black')
+        draw.text((left - _TICK_LENGTH - 2, y), _format_tick(value), fill='black', font=font, anchor='rm')
+    draw.text(((left + right) / 2, bottom + _MARGIN_BOTTOM - 10), 'Time (ms)', fill='black', font=label_font, anchor='md')
+
+    # Pillow cannot draw rotated text, so the y-axis label is drawn and then rotated
+    label_box = label_font.getbbox('Frequency (Hz)')
+    label = Image.new('RGB', (label_box[2] - label_box[0] + 4, label_box[3] - label_box[1] + 4), 'white')
+    ImageDraw.Draw(label).text((2 - label_box[0], 2 - label_box[1]), 'Frequency (Hz)', fill='black', font=label_font)
+    label = label.rotate(90, expand=True)
+    image.paste(label, (left - _MARGIN_LEFT + 4, int((top + bottom - label.height) / 2)))
+
+def _render_pillow(spectrogram_db: np.ndarray, sampling_rate: int, hop_size: int, title: str, contour: Contour = None) -> bytes:
+    num_bins, num_frames = spectrogram_db.shape
+    frequencies = np.linspace(0, sampling_rate / 2, num_bins)
+    max_frequency = min(sampling_rate / 2, MAX_FREQUENCY)
+    x_range = (0, num_frames * hop_size / sampling_rate * 1000)
+    y_range = (0, max_frequency)
+
+    # Map the spectrogram (normalised over all bins, as matplotlib does) through the
+    # colormap, with the highest frequency at the top of the image
+    low, high = np.min(spectrogram_db), np.max(spectrogram_db)
+    scale = 255 / (high - low) if high > low else 0
+    levels = ((spectrogram_db[frequencies <= max_frequency] - low) * scale).astype(np.uint8)
+    spectrogram_image = Image.fromarray(COLORMAP_LUT[levels[::-1]], mode='RGB')
+
+    num_panels = 2 if contour else 1
+    panel_width = _MARGIN_LEFT + _PANEL_WIDTH + _MARGIN_RIGHT
+    image = Image.new('RGB', (panel_width * num_panels, _MARGIN_TOP + _PANEL_HEIGHT + _MARGIN_BOTTOM), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=16)
+    label_font = ImageFont.load_default(size=22)
+    draw.text((image.width / 2, _MARGIN_TOP / 2), title, fill='black', font=ImageFont.load_default(size=26), anchor='mm')
+
+    spectrogram_box = (_MARGIN_LEFT, _MARGIN_TOP, _MARGIN_LEFT + _PANEL_WIDTH, _MARGIN_TOP + _PANEL_HEIGHT)
+    image.paste(spectrogram_image.resize((_PANEL_WIDTH, _PANEL_HEIGHT), resample=Image.Resampling.BOX), spectrogram_box[:2])
+    _draw_axes(image, draw, spectrogram_box, x_range, y_range, font, label_font)
+
+    if contour:
+        left = panel_width + _MARGIN_LEFT
+        contour_box = (left, _MARGIN_TOP, left + _PANEL_WIDTH, _MARGIN_TOP + _PANEL_HEIGHT)
+        x = (np.asarray(contour.time_milliseconds, dtype=np.float64) - x_range[0]) / (x_range[1] - x_range[0]) * _PANEL_WIDTH
+        y = _PANEL_HEIGHT - (np.asarray(contour.peak_frequency, dtype=np.float64) - y_range[0]) / (y_range[1] - y_range[0]) * _PANEL_HEIGHT
+        # The contour is drawn onto its own layer the size of the panel, which clips it
+        # to the axis limits (as matplotlib does)
+        contour_layer = Image.new('RGBA', (_PANEL_WIDTH, _PANEL_HEIGHT), (0, 0, 0, 0))
+        ImageDraw.Draw(contour_layer).line(list(zip(x.tolist(), y.tolist())), fill=_CONTOUR_COLOUR, width=2)
+        image.paste(contour_layer, contour_box[:2], contour_layer)
+        _draw_axes(image, draw, contour_box, x_range, y_range, font, label_font)
+
+    buf = io.BytesIO()
+    # Fast compression, as encoding dominates the rendering time
+    image.save(buf, format='png', compress_level=1)
+    return buf.getvalue()
@@ -0,0 +1,331 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A multi-resolution tile pyramid of the spectrogram of a (potentially hours long)
+recording file, stored in the cache space of the file space (see
+`database_handler.get_cache_space()`) and keyed by the hash of the file.
+
+The pyramid is built by reading the audio (memory mapped, see `audio_io`) in blocks, so
+memory use does not depend on the length of the recording:
+
+- each block is transformed into STFT frames, each frame becoming one column of the
+  finest level, with the frequency bins as rows (lowest frequency at the bottom)
+- magnitudes are converted to decibels relative to full scale and quantised to 256
+  levels over `DB_RANGE` decibels
+- whenever a level has `TILE_SIZE` columns they are written out as PNG tiles
+  (coloured with `spectrogram.COLORMAP`) and reduced by taking the maximum of each 2x2
+  block (2x1 once a level is only one tile high) into the columns of the next level
+
+Level 0 is the coarsest (the whole recording fits in one tile) and each level has
+twice the time resolution of the one before it. Tiles are addressed by `(level, x, y)`
+with `y = 0` at the top (highest frequencies). Tiles at the right edge of a level may
+be narrower than `TILE_SIZE`. The layout of a pyramid is described by its metadata (see
+`build()`).
+
+A background build which fails leaves a failure marker next to the pyramid, and the
+pyramid is not built again until `RETRY_SECONDS` later, doubling with every consecutive
+failure (see `get_failure()`).
+"""
+
+# Standard library imports
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import typing
+
+# Third-party imports
+import numpy as np
+from PIL import Image
+
+# Local application imports
+from . import audio_io
+from . import background_worker
+from . import database_handler
+from . import exception_handler
+from . import spectrogram
+from .logger import logger
+
+CACHE_NAME = 'spectrogram_tiles'
+# The version of the tile format. This MUST be incremented whenever a change is made
+# that alters the tiles, as it invalidates all cached pyramids.
+TILE_VERSION = 1
+TILE_SIZE = 256
+# The range of decibels (below full scale) represented by the colours of a tile
+DB_RANGE = 100
+METADATA_FILE = 'metadata.json'
+# The number of STFT frames calculated at once
+FRAMES_PER_BLOCK = 1024
+# The time (in seconds) after which a failed build is retried, which doubles with every
+# consecutive failure up to `MAX_RETRY_SECONDS`
+RETRY_SECONDS = 60
+MAX_RETRY_SECONDS = 24 * 60 * 60
+
+# The hashes of the files whose pyramids are being built (by this process)
+_building = set()
+_building_lock = threading.Lock()
+
+
+def _get_version_directory(version: int = None) -> str:
+    version = TILE_VERSION if version is None else version
+    return os.path.join(database_handler.get_cache_space(), CACHE_NAME, f"v{version}")
+
+def _get_pyramid_directory(file_hash: bytes) -> str:
+    return os.path.join(_get_version_directory(), file_hash.hex())
+
+def _get_failure_path(file_hash: bytes) -> str:
+    return os.path.join(_get_version_directory(), f"{file_hash.hex()}.failed.json")
+
+def get_tile_path(file_hash: bytes, level: int, x: int, y: int) -> str:
+    return os.path.join(_get_pyramid_directory(file_hash), str(level), f"{x}_{y}.png")
+
+def get_metadata(file_hash: bytes) -> typing.Optional[dict]:
+    """The metadata of the pyramid of the file with the hash `file_hash`, or `None` if
+    it has not been built."""
+    if file_hash is None: return None
+    try:
+        with open(os.path.join(_get_pyramid_directory(file_hash), METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def get_tile(file_hash: bytes, level: int, x: int, y: int) -> typing.Optional[str]:
+    """The path of a tile, or `None` if the tile (or its pyramid) does not exist."""
+    if file_hash is None: return None
+    path = get_tile_path(file_hash, level, x, y)
+    return path if os.path.exists(path) else None
+
+
+def _num_levels(num_frames: int) -> int:
+    return 1 + max(0, math.ceil(math.log2(max(num_frames, 1) / TILE_SIZE)))
+
+def _reduce(columns: np.ndarray, reduce_rows: bool) -> np.ndarray:
+    """Halve the number of columns (and rows, if `reduce_rows`) of `columns` by taking
+    the maximum of each pair. A trailing odd column is kept as it is."""
+    if columns.shape[1] % 2:
+        columns = np.concatenate([columns, columns[:, -1:]], axis=1)
+    columns = np.maximum(columns[:, 0::2], columns[:, 1::2])
+    if reduce_rows:
+        columns = np.maximum(columns[0::2], columns[1::2])
+    return columns
+
+
+class _LevelWriter:
+    """Accumulates the columns of one level of the pyramid, writing them out as tiles
+    and passing them (reduced) to the next coarser level."""
+
+    def __init__(self, directory: str, level: int, height: int, next_level: '_LevelWriter' = None):
+        self.directory = os.path.join(directory, str(level))
+        self.level = level
+        self.height = height
+        self.tile_height = min(TILE_SIZE, height)
+        self.next_level = next_level
+        self.width = 0
+        self._buffer = []
+        self._buffered = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, columns: np.ndarray) -> None:
+        while columns.shape[1]:
+            take = min(TILE_SIZE - self._buffered, columns.shape[1])
+            self._buffer.append(columns[:, :take])
+            self._buffered += take
+            columns = columns[:, take:]
+            if self._buffered == TILE_SIZE:
+                self._flush_tile()
+
+    def close(self) -> None:
+        if self._buffered:
+            self._flush_tile()
+        if self.next_level:
+            self.next_level.close()
+
+    def _flush_tile(self) -> None:
+        columns = np.concatenate(self._buffer, axis=1)
+        x = self.width // TILE_SIZE
+        # Image rows run from the highest frequency (top) to the lowest
+        image = spectrogram.COLORMAP_LUT[columns[::-1]]
+        for y in range(self.height // self.tile_height):
+            tile = Image.fromarray(image[y * self.tile_height:(y + 1) * self.tile_height], mode='RGB')
+            tile.save(os.path.join(self.directory, f"{x}_{y}.png"), format='png', compress_level=1)
+        self.width += columns.shape[1]
+        self._buffer = []
+        self._buffered = 0
+        if self.next_level:
+            self.next_level.write(_reduce(columns, reduce_rows=self.height > self.next_level.height))
+
+
+def _stft_blocks(path: str, info: audio_io.WavInfo, window_size: int, hop_size: int) -> typing.Iterator[np.ndarray]:
+    """Yield the quantised STFT columns (frequency bins by frames, as uint8 levels) of the
+    audio file at `path`, reading `FRAMES_PER_BLOCK` frames of audio at a time. Frames
+    are not centred and the Nyquist bin is dropped, so there are `window_size // 2` rows."""
+    window = np.hanning(window_size + 1)[:-1].astype(np.float32)
+    # The magnitude of a full scale sine wave
+    reference = window.sum() / 2
+    samples = audio_io.open_samples(path, info)
+    block_size = hop_size * (FRAMES_PER_BLOCK - 1) + window_size
+    for start in range(0, info.frames, hop_size * FRAMES_PER_BLOCK):
+        audio = audio_io.to_float(samples[start:start + block_size], info).mean(axis=1)
+        if len(audio) < window_size: break
+        frames = np.lib.stride_tricks.sliding_window_view(audio, window_size)[::hop_size]
+        magnitude = np.abs(np.fft.rfft(frames * window, axis=1))[:, :window_size // 2].T
+        decibels = 20 * np.log10(np.maximum(magnitude / reference, 1e-10))
+        yield (np.clip(decibels / DB_RANGE + 1, 0, 1) * 255).astype(np.uint8)
+
+
+def build(file_hash: bytes, path: str) -> dict:
+    """
+    Build (or rebuild) the pyramid of the audio file at `path` with the hash `file_hash`.
+    The pyramid is built in a temporary directory and moved into place once complete, so
+    a partially built pyramid is never served.
+
+    Returns:
+        dict: The metadata of the pyramid, with the STFT parameters, the duration and
+        maximum frequency of the recording, `tile_size`, `db_range` and for each level
+        (coarsest first) its `width` and `height` in pixels, the number of tiles
+        (`x_tiles` and `y_tiles`) and the `seconds_per_pixel`.
+    """
+    if file_hash is None: raise exception_handler.WarningException("Cannot build spectrogram tiles of a file without a hash.")
+    info = audio_io.read_info(path)
+    sampling_rate = info.sampling_rate
+    window_size, hop_size = spectrogram.stft_parameters(sampling_rate)
+    num_frames = max(0, (info.frames - window_size) // hop_size + 1)
+    if num_frames == 0: raise exception_handler.WarningException("Recording is too short to build spectrogram tiles.")
+    num_levels = _num_levels(num_frames)
+
+    os.makedirs(_get_version_directory(), exist_ok=True)
+    directory = tempfile.mkdtemp(dir=_get_version_directory(), prefix='.build-')
+    try:
+        # Writers are created from the coarsest level to the finest
+        writers = []
+        height = window_size // 2
+        heights = [height]
+        for _ in range(num_levels - 1):
+            heights.append(heights[-1] // 2 if heights[-1] > TILE_SIZE else heights[-1])
+        next_level = None
+        for level, level_height in enumerate(reversed(heights)):
+            next_level = _LevelWriter(directory, level, level_height, next_level)
+            writers.append(next_level)
+        for columns in _stft_blocks(path, info, window_size, hop_size):
+            writers[-1].write(columns)
+        writers[-1].close()
+
+        metadata = {
+            'version': TILE_VERSION,
+            'sampling_rate': sampling_rate,
+            'window_size': window_size,
+            'hop_size': hop_size,
+            'frames': num_frames,
+            'duration': info.frames / sampling_rate,
+            'max_frequency': sampling_rate / 2,
+            'tile_size': TILE_SIZE,
+            'db_range': DB_RANGE,
+            'levels': [{
+                'level': writer.level,
+                'width': writer.width,
+                'height': writer.height,
+                'x_tiles': math.ceil(writer.width / TILE_SIZE),
+                'y_tiles': writer.height // writer.tile_height,
+                'seconds_per_pixel': hop_size * 2 ** (num_levels - 1 - writer.level) / sampling_rate,
+            } for writer in writers],
+        }
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f)
+
+        destination = _get_pyramid_directory(file_hash)
+        shutil.rmtree(destination, ignore_errors=True)
+        os.replace(directory, destination)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    invalidate_stale_versions()
+    return metadata
+
+def is_building(file_hash: bytes) -> bool:
+    with _building_lock:
+        return file_hash in _building
+
+def _read_failure(file_hash: bytes) -> typing.Optional[dict]:
+    try:
+        with open(_get_failure_path(file_hash)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def get_failure(file_hash: bytes) -> typing.Optional[dict]:
+    """The failure of the last build of the pyramid of the file with the hash `file_hash`
+    (with the `error`, the number of consecutive `failures` and the time after which the
+    build is retried as `retry`), or `None` if it has not failed or may be retried."""
+    if file_hash is None: return None
+    failure = _read_failure(file_hash)
+    return failure if failure is not None and time.time() < failure['retry'] else None
+
+def _record_failure(file_hash: bytes, error: str) -> None:
+    previous = _read_failure(file_hash)
+    failures = previous['failures'] + 1 if previous else 1
+    failure = {'error': error, 'failures': failures, 'retry': time.time() + min(RETRY_SECONDS * 2 ** (failures - 1), MAX_RETRY_SECONDS)}
+    os.makedirs(_get_version_directory(), exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=_get_version_directory(), suffix='.json', delete=False) as f:
+        json.dump(failure, f)
+    os.replace(f.name, _get_failure_path(file_hash))
+
+def _build_in_background(file_hash: bytes, path: str) -> None:
+    try:
+        build(file_hash, path)
+    except Exception as e:
+        _record_failure(file_hash, str(e))
+        raise
+    else:
+        if os.path.exists(_get_failure_path(file_hash)): os.remove(_get_failure_path(file_hash))
+    finally:
+        with _building_lock:
+            _building.discard(file_hash)
+
+def request_build(file_hash: bytes, path: str) -> bool:
+    """Build the pyramid of the audio file at `path` with the hash `file_hash` in the
+    background (see `background_worker`), unless it is already being built or its last
+    build failed and is not yet due to be retried (see `get_failure()`). Must be called
+    within an application context. Returns whether the pyramid is being built."""
+    if get_failure(file_hash) is not None: return False
+    with _building_lock:
+        if file_hash in _building: return True
+        _building.add(file_hash)
+    if background_worker.get_pool().submit(f"Build spectrogram tiles of {file_hash.hex()}", _build_in_background, file_hash, path):
+        return True
+    with _building_lock:
+        _building.discard(file_hash)
+    return False
+
+def invalidate(file_hash: bytes) -> None:
+    """Delete the pyramid (and any failure marker) of the file with the hash `file_hash`."""
+    if file_hash is None: return
+    shutil.rmtree(_get_pyramid_directory(file_hash), ignore_errors=True)
+    if os.path.exists(_get_failure_path(file_hash)): os.remove(_get_failure_path(file_hash))
+
+def invalidate_stale_versions() -> None:
+    """Delete the pyramids of all tile versions other than `TILE_VERSION`."""
+    cache_directory = os.path.join(database_handler.get_cache_space(), CACHE_NAME)
+    if not os.path.exists(cache_directory): return
+    current = os.path.basename(_get_version_directory())
+    for name in os.listdir(cache_directory):
+        if name != current:
+            logger.info(f"Deleting stale spectrogram tiles {name}")
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
@@ -0,0 +1,190 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Summary statistics of a one-dimensional array, calculated without constructing a
+`pandas.Series`. The results are identical to those of the equivalent `pandas.Series`
+methods (`min()`, `max()`, `mean()`, `std()`, `median()` and `quantile()` with linear
+interpolation), including their handling of NaN values (which are ignored).
+"""
+
+# Standard library imports
+import math
+import typing
+
+# Third-party imports
+import numpy as np
+
+
+class SummaryStatistics(typing.NamedTuple):
+    count: int
+    min: float
+    max: float
+    mean: float
+    std: float
+    median: float
+    quartile1: float
+    quartile3: float
+
+
+def _quantile_indexes(count: int, q: float) -> tuple:
+    """The indexes of the two values (in sorted order) either side of quantile `q` and
+    the weight given to the second value (as `numpy.percentile()` computes them)."""
+    virtual_index = (count - 1) * q
+    previous_index = math.floor(virtual_index)
+    return previous_index, min(previous_index + 1, count - 1), virtual_index - previous_index
+
+def _lerp(a: float, b: float, t: float) -> float:
+    """Linear interpolation between `a` and `b`, rounded as `numpy.percentile()` does."""
+    diff_b_a = b - a
+    return b - diff_b_a * (1 - t) if t >= 0.5 else a + diff_b_a * t
+
+def summarise(values: np.ndarray, ddof: int = 1) -> SummaryStatistics:
+    """
+    Calculate the summary statistics of `values`. The values are converted to a float64
+    array once, the mean and standard deviation (two-pass, as pandas) are calculated with
+    vectorised sums and all order statistics (minimum, maximum, median and quartiles) come
+    from a single partition of the array.
+
+    Args:
+        values (np.ndarray): A one-dimensional array of values (NaN values are ignored).
+        ddof (int, optional): The delta degrees of freedom of the standard deviation.
+            Defaults to 1 (the sample standard deviation, as pandas).
+
+    Returns:
+        SummaryStatistics: The summary statistics. If there are no values all statistics
+        are NaN, and if there are no more than `ddof` values the standard deviation is NaN.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    nan = np.isnan(values)
+    if nan.any(): values = values[~nan]
+    count = len(values)
+    if count == 0:
+        return SummaryStatistics(0, *([np.nan] * 7))
+
+    mean = values.sum(dtype=np.float64) / np.float64(count)
+    if count - ddof > 0:
+        std = np.sqrt(((mean - values) ** 2).sum(dtype=np.float64) / np.float64(count - ddof))
+    else:
+        std = np.nan
+
+    quartile_indexes = [_quantile_indexes(count, q) for q in (0.25, 0.75)]
+    median_indexes = [count // 2 - 1, count // 2] if count % 2 == 0 else [count // 2]
+    kth = {0, count - 1, *median_indexes}
+    for previous_index, next_index, _ in quartile_indexes:
+        kth.update((previous_index, next_index))
+    partitioned = np.partition(values, sorted(kth))
+
+    if len(median_indexes) == 2:
+        median = (partitioned[median_indexes[0]] + partitioned[median_indexes[1]]) / 2
+    else:
+        median = partitioned[median_indexes[0]]
+    quartile1, quartile3 = (
+        _lerp(partitioned[previous_index], partitioned[next_index], gamma)
+        for previous_index, next_index, gamma in quartile_indexes
+    )
+    return SummaryStatistics(
+        count=count,
+        min=partitioned[0],
+        max=partitioned[-1],
+        mean=mean,
+        std=std,
+        median=median,
+        quartile1=quartile1,
+        quartile3=quartile3
+    )
+
+def segment_argsort(values: np.ndarray, segments: np.ndarray, stable: bool = True) -> np.ndarray:
+    """
+    The indexes which sort `values` within each of their (non-decreasing) `segments`, as
+    `np.lexsort((values, segments))` but several times faster: the values are sorted once
+    and their ranks sorted by segment as a single integer key. Equal values keep their
+    order only if `stable` (a stable sort of floating point values is much slower).
+    """
+    order = np.argsort(values, kind='stable' if stable else None)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return order[np.sort(segments * len(order) + rank) % max(len(order), 1)]
+
+def segment_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Sum each segment `values[starts[i]:ends[i]]` with `np.sum()`. Each segment is summed
+    separately as `np.add.reduceat()` does not round the sums as `np.sum()` (pairwise
+    summation) does, so the sums are identical to those of `summarise()`.
+    """
+    return np.array([values[start:end].sum(dtype=np.float64) for start, end in zip(starts.tolist(), ends.tolist())], dtype=np.float64)
+
+def summarise_segments(values: np.ndarray, offsets: np.ndarray, ddof: int = 1) -> SummaryStatistics:
+    """
+    Calculate the summary statistics of many segments of `values` at once, where segment
+    `i` is made up of the values between `offsets[i]` (inclusive) and `offsets[i+1]`
+    (exclusive). The order statistics of all segments come from a single sort and only
+    the sums (see `segment_sums()`) are calculated per segment, so the results are
+    identical to calling `summarise()` on each segment.
+
+    Args:
+        values (np.ndarray): A one-dimensional array of values, none of which are NaN.
+        offsets (np.ndarray): An array of non-decreasing offsets, starting with 0 and
+            ending with the number of values.
+        ddof (int, optional): The delta degrees of freedom of the standard deviation.
+            Defaults to 1 (the sample standard deviation, as pandas).
+
+    Returns:
+        SummaryStatistics: The summary statistics, with an array of one value per segment
+        in place of each statistic. The statistics of empty segments are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts, ends = offsets[:-1], offsets[1:]
+    counts = ends - starts
+    if len(values) == 0:
+        return SummaryStatistics(counts, *(np.full(len(counts), np.nan) for _ in range(7)))
+    segments = np.repeat(np.arange(len(counts)), counts)
+    empty = counts == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = segment_sums(values, starts, ends) / counts
+        std = np.sqrt(segment_sums((mean[segments] - values) ** 2, starts, ends) / (counts - ddof))
+    std[counts - ddof <= 0] = np.nan
+    mean[empty] = np.nan
+
+    # Sorting by value within each segment puts the order statistics of segment `i` at
+    # `starts[i] + k` (the indexes of empty segments are clipped and their results discarded)
+    ordered = values[segment_argsort(values, segments, stable=False)]
+    def order_statistic(index):
+        return np.where(empty, np.nan, ordered[np.clip(starts + index, 0, len(ordered) - 1)])
+    middle = counts // 2
+    median = np.where(counts % 2 == 0, (order_statistic(middle - 1) + order_statistic(middle)) / 2, order_statistic(middle))
+    quartiles = []
+    for q in (0.25, 0.75):
+        # As `_quantile_indexes()` and `_lerp()`
+        virtual_index = (counts - 1) * q
+        previous_index = np.floor(virtual_index).astype(np.int64)
+        next_index = np.minimum(previous_index + 1, counts - 1)
+        gamma = virtual_index - previous_index
+        a, b = order_statistic(previous_index), order_statistic(next_index)
+        diff_b_a = b - a
+        quartiles.append(np.where(gamma >= 0.5, b - diff_b_a * (1 - gamma), a + diff_b_a * gamma))
+    return SummaryStatistics(
+        count=counts,
+        min=order_statistic(0),
+        max=order_statistic(counts - 1),
+        mean=mean,
+        std=std,
+        median=median,
+        quartile1=quartiles[0],
+        quartile3=quartiles[1]
+    )
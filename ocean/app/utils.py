@@ -28,6 +28,9 @@ import shutil, zipfile, flask
 # Local application imports
 from . import exception_handler
 from . import database_handler
+from . import response_handler
+from . import zip_stream
+from .logger import logger
 
 
 def parse_filename(filename: str):
@@ -50,61 +53,69 @@ def extract_selection_number(source: str) -> str | None:
 
 def stream_zip_file(generator, zip_filename):
     """
-    Streams a zip file as a Flask response from a generator of file-like objects and file names.
+    Streams a zip file as a Flask response from file contents and file names. The zip file is
+    written as it is sent (see `zip_stream`), and the contents of each file are only produced
+    when the file is reached, so the zip file is never held in memory.
 
-    :param generator: A generator of tuples of (file_like_object, file_name) to be added to the zip file
+    Any file whose contents cannot be produced is replaced with a text entry explaining why.
+
+    :param generator: An iterable (or a function returning one) of tuples of (contents, file_name),
+        where contents is a file-like object, bytes, or a function returning either
     :param zip_filename: The name of the zip file that will be sent
-    :return: A Flask Response object containing the zip file
+    :return: A Flask Response object streaming the zip file
     """
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-        for file_stream, file_name in generator():
-            zip_file.writestr(file_name, file_stream.read())
-    zip_buffer.seek(0)
-    return send_file(zip_buffer, as_attachment=True, download_name=zip_filename)
-    
+    entries = generator() if callable(generator) else generator
+
+    def members():
+        for contents, file_name in entries:
+            try:
+                if callable(contents): contents = contents()
+                if contents is None: raise exception_handler.WarningException(f"The file {file_name} could not be generated.")
+                yield zip_stream.ZipMember(file_name, contents if isinstance(contents, bytes) else contents.read())
+            except Exception as e:
+                logger.warning(f"Unable to add {file_name} to {zip_filename}: {e}")
+                yield zip_stream.ZipMember(f"ERROR_{secure_filename(file_name)}.txt", f"The file {file_name} could not be generated: {e}".encode())
+
+    return _zip_response(members(), zip_filename)
 
 def download_files(file_objects, file_names, zip_filename):
     """
-    Creates and streams a zip file from the given list of file paths.
+    Streams a zip file of the given files. Each file is read from the file space in chunks
+    as it is written to the zip file (see `zip_stream`), so memory use does not depend on
+    the size of the files.
+
+    Any file that does not exist or whose hash does not match is replaced with a text entry
+    explaining why.
 
-    :param file_paths: A list of file paths to add to the zip file.
-    :type file_paths: list
+    :param file_objects: A list of File objects to add to the zip file.
+    :type file_objects: list
+    :param file_names: A list of names (without extension) to use for the files in the zip file.
+    :type file_names: list
     :param zip_filename: The name of the zip file to create.
     :type zip_filename: str
-    :return: A response object containing the zip file.
+    :return: A response object streaming the zip file.
     :rtype: flask.Response
     """
-    def generate():
-        """
-        A generator function that streams the zip file contents.
-        """
-        zip_buffer = io.BytesIO()
-
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for file_object, file_name in zip(file_objects, file_names):
-                # If the file does not exist, create a text entry explaining it
-                if not os.path.exists(file_object._path_with_root):
-                    error_message = f"The file {file_name} was not found."
-                    zipf.writestr(f"ERROR_{secure_filename(file_name)}.txt", error_message)
-                    continue
-                binary = file_object.get_binary()
-                if not file_object.verify_hash():
-                    # If the hash does not match, create a text entry explaining the mismatch
-                    error_message = f"The hash for {file_name} does not match."
-                    zipf.writestr(f"ERROR_{secure_filename(file_name)}.txt", error_message)
-                    continue
-                # Secure the filename for zip entry
-                zipf.writestr(secure_filename(file_name + "." + file_object.extension), binary)
-        
-        # Move the cursor to the start of the BytesIO object to begin streaming
-        zip_buffer.seek(0)
-
-        while chunk := zip_buffer.read(1024 * 1024):  # Read in 1MB chunks
-            yield chunk
-
-    return flask.Response(generate(), 
-                          mimetype='application/zip', 
+    def members():
+        for file_object, file_name in zip(file_objects, file_names):
+            # If the file does not exist, create a text entry explaining it
+            if not os.path.exists(file_object._path_with_root):
+                error_message = f"The file {file_name} was not found."
+                yield zip_stream.ZipMember(f"ERROR_{secure_filename(file_name)}.txt", error_message.encode())
+                continue
+            if not file_object.verify_hash():
+                # If the hash does not match, create a text entry explaining the mismatch
+                error_message = f"The hash for {file_name} does not match."
+                yield zip_stream.ZipMember(f"ERROR_{secure_filename(file_name)}.txt", error_message.encode())
+                continue
+            # Secure the filename for zip entry
+            yield zip_stream.ZipMember(secure_filename(file_name + "." + file_object.extension), file_object._path_with_root)
+
+    return _zip_response(members(), zip_filename)
+
+def _zip_response(members, zip_filename):
+    return flask.Response(flask.stream_with_context(zip_stream.stream(members)),
+                          mimetype='application/zip',
                           headers={'Content-Disposition': f'attachment; filename={zip_filename}'})
 
 # def zip_and_download_files(file_paths, zip_filename):
@@ -157,15 +168,12 @@ def download_file_from_path(path, deleted):
     root = database_handler.get_deleted_space() if deleted else database_handler.get_data_space()
     full_path = os.path.join(root, path)
     if os.path.exists(full_path):
-        binary_content = open(full_path, 'rb').read()
-        # Create an in-memory binary stream
-        file_stream = io.BytesIO(binary_content)
-
-        # Send the file stream as an attachment
+        # Send the file as an attachment, streamed from disk
         response = flask.send_file(
-            file_stream,
+            full_path,
             as_attachment=True,
             download_name=secure_filename(os.path.basename(full_path)),  # Custom download filename
+            conditional=True,
         )
 
         return response
@@ -181,24 +189,40 @@ def download_file(file_obj, filename=None, mimetype='application/octet-stream'):
     Takes a file object and sends the file to the user. If the file is to be downloaded
     with a custom name, set `filename`. If the file is to be downloaded with the same
     name as the original, set `filename` to None (default).
+
+    The file is streamed from disk (using `sendfile` where the WSGI server supports it,
+    or by the web server if `USE_X_SENDFILE` is configured) and `Range` requests are
+    answered with the requested part of the file, so downloads can be resumed and audio
+    can be seeked without sending the whole file.
     """
     # Generate a custom filename for the download
     custom_filename = filename if filename else file_obj.filename
     if not custom_filename.endswith(file_obj.extension):
         custom_filename = f"{custom_filename}.{file_obj.extension}"
 
+    # The stored hash is a strong ETag of the file, so a client which already has the file
+    # is answered without reading (or verifying) it
+    not_modified = response_handler.not_modified(file_obj.hash_hex, file_obj.upload_datetime, policy='file')
+    if not_modified: return not_modified
+
     # Calculate the SHA-256 hash of the file content
-    # Compare it to the hash stored in the database
-    if not file_obj.verify_hash(): raise exception_handler.WarningException("File hash mismatch. Unable to download file.")
+    # Compare it to the hash stored in the database. This is only done for whole downloads,
+    # as every part of a ranged (e.g. resumed or seeking) download would read the whole file
+    if flask.request.range is None and not file_obj.verify_hash(): raise exception_handler.WarningException("File hash mismatch. Unable to download file.")
 
     # Send the file as an attachment and stream it
-    return send_file(
+    response = send_file(
         os.path.abspath(file_obj._path_with_root),  # File path
         as_attachment=True,
         download_name=secure_filename(custom_filename),  # Safe filename
         mimetype=mimetype,  # MIME type for binary files
         conditional=True,
+        etag=file_obj.hash_hex or True,
+        last_modified=file_obj.upload_datetime,
     )
+    # Advertise ranges on whole responses too (browsers only seek audio if they are)
+    response.accept_ranges = 'bytes'
+    return response_handler.set_caching(response, policy='file')
 
 def validate_boolean(value: bool | str, field: str, allow_none: bool = False):
     """
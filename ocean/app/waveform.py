@@ -0,0 +1,226 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Precomputed waveform envelopes of audio files, so a waveform overview of any part of
+a (potentially hours long) file can be drawn without decoding it.
+
+An envelope holds the minimum and maximum sample (over all channels, as `int16` pairs
+scaled from [-1, 1)) of every `samples_per_pixel` frames of the file, at each of
+`SAMPLES_PER_PIXEL`. Envelopes are built in the background (see `request_build()`) when
+a WAV file is inserted, or when the envelope of a file inserted before envelopes were
+stored is first requested, and stored as one `.npy` file per level in the cache space
+of the file space (see `database_handler.get_cache_space()`), keyed by the hash of the
+file, so slices are read through a memory map (see `get_slice()`).
+"""
+
+# Standard library imports
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import typing
+
+# Third-party imports
+import numpy as np
+
+# Local application imports
+from . import audio_io
+from . import background_worker
+from . import database_handler
+from . import exception_handler
+from .logger import logger
+
+CACHE_NAME = 'waveforms'
+# The version of the envelope format. This MUST be incremented whenever a change is made
+# that alters the envelopes, as it invalidates all stored envelopes.
+ENVELOPE_VERSION = 1
+# The frames per pair of each level, finest first (each level is 4 times coarser)
+SAMPLES_PER_PIXEL = (256, 1024, 4096, 16384, 65536, 262144)
+METADATA_FILE = 'metadata.json'
+# The number of pairs of the finest level calculated at once
+PAIRS_PER_BLOCK = 4096
+# The largest number of pixels that can be requested from `get_slice()`
+MAX_PIXELS = 10000
+
+# The hashes of the files whose envelopes are being built (by this process)
+_building = set()
+_building_lock = threading.Lock()
+
+
+def _get_version_directory(version: int = None) -> str:
+    version = ENVELOPE_VERSION if version is None else version
+    return os.path.join(database_handler.get_cache_space(), CACHE_NAME, f"v{version}")
+
+def _get_envelope_directory(file_hash: bytes) -> str:
+    return os.path.join(_get_version_directory(), file_hash.hex())
+
+def _get_level_path(directory: str, samples_per_pixel: int) -> str:
+    return os.path.join(directory, f"{samples_per_pixel}.npy")
+
+def get_metadata(file_hash: bytes) -> typing.Optional[dict]:
+    """The metadata of the envelope of the file with the hash `file_hash` (see `build()`),
+    or `None` if it has not been built."""
+    if file_hash is None: return None
+    try:
+        with open(os.path.join(_get_envelope_directory(file_hash), METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _quantise(values: np.ndarray) -> np.ndarray:
+    return np.clip(np.round(values * 32767), -32768, 32767).astype(np.int16)
+
+def _pad(values: np.ndarray, multiple: int) -> np.ndarray:
+    """Pad `values` to a multiple of `multiple` by repeating the last value."""
+    pad = -len(values) % multiple
+    return np.concatenate([values, np.repeat(values[-1:], pad, axis=0)]) if pad else values
+
+def _reduce(envelope: np.ndarray, factor: int) -> np.ndarray:
+    """Combine every `factor` pairs of `envelope` (a trailing partial group included)."""
+    groups = _pad(envelope, factor).reshape(-1, factor, 2)
+    return np.stack([groups[:, :, 0].min(axis=1), groups[:, :, 1].max(axis=1)], axis=1)
+
+def _finest_level(path: str, info: audio_io.WavInfo) -> np.ndarray:
+    samples = audio_io.open_samples(path, info)
+    samples_per_pixel = SAMPLES_PER_PIXEL[0]
+    block_size = samples_per_pixel * PAIRS_PER_BLOCK
+    blocks = []
+    for start in range(0, info.frames, block_size):
+        block = audio_io.to_float(samples[start:start + block_size], info)
+        minimum = _pad(block.min(axis=1), samples_per_pixel).reshape(-1, samples_per_pixel).min(axis=1)
+        maximum = _pad(block.max(axis=1), samples_per_pixel).reshape(-1, samples_per_pixel).max(axis=1)
+        blocks.append(_quantise(np.stack([minimum, maximum], axis=1)))
+    return np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int16)
+
+def build(file_hash: bytes, path: str) -> dict:
+    """
+    Build (or rebuild) the envelope of the WAV file at `path` with the hash `file_hash`.
+    Levels coarser than the whole file are not stored. The envelope is built in a
+    temporary directory and moved into place once complete.
+
+    Returns:
+        dict: The metadata of the envelope, with the `sampling_rate`, `frames` and
+        `duration` of the file and the `samples_per_pixel` of each level stored.
+    """
+    if file_hash is None: raise exception_handler.WarningException("Cannot build the waveform of a file without a hash.")
+    info = audio_io.read_info(path)
+    envelope = _finest_level(path, info)
+    levels = {SAMPLES_PER_PIXEL[0]: envelope}
+    for finer, coarser in zip(SAMPLES_PER_PIXEL, SAMPLES_PER_PIXEL[1:]):
+        if coarser > info.frames: break
+        envelope = _reduce(envelope, coarser // finer)
+        levels[coarser] = envelope
+
+    os.makedirs(_get_version_directory(), exist_ok=True)
+    directory = tempfile.mkdtemp(dir=_get_version_directory(), prefix='.build-')
+    try:
+        for samples_per_pixel, envelope in levels.items():
+            np.save(_get_level_path(directory, samples_per_pixel), envelope)
+        metadata = {
+            'version': ENVELOPE_VERSION,
+            'sampling_rate': info.sampling_rate,
+            'frames': info.frames,
+            'duration': info.duration,
+            'samples_per_pixel': list(levels),
+        }
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f)
+        destination = _get_envelope_directory(file_hash)
+        shutil.rmtree(destination, ignore_errors=True)
+        os.replace(directory, destination)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    invalidate_stale_versions()
+    return metadata
+
+def is_building(file_hash: bytes) -> bool:
+    with _building_lock:
+        return file_hash in _building
+
+def _build_in_background(file_hash: bytes, path: str) -> None:
+    try:
+        if get_metadata(file_hash) is None: build(file_hash, path)
+    finally:
+        with _building_lock:
+            _building.discard(file_hash)
+
+def request_build(file_hash: bytes, path: str) -> bool:
+    """Build the envelope of the WAV file at `path` with the hash `file_hash` in the
+    background (see `background_worker`), unless it is already being built. Must be
+    called within an application context. Returns whether the envelope is being built."""
+    with _building_lock:
+        if file_hash in _building: return True
+        _building.add(file_hash)
+    if background_worker.get_pool().submit(f"Build waveform of {file_hash.hex()}", _build_in_background, file_hash, path):
+        return True
+    with _building_lock:
+        _building.discard(file_hash)
+    return False
+
+def get_slice(file_hash: bytes, start: float = 0, end: float = None, pixels: int = 1000) -> typing.Optional[dict]:
+    """
+    Get the envelope of the file with the hash `file_hash` between `start` and `end`
+    seconds (the end of the file if `None`) at the coarsest level with at least `pixels`
+    pairs in that range (or the finest level if there is none). Returns `None` if the
+    envelope has not been built.
+
+    Returns:
+        dict: The `sampling_rate` and `samples_per_pixel`, the `start` and `end` (in
+        seconds) of the slice, which are aligned to the pairs so may be wider than
+        requested, and the `min` and `max` of each pair as lists of `int16` values.
+    """
+    if not 1 <= pixels <= MAX_PIXELS: raise exception_handler.WarningException(f"The number of pixels must be between 1 and {MAX_PIXELS}.")
+    metadata = get_metadata(file_hash)
+    if metadata is None: return None
+    sampling_rate, frames = metadata['sampling_rate'], metadata['frames']
+    start_frame = min(max(0, int(start * sampling_rate)), frames)
+    end_frame = frames if end is None else min(max(start_frame, math.ceil(end * sampling_rate)), frames)
+
+    samples_per_pixel = metadata['samples_per_pixel'][0]
+    for level in metadata['samples_per_pixel']:
+        if level * pixels <= end_frame - start_frame: samples_per_pixel = level
+    envelope = np.load(_get_level_path(_get_envelope_directory(file_hash), samples_per_pixel), mmap_mode='r')
+    first, last = start_frame // samples_per_pixel, math.ceil(end_frame / samples_per_pixel)
+    peaks = np.asarray(envelope[first:last])
+    return {
+        'sampling_rate': sampling_rate,
+        'samples_per_pixel': samples_per_pixel,
+        'start': first * samples_per_pixel / sampling_rate,
+        'end': min(last * samples_per_pixel, frames) / sampling_rate,
+        'min': peaks[:, 0].tolist(),
+        'max': peaks[:, 1].tolist(),
+    }
+
+def invalidate(file_hash: bytes) -> None:
+    """Delete the envelope of the file with the hash `file_hash`."""
+    if file_hash is None: return
+    shutil.rmtree(_get_envelope_directory(file_hash), ignore_errors=True)
+
+def invalidate_stale_versions() -> None:
+    """Delete the envelopes of all envelope versions other than `ENVELOPE_VERSION`."""
+    cache_directory = os.path.join(database_handler.get_cache_space(), CACHE_NAME)
+    if not os.path.exists(cache_directory): return
+    current = os.path.basename(_get_version_directory())
+    for name in os.listdir(cache_directory):
+        if name != current:
+            logger.info(f"Deleting stale waveforms {name}")
+            shutil.rmtree(os.path.join(cache_directory, name), ignore_errors=True)
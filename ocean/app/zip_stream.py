@@ -0,0 +1,191 @@
+# Copyright (c) 2024
+#
+# This file is part of OCEAN.
+#
+# OCEAN is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OCEAN is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OCEAN.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A ZIP archive writer that yields the archive as it is written, so an archive of any
+size can be sent in constant memory (see `utils.download_files()`).
+
+Each member is written as a local header, its (compressed) data read in chunks of
+`CHUNK_SIZE` and a data descriptor holding the CRC-32 and sizes calculated while
+the data was read, so no member is read more than once and nothing is seeked back
+over. The central directory is written once all members have been. ZIP64 records
+are used for members, offsets and archives too large for the original format.
+
+Members whose extension is in `STORED_EXTENSIONS` (audio and other formats that do
+not compress) are stored, all others (such as CSV and CTR files) are deflated.
+"""
+
+# Standard library imports
+import datetime
+import os
+import struct
+import time
+import typing
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+# Extensions of members that are stored rather than deflated
+STORED_EXTENSIONS = {'wav', 'flac', 'mp3', 'ogg', 'png', 'jpg', 'jpeg', 'zip', 'gz'}
+# Sizes and offsets from which ZIP64 records are used, and the number of members from
+# which a ZIP64 end of central directory record is used
+ZIP64_LIMIT = (1 << 32) - 1
+ZIP_MAX_MEMBERS = (1 << 16) - 1
+
+# The values of header fields whose value is in the ZIP64 records instead
+_ZIP64_SIZE = 0xFFFFFFFF
+_ZIP64_COUNT = 0xFFFF
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+# The data descriptor follows the data, and the name is encoded in UTF-8
+_FLAGS = 0x08 | 0x800
+_VERSION = 20
+_VERSION_ZIP64 = 45
+# Created on UNIX, so the external attributes hold the file mode
+_VERSION_MADE_BY = (3 << 8) | _VERSION_ZIP64
+_EXTERNAL_ATTRIBUTES = (0o100644 << 16)
+
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+_DATA_DESCRIPTOR = struct.Struct('<4s3L')
+_DATA_DESCRIPTOR_ZIP64 = struct.Struct('<4sL2Q')
+_CENTRAL_DIRECTORY_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4s4H2LH')
+_ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = struct.Struct('<4sLQL')
+
+
+class ZipMember(typing.NamedTuple):
+    """A member of an archive. The `source` is either the path of a file (which is read in
+    chunks as the member is written) or the data itself. Whether the member is deflated
+    is decided from the extension of `name` if `compress` is `None`."""
+    name: str
+    source: typing.Union[str, bytes]
+    compress: typing.Optional[bool] = None
+    modified: typing.Optional[datetime.datetime] = None
+
+
+class _Entry(typing.NamedTuple):
+    name: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+    zip64: bool
+
+
+def _dos_datetime(timestamp: float) -> typing.Tuple[int, int]:
+    t = time.localtime(timestamp)
+    # DOS dates cannot represent times before 1980
+    if t.tm_year < 1980: return 0, (0 << 9) | (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _is_compressed(member: ZipMember) -> bool:
+    if member.compress is not None: return member.compress
+    return os.path.splitext(member.name)[1].lstrip('.').lower() not in STORED_EXTENSIONS
+
+def _read_chunks(source: typing.Union[str, bytes], chunk_size: int) -> typing.Iterator[bytes]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        for start in range(0, len(source), chunk_size):
+            yield bytes(source[start:start + chunk_size])
+        return
+    with open(source, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+def _source_size(source: typing.Union[str, bytes]) -> int:
+    return len(source) if isinstance(source, (bytes, bytearray, memoryview)) else os.path.getsize(source)
+
+def _zip64_extra(*values: int) -> bytes:
+    return struct.pack(f'<2H{len(values)}Q', 0x0001, 8 * len(values), *values)
+
+
+def stream(members: typing.Iterable[ZipMember], chunk_size: int = CHUNK_SIZE) -> typing.Iterator[bytes]:
+    """
+    Yield a ZIP archive of `members` (an iterable of `ZipMember`, which is consumed
+    lazily so members may be produced as the archive is written) in chunks of at
+    most around `chunk_size` bytes.
+    """
+    entries = []
+    offset = 0
+    for member in members:
+        name = member.name.encode('utf-8')
+        method = ZIP_DEFLATED if _is_compressed(member) else ZIP_STORED
+        if member.modified is not None: timestamp = member.modified.timestamp()
+        elif isinstance(member.source, str): timestamp = os.path.getmtime(member.source)
+        else: timestamp = time.time()
+        dos_time, dos_date = _dos_datetime(timestamp)
+        # Deflating can slightly enlarge incompressible data, hence the margin
+        zip64 = _source_size(member.source) * 1.05 >= ZIP64_LIMIT
+
+        extra = _zip64_extra(0, 0) if zip64 else b''
+        header = _LOCAL_HEADER.pack(b'PK\x03\x04', _VERSION_ZIP64 if zip64 else _VERSION, _FLAGS, method, dos_time, dos_date,
+                                    0, _ZIP64_SIZE if zip64 else 0, _ZIP64_SIZE if zip64 else 0, len(name), len(extra))
+        yield header + name + extra
+        member_offset = offset
+        offset += len(header) + len(name) + len(extra)
+
+        crc, size, compressed_size = 0, 0, 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+        for chunk in _read_chunks(member.source, chunk_size):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor is not None: chunk = compressor.compress(chunk)
+            if chunk:
+                compressed_size += len(chunk)
+                yield chunk
+        if compressor is not None:
+            chunk = compressor.flush()
+            compressed_size += len(chunk)
+            yield chunk
+        if not zip64 and max(size, compressed_size) >= ZIP64_LIMIT:
+            raise ValueError(f"The member {member.name} grew while it was being written.")
+
+        if zip64: descriptor = _DATA_DESCRIPTOR_ZIP64.pack(b'PK\x07\x08', crc, compressed_size, size)
+        else: descriptor = _DATA_DESCRIPTOR.pack(b'PK\x07\x08', crc, compressed_size, size)
+        yield descriptor
+        offset += compressed_size + len(descriptor)
+        entries.append(_Entry(name, method, dos_time, dos_date, crc, compressed_size, size, member_offset, zip64))
+
+    yield from _central_directory(entries, offset)
+
+def _central_directory(entries: typing.List[_Entry], offset: int) -> typing.Iterator[bytes]:
+    size = 0
+    for entry in entries:
+        # The ZIP64 extra field holds (in this order) whichever of the sizes and the
+        # offset do not fit in the header
+        zip64_values = [entry.size, entry.compressed_size] if entry.zip64 else []
+        if entry.offset >= ZIP64_LIMIT: zip64_values.append(entry.offset)
+        extra = _zip64_extra(*zip64_values) if zip64_values else b''
+        header = _CENTRAL_DIRECTORY_HEADER.pack(
+            b'PK\x01\x02', _VERSION_MADE_BY, _VERSION_ZIP64 if zip64_values else _VERSION, _FLAGS, entry.method,
+            entry.dos_time, entry.dos_date, entry.crc,
+            _ZIP64_SIZE if entry.zip64 else entry.compressed_size, _ZIP64_SIZE if entry.zip64 else entry.size,
+            len(entry.name), len(extra), 0, 0, 0, _EXTERNAL_ATTRIBUTES, _ZIP64_SIZE if entry.offset >= ZIP64_LIMIT else entry.offset)
+        yield header + entry.name + extra
+        size += len(header) + len(entry.name) + len(extra)
+
+    count = len(entries)
+    if count >= ZIP_MAX_MEMBERS or size >= ZIP64_LIMIT or offset >= ZIP64_LIMIT:
+        end = _ZIP64_END_OF_CENTRAL_DIRECTORY.pack(b'PK\x06\x06', _ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12,
+                                                   _VERSION_MADE_BY, _VERSION_ZIP64, 0, 0, count, count, size, offset)
+        locator = _ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR.pack(b'PK\x06\x07', 0, offset + size, 1)
+        yield end + locator
+        count, size, offset = _ZIP64_COUNT, _ZIP64_SIZE, _ZIP64_SIZE
+    yield _END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, count, count, size, offset, 0)
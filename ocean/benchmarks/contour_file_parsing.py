@@ -0,0 +1,80 @@
+"""Benchmark parsing contour CSV files with `ContourFileHandler.insert_csv()`
+against the previous pandas path (a full binary read followed by `pd.read_csv()`
+and `ContourFileHandler.insert_dataframe()`). Note that the default pandas float
+conversion is not correctly rounded, so the round-trip column is the like-for-like
+comparison.
+
+Run from the repository root with:
+
+    python -m ocean.benchmarks.contour_file_parsing --rows 1000 10000 100000 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..app import contour_statistics
+
+
+def write_contour_file(path: str, num_rows: int, seed: int = 0):
+    """Write a random contour CSV file with `num_rows` rows to `path`."""
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "Time [ms]": 1029326147450 + np.cumsum(rng.integers(3, 5, num_rows)),
+        " Peak Frequency [Hz]": rng.integers(200, 1000, num_rows) * 36.62109375,
+        " Duty Cycle": rng.random(num_rows) * 0.1,
+        " Energy": rng.random(num_rows),
+        " WindowRMS": rng.random(num_rows) * 0.01,
+    }).to_csv(path, index=False)
+
+
+def parse_pandas(path: str):
+    with open(path, "rb") as f:
+        f.read()
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_dataframe(pd.read_csv(path))
+    return handler
+
+
+def parse_pandas_round_trip(path: str):
+    """As `parse_pandas()` but with correctly rounded float conversion (as `insert_csv()` uses)."""
+    with open(path, "rb") as f:
+        f.read()
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_dataframe(pd.read_csv(path, float_precision="round_trip"))
+    return handler
+
+
+def parse_numpy(path: str):
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_csv(path)
+    return handler
+
+
+def best_time(function, path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="number of rows in each generated file")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs (the best is reported)")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'rows':>10} {'pandas (ms)':>12} {'round-trip (ms)':>16} {'numpy (ms)':>12}")
+        for num_rows in args.rows:
+            path = os.path.join(directory, f"contour-{num_rows}.csv")
+            write_contour_file(path, num_rows)
+            pandas_time = best_time(parse_pandas, path, args.repeat)
+            round_trip_time = best_time(parse_pandas_round_trip, path, args.repeat)
+            numpy_time = best_time(parse_numpy, path, args.repeat)
+            print(f"{num_rows:>10} {pandas_time * 1000:>12.2f} {round_trip_time * 1000:>16.2f} {numpy_time * 1000:>12.2f}")
@@ -0,0 +1,50 @@
+"""Benchmark the throughput of the batch contour statistics calculation.
+
+Run from the repository root with:
+
+    python -m ocean.benchmarks.contour_statistics --contours 10000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ..app import contour_statistics
+
+
+def generate_contours(num_contours: int, min_length: int = 50, max_length: int = 500, seed: int = 0):
+    """Generate `num_contours` random (but realistic) contours as ragged arrays.
+    Returns a tuple of the offsets and a `contour_statistics.ContourData`."""
+    rng = np.random.default_rng(seed)
+    contours = []
+    for _ in range(num_contours):
+        num_points = int(rng.integers(min_length, max_length))
+        # Contours are sampled at a roughly constant rate and sweep smoothly with some noise
+        time_milliseconds = np.cumsum(rng.choice([1, 2], num_points, p=[0.9, 0.1]))
+        peak_frequency = np.round(8000 + 4000 * np.sin(np.linspace(0, rng.uniform(1, 10), num_points)) + rng.normal(0, 100, num_points), -1)
+        duty_cycle = rng.integers(0, 2, num_points)
+        contours.append(contour_statistics.ContourData(time_milliseconds, peak_frequency, duty_cycle, np.zeros(num_points), np.zeros(num_points)))
+    return contour_statistics.concatenate_contours(contours)
+
+
+def run(num_contours: int, repeat: int) -> float:
+    """Time the batch calculation of `num_contours` contours (best of `repeat`) and
+    return the throughput in contours per second."""
+    offsets, contour_data = generate_contours(num_contours)
+    ids = list(range(num_contours))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        contour_statistics.calculate_contour_statistics_batch(ids, offsets, contour_data.time_milliseconds, contour_data.peak_frequency, contour_data.duty_cycle)
+        best = min(best, time.perf_counter() - start)
+    return num_contours / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--contours", type=int, default=10000, help="number of contours to calculate statistics for")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs (the best is reported)")
+    args = parser.parse_args()
+    throughput = run(args.contours, args.repeat)
+    print(f"{args.contours} contours: {throughput:.0f} contours/s ({1e6 / throughput:.1f} us/contour)")
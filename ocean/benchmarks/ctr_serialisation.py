@@ -0,0 +1,68 @@
+"""Benchmark generating CTR files from long contours with `ContourFileHandler.get_ctr_data()`
+and `serialise_ctr()` against the previous path (a list-based most common difference
+followed by `scipy.io.savemat()`).
+
+Run from the repository root with:
+
+    python -m ocean.benchmarks.ctr_serialisation --rows 1000 10000 100000 1000000
+"""
+
+import argparse
+import io
+import time
+
+import numpy as np
+import scipy.io
+
+from ..app import contour_statistics
+
+
+def generate_contour(num_rows: int, seed: int = 0) -> contour_statistics.ContourFileHandler:
+    rng = np.random.default_rng(seed)
+    handler = contour_statistics.ContourFileHandler()
+    handler.contour_data = contour_statistics.ContourData(
+        1029326147450 + np.cumsum(rng.integers(3, 5, num_rows)),
+        rng.integers(200, 1000, num_rows) * 36.62109375,
+        np.zeros(num_rows), np.zeros(num_rows), np.zeros(num_rows)
+    )
+    return handler
+
+
+def ctr_previous(handler: contour_statistics.ContourFileHandler) -> bytes:
+    arr = handler.contour_data.time_milliseconds.tolist()
+    differences = []
+    for i in range(len(arr) - 1):
+        differences.append(arr[i + 1] - arr[i])
+    temp_res = max(set(differences), key=differences.count)/1000
+    mat_data = {'tempres':temp_res,'freqContour': handler.contour_data.peak_frequency,'ctrlength':temp_res*len(arr), 'id': 'selection'}
+    with io.BytesIO() as f:
+        scipy.io.savemat(f, mat_data)
+        return f.getvalue()
+
+
+def ctr_current(handler: contour_statistics.ContourFileHandler) -> bytes:
+    mat_data = handler.get_ctr_data()
+    mat_data["id"] = "selection"
+    return contour_statistics.serialise_ctr(mat_data)
+
+
+def best_time(function, handler, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(handler)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="number of rows in each generated contour")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs (the best is reported)")
+    args = parser.parse_args()
+    print(f"{'rows':>10} {'previous (ms)':>14} {'current (ms)':>13} {'speedup':>8}")
+    for num_rows in args.rows:
+        handler = generate_contour(num_rows)
+        previous_time = best_time(ctr_previous, handler, args.repeat)
+        current_time = best_time(ctr_current, handler, args.repeat)
+        print(f"{num_rows:>10} {previous_time * 1000:>14.2f} {current_time * 1000:>13.2f} {previous_time / current_time:>7.2f}x")
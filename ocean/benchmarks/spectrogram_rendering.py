@@ -0,0 +1,59 @@
+"""Benchmark the spectrogram plot renderers (see `ocean.app.spectrogram`).
+
+Run from the repository root with:
+
+    python -m ocean.benchmarks.spectrogram_rendering --duration 2 --threads 4
+"""
+
+import argparse
+import concurrent.futures
+import time
+
+import numpy as np
+
+from ..app import spectrogram
+
+
+def generate_whistle(duration: float, sampling_rate: int = 96000, seed: int = 0):
+    """Generate `duration` seconds of a synthetic whistle (a frequency modulated tone
+    in noise) and its contour. Returns a tuple of the audio and a `spectrogram.Contour`."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sampling_rate)) / sampling_rate
+    frequency = 10000 + 4000 * np.sin(2 * np.pi * t / duration)
+    audio = 0.5 * np.sin(2 * np.pi * np.cumsum(frequency) / sampling_rate) + rng.normal(0, 0.05, len(t))
+    contour_time = np.arange(0, duration * 1000, 2.0)
+    return audio.astype(np.float32), spectrogram.Contour(contour_time, 10000 + 4000 * np.sin(2 * np.pi * contour_time / 1000 / duration))
+
+
+def run(duration: float, repeat: int, threads: int, sampling_rate: int = 96000) -> dict:
+    """Time each renderer (best of `repeat`) and, if `threads` > 1, the throughput of
+    rendering concurrently. Returns a dictionary of renderer to `(seconds, plots per second)`."""
+    audio, contour = generate_whistle(duration, sampling_rate)
+    window_size, hop_size = 2048, 512
+    spectrogram_db = spectrogram.compute_spectrogram(audio, window_size, hop_size)
+
+    def render(renderer):
+        return spectrogram.render(renderer, spectrogram_db, sampling_rate, hop_size, "Benchmark", contour)
+
+    results = {}
+    for renderer in spectrogram.RENDERERS:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render(renderer)
+            best = min(best, time.perf_counter() - start)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            list(executor.map(render, [renderer] * threads * repeat))
+        results[renderer] = (best, threads * repeat / (time.perf_counter() - start))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=2, help="duration of the audio in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs (the best is reported)")
+    parser.add_argument("--threads", type=int, default=4, help="number of threads rendering concurrently")
+    args = parser.parse_args()
+    for renderer, (seconds, throughput) in run(args.duration, args.repeat, args.threads).items():
+        print(f"{renderer:<12} {seconds * 1000:8.1f} ms/plot, {throughput:6.2f} plots/s with {args.threads} threads")
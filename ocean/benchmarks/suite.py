@@ -0,0 +1,240 @@
+"""Benchmark each stage of contour file processing against a recorded baseline.
+
+Every case (a synthetic whistle contour of a given length, or one of the real
+ROCCA contour files in `ocean/tests/resources/contour-stats`) is timed through the
+stages a contour file goes through in OCEAN:
+
+- `parse`: reading the CSV into a `ContourFileHandler`
+- `statistics`: calculating the contour statistics
+- `ctr`: generating the CTR data and serialising it to a MAT file
+- `plot`: rendering the spectrogram and contour plot of a selection to a PNG with
+  `spectrogram.render()` (the spectrogram is of a fixed synthetic selection)
+
+Run from the repository root with:
+
+    python -m ocean.benchmarks.suite                    # compare to the baseline
+    python -m ocean.benchmarks.suite --update-baseline  # record a new baseline
+
+or through pytest (which fails any stage slower than the baseline by more than the
+tolerance, see `OCEAN_BENCHMARK_TOLERANCE`; the timing tests are left out of the
+default test run):
+
+    python -m pytest -m benchmark ocean/benchmarks
+
+Timings are machine dependent, so the baseline also records the time of a fixed
+calibration workload (see `calibrate()`). Baseline timings are scaled by how much
+slower or faster the calibration runs on the machine the benchmarks are compared on, so
+the baseline holds relative thresholds rather than timings of the machine it was
+recorded on.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import time
+import typing
+
+import numpy as np
+
+from ..app import contour_statistics
+from ..app import spectrogram
+
+
+SYNTHETIC_SIZES = (50, 500, 5000, 50000, 1000000)
+FIXTURES_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'tests', 'resources', 'contour-stats')
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+STAGES = ('parse', 'statistics', 'ctr', 'plot')
+# A stage regresses if it is more than this fraction slower than the baseline
+DEFAULT_TOLERANCE = float(os.environ.get('OCEAN_BENCHMARK_TOLERANCE', 1.0))
+# Differences smaller than this are timer noise and never count as a regression
+NOISE_FLOOR_SECONDS = 0.001
+# The selection whose spectrogram is plotted with each contour
+SELECTION_SECONDS = 1.0
+SELECTION_SAMPLING_RATE = 96000
+
+
+class BenchmarkCase(typing.NamedTuple):
+    name: str
+    csv: str
+
+
+def generate_whistle_csv(num_points: int, seed: int = 0) -> str:
+    """Generate the contents of a ROCCA-style contour CSV holding a synthetic whistle of
+    `num_points` points. The whistle is sampled every 1-2 ms and sweeps up and down with
+    noise so that every branch of the statistics calculation is exercised."""
+    rng = np.random.default_rng(seed)
+    time_milliseconds = 1029326147450 + np.cumsum(rng.choice([1, 2], num_points, p=[0.9, 0.1]))
+    phase = np.linspace(0, rng.uniform(1, 10) * max(1, num_points // 500), num_points)
+    peak_frequency = 8000 + 4000 * np.sin(phase) + rng.normal(0, 100, num_points)
+    data = np.column_stack([time_milliseconds, peak_frequency, rng.random(num_points), rng.random(num_points), rng.random(num_points) / 100])
+    buffer = io.StringIO()
+    buffer.write('Time [ms], Peak Frequency [Hz], Duty Cycle, Energy, WindowRMS\n')
+    np.savetxt(buffer, data, fmt=['%d', '%.7f', '%.17g', '%.17g', '%.17g'], delimiter=',')
+    return buffer.getvalue()
+
+
+def load_cases(sizes: typing.Iterable[int] = SYNTHETIC_SIZES, fixtures: bool = True) -> list:
+    """Build the benchmark cases: one synthetic whistle per size in `sizes` and (if
+    `fixtures`) every CSV contour file in `FIXTURES_DIRECTORY`."""
+    cases = [BenchmarkCase(f'synthetic-{size}', generate_whistle_csv(size)) for size in sizes]
+    if fixtures:
+        for path in sorted(glob.glob(os.path.join(FIXTURES_DIRECTORY, '*', '*.csv'))):
+            with open(path) as f:
+                cases.append(BenchmarkCase(f'{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)}', f.read()))
+    return cases
+
+
+def _parse(case: BenchmarkCase) -> contour_statistics.ContourFileHandler:
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_csv(io.StringIO(case.csv))
+    return handler
+
+
+def _statistics(handler: contour_statistics.ContourFileHandler) -> dict:
+    contour_data = handler.contour_data
+    return contour_statistics.calculate_contour_statistics(contour_data.time_milliseconds, contour_data.peak_frequency, contour_data.duty_cycle)
+
+
+def _ctr(handler: contour_statistics.ContourFileHandler) -> bytes:
+    return contour_statistics.serialise_ctr(handler.get_ctr_data())
+
+
+def generate_selection_spectrogram(seconds: float = SELECTION_SECONDS, sampling_rate: int = SELECTION_SAMPLING_RATE, seed: int = 0) -> tuple:
+    """Compute the spectrogram of `seconds` of noise sampled at `sampling_rate` with the
+    STFT parameters OCEAN plots with. Returns a tuple of the spectrogram and the hop size."""
+    audio = np.random.default_rng(seed).normal(0, 0.1, int(seconds * sampling_rate)).astype(np.float32)
+    window_size, hop_size = spectrogram.stft_parameters(sampling_rate)
+    return spectrogram.compute_spectrogram(audio, window_size, hop_size), hop_size
+
+
+_selection_spectrogram = None
+
+def _plot(handler: contour_statistics.ContourFileHandler, renderer: str = spectrogram.DEFAULT_RENDERER) -> bytes:
+    # As `Selection.create_temp_plot()`, without reading and transforming the audio
+    global _selection_spectrogram
+    if _selection_spectrogram is None: _selection_spectrogram = generate_selection_spectrogram()
+    spectrogram_db, hop_size = _selection_spectrogram
+    contour_data = handler.contour_data
+    contour = spectrogram.Contour(contour_data.time_milliseconds - contour_data.time_milliseconds[0], contour_data.peak_frequency)
+    return spectrogram.render(renderer, spectrogram_db, SELECTION_SAMPLING_RATE, hop_size, 'Benchmark', contour)
+
+
+def calibrate(repeat: int = 5) -> float:
+    """Time (best of `repeat`) a fixed workload of NumPy and pure Python work, against
+    which timings on different machines are compared."""
+    values = np.random.default_rng(0).random(1000000)
+    def workload(_):
+        np.sort(values)
+        np.fft.rfft(values)
+        sum(i * i for i in range(300000))
+    return _best_time(workload, None, repeat)
+
+
+def _best_time(function, argument, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_case(case: BenchmarkCase, repeat: int = 3, stages: typing.Iterable[str] = STAGES) -> dict:
+    """Time each of `stages` for `case` (best of `repeat`) and return a dictionary of
+    stage name to seconds. The statistics stage is recorded as `None` if the contour is
+    too short or has no sweeps, as it cannot be calculated."""
+    handler = _parse(case)
+    # The selection spectrogram is computed outside of the timed plots
+    _plot(handler)
+    functions = {'parse': (_parse, case), 'statistics': (_statistics, handler), 'ctr': (_ctr, handler), 'plot': (_plot, handler)}
+    results = {}
+    for stage in stages:
+        function, argument = functions[stage]
+        try:
+            results[stage] = _best_time(function, argument, repeat)
+        except (contour_statistics.exception_handler.WarningException, ZeroDivisionError):
+            results[stage] = None
+    return results
+
+
+def run(cases: list, repeat: int = 3, stages: typing.Iterable[str] = STAGES) -> dict:
+    """Run every case in `cases`, returning a dictionary of case name to `run_case()` results."""
+    return {case.name: run_case(case, repeat, stages) for case in cases}
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict:
+    """Load the recorded baseline (with the `calibration` time and the results of each of
+    the `cases`), or an empty dictionary if none has been recorded."""
+    if not os.path.exists(path): return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict, calibration: float, path: str = BASELINE_PATH):
+    with open(path, 'w') as f:
+        json.dump({'calibration': calibration, 'cases': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def get_scale(baseline: dict, calibration: float) -> float:
+    """The factor by which the timings of `baseline` are scaled to compare them with
+    timings of a machine whose `calibrate()` time is `calibration`."""
+    return calibration / baseline['calibration'] if baseline.get('calibration') else 1.0
+
+
+def is_regression(seconds: float, baseline_seconds: float, tolerance: float = DEFAULT_TOLERANCE) -> bool:
+    """Whether `seconds` is more than `tolerance` (a fraction) slower than `baseline_seconds`.
+    Stages without a timing or baseline, or within `NOISE_FLOOR_SECONDS` of the baseline,
+    never regress."""
+    if seconds is None or baseline_seconds is None: return False
+    if seconds - baseline_seconds < NOISE_FLOOR_SECONDS: return False
+    return seconds > baseline_seconds * (1 + tolerance)
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE, scale: float = 1.0) -> list:
+    """Compare `results` to the `cases` of `baseline` (with their timings multiplied by
+    `scale`, see `get_scale()`) and return a list of `(case, stage, seconds,
+    baseline_seconds)` for every stage that regressed beyond `tolerance`."""
+    regressions = []
+    for case, stages in results.items():
+        for stage, seconds in stages.items():
+            baseline_seconds = baseline.get('cases', {}).get(case, {}).get(stage)
+            if baseline_seconds is not None: baseline_seconds *= scale
+            if is_regression(seconds, baseline_seconds, tolerance):
+                regressions.append((case, stage, seconds, baseline_seconds))
+    return regressions
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds is None: return '-'
+    return f'{seconds * 1000:.2f} ms'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SYNTHETIC_SIZES, help='lengths of the synthetic contours')
+    parser.add_argument('--no-fixtures', action='store_true', help='do not benchmark the contour file fixtures')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs per stage (the best is reported)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='fraction a stage may be slower than the baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='path of the JSON baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='record the results as the new baseline')
+    args = parser.parse_args()
+
+    calibration = calibrate()
+    results = run(load_cases(args.sizes, not args.no_fixtures), args.repeat)
+    baseline = load_baseline(args.baseline)
+    for case, stages in results.items():
+        print(f'{case:<48}' + ''.join(f'{stage}: {_format_seconds(seconds):>12}  ' for stage, seconds in stages.items()))
+
+    if args.update_baseline:
+        save_baseline(results, calibration, args.baseline)
+        print(f'Baseline written to {args.baseline}')
+    else:
+        scale = get_scale(baseline, calibration)
+        print(f'Calibration: {_format_seconds(calibration)} (baseline timings scaled by {scale:.2f})')
+        regressions = find_regressions(results, baseline, args.tolerance, scale)
+        for case, stage, seconds, baseline_seconds in regressions:
+            print(f'REGRESSION {case} {stage}: {_format_seconds(seconds)} (baseline {_format_seconds(baseline_seconds)})')
+        if regressions: raise SystemExit(1)
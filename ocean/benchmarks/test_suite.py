@@ -0,0 +1,57 @@
+"""Fail if any contour file processing stage is slower than the recorded baseline (scaled
+to this machine, see `suite.calibrate()`) by more than `suite.DEFAULT_TOLERANCE` (set
+with the `OCEAN_BENCHMARK_TOLERANCE` environment variable). The timing tests take around
+a minute and depend on the machine, so they are marked `benchmark` and left out of the
+default test run (see `pytest.ini`); run them with `python -m pytest -m benchmark ocean/benchmarks`."""
+
+import pytest
+
+from . import suite
+
+
+BASELINE = suite.load_baseline()
+CASES = suite.load_cases()
+
+
+@pytest.fixture(scope="module")
+def scale():
+    return suite.get_scale(BASELINE, suite.calibrate())
+
+
+@pytest.fixture(scope="module", params=CASES, ids=[case.name for case in CASES])
+def case_results(request):
+    return request.param.name, suite.run_case(request.param)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("stage", suite.STAGES)
+def test_stage_within_tolerance(case_results, stage, scale):
+    case, results = case_results
+    baseline_seconds = BASELINE.get("cases", {}).get(case, {}).get(stage)
+    if baseline_seconds is None:
+        pytest.skip(f"No baseline recorded for {case} {stage}")
+    assert not suite.is_regression(results[stage], baseline_seconds * scale), \
+        f"{case} {stage} took {results[stage]:.6f}s (scaled baseline {baseline_seconds * scale:.6f}s, tolerance {suite.DEFAULT_TOLERANCE:.0%})"
+
+
+def test_find_regressions():
+    baseline = {"calibration": 1.0, "cases": {"a": {"parse": 1.0, "plot": 1.0}, "b": {"parse": 0.0001}}}
+    results = {"a": {"parse": 1.6, "plot": 1.4, "ctr": 5.0}, "b": {"parse": 0.0005, "statistics": None}}
+    assert suite.find_regressions(results, baseline, tolerance=0.5) == [("a", "parse", 1.6, 1.0)]
+    # On a machine twice as slow as the baseline's, neither stage regresses
+    assert suite.find_regressions(results, baseline, tolerance=0.5, scale=2.0) == []
+
+
+def test_get_scale():
+    assert suite.get_scale({"calibration": 0.5, "cases": {}}, 1.0) == 2.0
+    assert suite.get_scale({}, 1.0) == 1.0
+
+
+def test_plot_renders_png():
+    handler = suite._parse(suite.BenchmarkCase("synthetic", suite.generate_whistle_csv(500)))
+    assert suite._plot(handler).startswith(b"\x89PNG")
+
+
+def test_synthetic_contour_length():
+    handler = suite._parse(suite.BenchmarkCase("synthetic", suite.generate_whistle_csv(1234)))
+    assert len(handler.contour_data) == 1234
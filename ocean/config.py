@@ -11,6 +11,23 @@ class Config:
         'max_overflow': 10,  # Number of connections to allow in connection pool overflow
         'pool_timeout': 30,  # Seconds to wait before giving up on getting a connection
     }
+    # Number of processes used to recalculate contour statistics and CTR files in bulk (1 to
+    # recalculate in the request itself). The processes are started once and then reused
+    CONTOUR_STATISTICS_WORKERS = int(os.environ.get('OCEAN_CONTOUR_STATISTICS_WORKERS', min(4, os.cpu_count() or 1)))
+    # Maximum size in bytes of the cache of rendered selection plots (see `plot_cache`)
+    PLOT_CACHE_MAX_SIZE = int(os.environ.get('OCEAN_PLOT_CACHE_MAX_SIZE', 512 * 1024 ** 2))
+    # Renderer used for selection plots unless one is requested: 'matplotlib' or 'pillow' (see `spectrogram`)
+    PLOT_RENDERER = os.environ.get('OCEAN_PLOT_RENDERER', 'matplotlib')
+    # Number of threads (0 to disable) and maximum queue length for background tasks such as pre-rendering plots
+    BACKGROUND_WORKERS = int(os.environ.get('OCEAN_BACKGROUND_WORKERS', 2))
+    BACKGROUND_QUEUE_SIZE = int(os.environ.get('OCEAN_BACKGROUND_QUEUE_SIZE', 100))
+    # Let the web server in front of OCEAN send files (with the X-Sendfile header) instead of the application
+    USE_X_SENDFILE = os.environ.get('OCEAN_USE_X_SENDFILE', 'false').lower() in ('true', '1')
+    # Number of threads and total read rate in bytes per second (0 for unlimited) of the filespace integrity verification (see `integrity`)
+    INTEGRITY_WORKERS = int(os.environ.get('OCEAN_INTEGRITY_WORKERS', 4))
+    INTEGRITY_MAX_BYTES_PER_SECOND = int(os.environ.get('OCEAN_INTEGRITY_MAX_BYTES_PER_SECOND', 0))
+    # Store the content of identical files once, with each file a hard link to it (see `blob_store`)
+    DEDUPLICATE_FILES = os.environ.get('OCEAN_DEDUPLICATE_FILES', 'false').lower() in ('true', '1')
 
 class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = f"mysql+mysqldb://{os.environ.get('DEV_STADOLPHINACOUSTICS_USER')}:{os.environ.get('DEV_STADOLPHINACOUSTICS_PASSWORD')}@{os.environ.get('DEV_STADOLPHINACOUSTICS_HOST')}/{os.environ.get('DEV_STADOLPHINACOUSTICS_DATABASE')}"
@@ -1,5 +1,8 @@
 import factory
 import pytest
+import sqlite3
+import sqlalchemy.orm
+from ..app import database_handler
 from ..app import models
 from . import common
 import uuid
@@ -32,6 +35,22 @@ def session():
 
 # Base.metadata.create_all(engine)
 
+@pytest.fixture
+def db_session(monkeypatch):
+    """A session of an in-memory database holding the application's tables."""
+    # The models store IDs as UUID objects, which the MariaDB driver (but not SQLite) converts
+    sqlite3.register_adapter(uuid.UUID, str)
+    sqlite_engine = sqlalchemy.create_engine("sqlite://")
+    # The timestamp columns default to the MariaDB function, which SQLite spells differently
+    for table in database_handler.db.metadata.tables.values():
+        for column in table.columns:
+            if column.server_default is not None and getattr(column.server_default, "arg", None) == "current_timestamp()":
+                monkeypatch.setattr(column.server_default, "arg", sqlalchemy.text("CURRENT_TIMESTAMP"))
+    database_handler.db.metadata.create_all(sqlite_engine)
+    with sqlalchemy.orm.Session(sqlite_engine) as session:
+        yield session
+    sqlite_engine.dispose()
+
 class FileFactory(factory.alchemy.SQLAlchemyModelFactory):
     class Meta:
         model = models.File
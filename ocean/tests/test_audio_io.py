@@ -0,0 +1,89 @@
+import os
+import wave
+import numpy as np
+import pytest
+import soundfile
+
+from ..app import audio_io
+from ..app import exception_handler
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "files")
+TEST_WAV = os.path.join(BASE_DIR, "test.wav")
+
+@pytest.fixture
+def stereo_audio():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.9, 0.9, (1000, 2))
+
+def test_read_info():
+    info = audio_io.read_info(TEST_WAV)
+    with wave.open(TEST_WAV, "rb") as wave_file:
+        assert info.sampling_rate == wave_file.getframerate()
+        assert info.channels == wave_file.getnchannels()
+        assert info.frames == wave_file.getnframes()
+        assert info.bits_per_sample == wave_file.getsampwidth() * 8
+    assert info.format_tag == audio_io.WAVE_FORMAT_PCM
+    assert info.duration == pytest.approx(info.frames / info.sampling_rate)
+
+def test_open_samples():
+    samples = audio_io.open_samples(TEST_WAV)
+    assert isinstance(samples, np.memmap)
+    assert samples.dtype == np.int16
+    np.testing.assert_array_equal(samples, soundfile.read(TEST_WAV, dtype="int16", always_2d=True)[0])
+
+def test_load():
+    audio, sampling_rate = audio_io.load(TEST_WAV)
+    expected, expected_sampling_rate = soundfile.read(TEST_WAV, dtype="float32")
+    assert sampling_rate == expected_sampling_rate
+    assert audio.dtype == np.float32
+    np.testing.assert_array_equal(audio, expected)
+    # No resampling when the sampling rate matches
+    np.testing.assert_array_equal(audio_io.load(TEST_WAV, sampling_rate)[0], expected)
+
+def test_load_resample():
+    info = audio_io.read_info(TEST_WAV)
+    audio, sampling_rate = audio_io.load(TEST_WAV, info.sampling_rate // 2)
+    assert sampling_rate == info.sampling_rate // 2
+    assert len(audio) == pytest.approx(info.frames / 2, abs=1)
+
+@pytest.mark.parametrize("subtype, format", [
+    ("PCM_U8", "WAV"), ("PCM_16", "WAV"), ("PCM_24", "WAV"), ("PCM_32", "WAV"),
+    ("FLOAT", "WAV"), ("DOUBLE", "WAV"), ("PCM_24", "WAVEX"), ("FLOAT", "WAVEX"), ("PCM_16", "RF64"),
+])
+def test_formats(tmp_path, stereo_audio, subtype, format):
+    path = str(tmp_path / "audio.wav")
+    soundfile.write(path, stereo_audio, 48000, subtype=subtype, format=format)
+    info = audio_io.read_info(path)
+    assert (info.sampling_rate, info.channels, info.frames) == (48000, 2, len(stereo_audio))
+    expected = soundfile.read(path, dtype="float32", always_2d=True)[0]
+    np.testing.assert_allclose(audio_io.load(path, mono=False)[0], expected, atol=1e-7)
+    np.testing.assert_allclose(audio_io.load(path)[0], expected.mean(axis=1), atol=1e-7)
+
+def test_truncated(tmp_path, stereo_audio):
+    path = str(tmp_path / "audio.wav")
+    soundfile.write(path, stereo_audio, 48000, subtype="PCM_16")
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 10)
+    info = audio_io.read_info(path)
+    assert info.frames == len(stereo_audio) - 3
+    assert audio_io.open_samples(path, info).shape == (info.frames, 2)
+
+def test_empty(tmp_path):
+    path = str(tmp_path / "audio.wav")
+    soundfile.write(path, np.zeros((0, 1)), 48000, subtype="PCM_16")
+    audio, _ = audio_io.load(path)
+    assert len(audio) == 0
+
+@pytest.mark.parametrize("data", [b"", b"not a wav file", b"RIFF\x04\x00\x00\x00WAVE"])
+def test_invalid(tmp_path, data):
+    path = str(tmp_path / "audio.wav")
+    with open(path, "wb") as f:
+        f.write(data)
+    with pytest.raises(exception_handler.WarningException):
+        audio_io.read_info(path)
+
+def test_unsupported_format(tmp_path, stereo_audio):
+    path = str(tmp_path / "audio.wav")
+    soundfile.write(path, stereo_audio, 48000, subtype="ULAW")
+    with pytest.raises(exception_handler.WarningException):
+        audio_io.read_info(path)
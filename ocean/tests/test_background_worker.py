@@ -0,0 +1,44 @@
+import threading
+
+from ..app import background_worker
+
+def test_worker_pool_runs_tasks():
+    pool = background_worker.WorkerPool(workers=2, max_queued=10)
+    results = []
+    for i in range(5):
+        assert pool.submit(f"task {i}", results.append, i)
+    pool.join()
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    statistics = pool.get_statistics()
+    assert (statistics.queued, statistics.running, statistics.completed, statistics.failed) == (0, 0, 5, 0)
+
+def test_worker_pool_failure():
+    pool = background_worker.WorkerPool(workers=1, max_queued=10)
+    def fail():
+        raise ValueError("broken")
+    pool.submit("failing task", fail)
+    pool.submit("task", lambda: None)
+    pool.join()
+    statistics = pool.get_statistics()
+    assert (statistics.completed, statistics.failed) == (1, 1)
+    assert statistics.last_failure == "failing task: broken"
+
+def test_worker_pool_drops_when_full():
+    pool = background_worker.WorkerPool(workers=1, max_queued=1)
+    started, release = threading.Event(), threading.Event()
+    def block():
+        started.set()
+        release.wait()
+    assert pool.submit("running", block)
+    started.wait()
+    assert pool.submit("queued", lambda: None)
+    assert not pool.submit("dropped", lambda: None)
+    statistics = pool.get_statistics()
+    assert (statistics.queued, statistics.running, statistics.dropped) == (1, 1, 1)
+    release.set()
+    pool.join()
+    assert pool.get_statistics().completed == 2
+
+def test_worker_pool_no_workers():
+    pool = background_worker.WorkerPool(workers=0, max_queued=10)
+    assert not pool.submit("task", lambda: None)
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import flask
+import pytest
+
+from . import factories
+from ..app import blob_store
+from ..app import database_handler
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "files")
+DATA = b"contour data" * 100
+DATA_HASH = hashlib.sha256(DATA).digest()
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def deduplicating_app(filespace):
+    app = flask.Flask(__name__)
+    app.config["DEDUPLICATE_FILES"] = True
+    with app.app_context():
+        yield app
+
+def write(directory, name, data=DATA):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_deduplicate(filespace):
+    first, second = write(filespace, "first.csv"), write(filespace, "second.csv")
+    # The first file becomes the blob and the second a link to it
+    assert blob_store.deduplicate(first, DATA_HASH) == 0
+    assert blob_store.deduplicate(second, DATA_HASH) == len(DATA)
+    assert os.path.samefile(first, second)
+    assert blob_store.is_deduplicated(first, DATA_HASH) and blob_store.is_deduplicated(second, DATA_HASH)
+    # Deduplicating again changes nothing
+    assert blob_store.deduplicate(second, DATA_HASH) == 0
+    assert blob_store.get_statistics() == blob_store.DeduplicationStatistics(blobs=1, size=len(DATA), references=2, reclaimed=len(DATA), unreferenced=0)
+    with open(second, "rb") as f:
+        assert f.read() == DATA
+
+def test_deduplicate_size_mismatch(filespace):
+    blob_store.deduplicate(write(filespace, "first.csv"), DATA_HASH)
+    other = write(filespace, "other.csv", b"other")
+    assert blob_store.deduplicate(other, DATA_HASH) == 0
+    assert not blob_store.is_deduplicated(other, DATA_HASH)
+
+def test_release(filespace):
+    first, second = write(filespace, "first.csv"), write(filespace, "second.csv")
+    blob_store.deduplicate(first, DATA_HASH)
+    blob_store.deduplicate(second, DATA_HASH)
+    os.remove(first)
+    blob_store.release(DATA_HASH)
+    assert blob_store.is_deduplicated(second, DATA_HASH)
+    os.remove(second)
+    blob_store.release(DATA_HASH)
+    assert blob_store.get_statistics().blobs == 0
+
+def test_collect_garbage(filespace):
+    first = write(filespace, "first.csv")
+    blob_store.deduplicate(first, DATA_HASH)
+    os.remove(first)
+    assert blob_store.get_statistics().unreferenced == 1
+    assert blob_store.collect_garbage() == (1, len(DATA))
+    assert blob_store.get_statistics().blobs == 0
+
+def test_statistics_never_deduplicated(filespace):
+    assert blob_store.get_statistics() is None
+
+def test_is_enabled(filespace):
+    assert not blob_store.is_enabled()
+    app = flask.Flask(__name__)
+    with app.app_context():
+        assert not blob_store.is_enabled()
+        app.config["DEDUPLICATE_FILES"] = True
+        assert blob_store.is_enabled()
+
+def test_file_insert(deduplicating_app):
+    files = []
+    for i in range(2):
+        file = factories.FileFactory()
+        with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+            file.insert(f, "dir1", f"file{i}", extension="wav")
+        files.append(file)
+    first, second = files
+    assert os.path.samefile(first._path_with_root, second._path_with_root)
+    statistics = blob_store.get_statistics()
+    assert (statistics.blobs, statistics.references, statistics.reclaimed) == (1, 2, os.path.getsize(first._path_with_root))
+
+    # Moving a file to the trash and deleting it permanently leaves the other file intact
+    first._delete()
+    assert first.deleted and os.path.samefile(first._path_with_root, second._path_with_root)
+    first._delete_permanent()
+    assert blob_store.get_statistics().references == 1
+    with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+        assert second.calculate_hash() == hashlib.sha256(f.read()).digest()
+    # Once no file shares the blob it is removed
+    second._delete_permanent()
+    assert blob_store.get_statistics().blobs == 0
+
+def test_file_insert_disabled(filespace):
+    file = factories.FileFactory()
+    with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+        file.insert(f, "dir1", "file1", extension="wav")
+    assert blob_store.get_statistics() is None
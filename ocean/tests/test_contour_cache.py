@@ -0,0 +1,77 @@
+import hashlib
+import os
+import numpy
+import pytest
+
+from ..app import contour_cache
+from ..app import contour_statistics
+from ..app import database_handler
+
+CONTOUR_FILE = "ocean/tests/resources/contour-stats/test1/sel_01_HICEAS020814-115547_ROCCA.csv"
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def file_hash():
+    with open(CONTOUR_FILE, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+@pytest.fixture
+def entry():
+    return contour_cache.calculate(contour_statistics.load_contour_file(CONTOUR_FILE, "csv"))
+
+def assert_entries_equal(actual: contour_cache.ContourCacheEntry, expected: contour_cache.ContourCacheEntry):
+    assert actual.statistics == expected.statistics
+    assert actual.statistics_error == expected.statistics_error
+    assert actual.mat_data.keys() == expected.mat_data.keys()
+    for key in expected.mat_data:
+        numpy.testing.assert_array_equal(actual.mat_data[key], expected.mat_data[key])
+
+def test_get_miss(filespace, file_hash):
+    assert contour_cache.get(file_hash) is None
+
+def test_get_no_hash(filespace, entry):
+    contour_cache.put(None, entry)
+    assert contour_cache.get(None) is None
+
+def test_put_get(filespace, file_hash, entry):
+    contour_cache.put(file_hash, entry)
+    assert_entries_equal(contour_cache.get(file_hash), entry)
+
+def test_put_get_statistics_error(filespace, file_hash, entry):
+    entry = entry._replace(statistics=None, statistics_error="Contour must contain at least 5 rows to calculate contour statistics.")
+    contour_cache.put(file_hash, entry)
+    assert_entries_equal(contour_cache.get(file_hash), entry)
+
+def test_calculate_statistics_error():
+    handler = contour_statistics.ContourFileHandler()
+    handler.contour_data = contour_statistics.ContourData([0, 3, 6], [7000.0, 7100.0, 7200.0], [0, 0, 0], [0, 0, 0], [0, 0, 0])
+    entry = contour_cache.calculate(handler)
+    assert entry.statistics is None
+    assert "at least" in entry.statistics_error
+    assert entry.mat_data["tempres"] == 0.003
+
+def test_version_invalidation(filespace, file_hash, entry, monkeypatch):
+    contour_cache.put(file_hash, entry)
+    monkeypatch.setattr(contour_statistics, "ALGORITHM_VERSION", contour_statistics.ALGORITHM_VERSION + 1)
+    assert contour_cache.get(file_hash) is None
+    contour_cache.put(file_hash, entry)
+    assert os.listdir(os.path.join(database_handler.get_cache_space(), contour_cache.CACHE_NAME)) == [f"v{contour_statistics.ALGORITHM_VERSION}"]
+
+def test_corrupt_entry(filespace, file_hash, entry):
+    contour_cache.put(file_hash, entry)
+    with open(contour_cache._get_entry_path(file_hash), "wb") as f:
+        f.write(b"corrupt")
+    assert contour_cache.get(file_hash) is None
+
+def test_invalidate(filespace, file_hash, entry):
+    contour_cache.put(file_hash, entry)
+    contour_cache.invalidate(file_hash)
+    assert contour_cache.get(file_hash) is None
+    # Invalidating a missing entry does nothing
+    contour_cache.invalidate(file_hash)
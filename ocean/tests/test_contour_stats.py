@@ -1,10 +1,13 @@
+import io
 import re
 import numpy
 import pytest
 from . import factories
 import os
 import pandas as pd
-from ..app import contour_statistics, utils
+from types import SimpleNamespace
+from ..app import contour_statistics, exception_handler, utils
+from . import legacy_contour_statistics
 
 import pytest
 from ..app import contour_statistics
@@ -67,3 +70,282 @@ def test_contour_file_attrs(contour_file_handler: contour_statistics.ContourFile
     assert attr in contour_file_handler.contour_file_attrs()
     assert common.CONTOUR_FILE[attr][0] == contour_file_handler.contour_file_attrs()[attr][0]
     assert common.CONTOUR_FILE[attr][1] == contour_file_handler.contour_file_attrs()[attr][1]
+
+def _contour_csv_files():
+    for folder in sorted(os.listdir(BASE_DIR)):
+        for file in sorted(os.listdir(os.path.join(BASE_DIR, folder))):
+            if file.endswith(".csv"):
+                yield os.path.join(BASE_DIR, folder, file)
+
+@pytest.mark.parametrize("path", _contour_csv_files())
+def test_contour_stats_legacy_parity(path):
+    """The vectorised calculation must give exactly the same values as the legacy algorithm."""
+    file_dataframe = utils.extract_to_dataframe(path).rename(columns=lambda x: x.strip())
+    contour_file_obj = contour_statistics.ContourFileHandler()
+    contour_file_obj.insert_dataframe(file_dataframe)
+    legacy_rows = legacy_contour_statistics.contour_rows(
+        file_dataframe['Time [ms]'].tolist(),
+        file_dataframe['Peak Frequency [Hz]'].tolist(),
+        file_dataframe['Duty Cycle'].tolist()
+    )
+    expected, actual = SimpleNamespace(), SimpleNamespace()
+    legacy_contour_statistics.calculate_statistics(legacy_rows, expected)
+    contour_file_obj.calculate_statistics(actual)
+    assert vars(actual) == vars(expected)
+
+def _random_contour(rng: numpy.random.Generator):
+    num_points = int(rng.integers(5, 300))
+    time_steps = rng.integers(0, 20, num_points)
+    time_steps[0], time_steps[1] = 0, rng.integers(1, 20)
+    # Frequencies are quantised so that flat sweeps occur, with occasional large jumps for steps
+    peak_frequency = rng.integers(200, 260, num_points) * 50.0
+    jumps = rng.random(num_points) < 0.1
+    peak_frequency[jumps] *= rng.choice([0.5, 1.5], jumps.sum())
+    duty_cycle = rng.integers(0, 2, num_points)
+    return numpy.cumsum(time_steps), peak_frequency, duty_cycle
+
+@pytest.mark.parametrize("seed", range(200))
+def test_contour_stats_legacy_parity_random(seed):
+    time_milliseconds, peak_frequency, duty_cycle = _random_contour(numpy.random.default_rng(seed))
+    expected = SimpleNamespace()
+    try:
+        legacy_contour_statistics.calculate_statistics(legacy_contour_statistics.contour_rows(time_milliseconds, peak_frequency, duty_cycle), expected)
+    except Exception as e:
+        # Degenerate contours (such as those with no sweeps) must fail in the same way
+        with pytest.raises(type(e)):
+            contour_statistics.calculate_contour_statistics(time_milliseconds, peak_frequency, duty_cycle)
+        return
+    actual = contour_statistics.calculate_contour_statistics(time_milliseconds, peak_frequency, duty_cycle)
+    assert actual == vars(expected)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_sweeps_steps_inflections_implementations(seed):
+    """The NumPy, pure Python loop and (if Numba is installed) compiled implementations must be identical"""
+    _, peak_frequency, _ = _random_contour(numpy.random.default_rng(seed))
+    expected_counts, expected_inflections = contour_statistics._sweeps_steps_inflections_numpy(peak_frequency)
+    results = [
+        contour_statistics._sweeps_steps_inflections_loop(peak_frequency, 1 + contour_statistics.STEP_SENSITIVITY / 100, 1 - contour_statistics.STEP_SENSITIVITY / 100),
+        contour_statistics.calculate_sweeps_steps_inflections(peak_frequency),
+    ]
+    for counts, inflections in results:
+        numpy.testing.assert_array_equal(counts, expected_counts)
+        numpy.testing.assert_array_equal(inflections, expected_inflections)
+
+@pytest.mark.parametrize("num_points", range(0, contour_statistics.MIN_CONTOUR_LENGTH))
+def test_contour_stats_too_short(num_points):
+    with pytest.raises(exception_handler.WarningException):
+        contour_statistics.calculate_contour_statistics(numpy.arange(num_points), numpy.full(num_points, 5000.0), numpy.zeros(num_points))
+
+def test_contour_data_from_dataframe():
+    file_dataframe = utils.extract_to_dataframe(next(_contour_csv_files())).rename(columns=lambda x: x.strip())
+    contour_file_obj = contour_statistics.ContourFileHandler()
+    contour_file_obj.insert_dataframe(file_dataframe)
+    contour_data = contour_file_obj.contour_data
+    assert len(contour_data) == len(file_dataframe)
+    for column, (dtype, header, nullable) in contour_file_obj.contour_file_attrs().items():
+        array = getattr(contour_data, column)
+        assert array.dtype == (numpy.int64 if dtype == int else numpy.float64)
+        assert array.flags['C_CONTIGUOUS']
+        assert array.tolist() == file_dataframe[header].tolist()
+    pd.testing.assert_frame_equal(contour_file_obj.get_dataframe(), file_dataframe, check_dtype=False)
+
+def test_contour_data_mismatched_lengths():
+    with pytest.raises(ValueError):
+        contour_statistics.ContourData([0, 1], [1.0], [1.0], [1.0], [1.0])
+
+def test_contour_stats_batch():
+    """The batch calculation must give the same values as calculating each contour separately."""
+    contours, expected = [], {}
+    for i, path in enumerate(_contour_csv_files()):
+        contour_file_obj = contour_statistics.ContourFileHandler()
+        contour_file_obj.insert_dataframe(utils.extract_to_dataframe(path))
+        contours.append(contour_file_obj.contour_data)
+        expected[f"contour-{i}"] = contour_statistics.calculate_contour_statistics(contour_file_obj.contour_data.time_milliseconds, contour_file_obj.contour_data.peak_frequency, contour_file_obj.contour_data.duty_cycle)
+    offsets, contour_data = contour_statistics.concatenate_contours(contours)
+    actual = contour_statistics.calculate_contour_statistics_batch(list(expected.keys()), offsets, contour_data.time_milliseconds, contour_data.peak_frequency, contour_data.duty_cycle)
+    assert list(actual.index) == list(expected.keys())
+    for contour_id, statistics in expected.items():
+        row = actual.loc[contour_id]
+        for attr, value in statistics.items():
+            assert row[attr] == value
+        assert row.drop(list(statistics.keys())).isna().all()
+
+@pytest.mark.parametrize("seed", range(20))
+def test_contour_stats_batch_random(seed):
+    """The vectorised batch calculation must match the scalar calculation exactly, including
+    for unsorted times, NaN values and contours without sweeps (which are calculated separately)."""
+    rng = numpy.random.default_rng(seed)
+    contours, expected = [], []
+    while len(contours) < 50:
+        time_milliseconds, peak_frequency, duty_cycle = _random_contour(rng)
+        if len(contours) % 10 == 1: time_milliseconds = rng.permutation(time_milliseconds)
+        if len(contours) % 10 == 2: duty_cycle = numpy.where(rng.random(len(duty_cycle)) < 0.1, numpy.nan, duty_cycle)
+        contour = contour_statistics.ContourData(time_milliseconds, peak_frequency, duty_cycle, numpy.zeros(len(duty_cycle)), numpy.zeros(len(duty_cycle)))
+        try:
+            expected.append(contour_statistics.calculate_contour_statistics(contour.time_milliseconds, contour.peak_frequency, contour.duty_cycle))
+        except ZeroDivisionError:
+            # Contours without sweeps fail (see `test_contour_stats_batch_no_sweeps()`)
+            continue
+        contours.append(contour)
+    offsets, contour_data = contour_statistics.concatenate_contours(contours)
+    actual = contour_statistics.calculate_contour_statistics_batch(list(range(len(contours))), offsets, contour_data.time_milliseconds, contour_data.peak_frequency, contour_data.duty_cycle)
+    for i, statistics in enumerate(expected):
+        row = actual.loc[i]
+        for attr in contour_statistics.STATISTICS:
+            if attr in statistics and not pd.isna(statistics[attr]):
+                assert row[attr] == statistics[attr], f"contour {i} {attr}: {row[attr]} != {statistics[attr]}"
+            else:
+                assert pd.isna(row[attr]), f"contour {i} {attr}: {row[attr]} is not NaN"
+
+def test_contour_stats_batch_no_sweeps():
+    """A contour without any sweeps fails as it does when calculated alone."""
+    peak_frequency = numpy.array([5000.0, 6000.0, 5000.0, 6000.0, 5000.0, 6000.0])
+    with pytest.raises(ZeroDivisionError):
+        contour_statistics.calculate_contour_statistics(numpy.arange(6), peak_frequency, numpy.zeros(6))
+    with pytest.raises(ZeroDivisionError):
+        contour_statistics.calculate_contour_statistics_batch(["a"], [0, 6], numpy.arange(6), peak_frequency, numpy.zeros(6))
+
+def test_contour_stats_batch_empty():
+    offsets, contour_data = contour_statistics.concatenate_contours([])
+    assert list(offsets) == [0]
+    assert len(contour_statistics.calculate_contour_statistics_batch([], offsets, contour_data.time_milliseconds, contour_data.peak_frequency, contour_data.duty_cycle)) == 0
+
+@pytest.mark.parametrize("ids, offsets", [
+    (["a"], [0, 5, 10]),
+    (["a", "b"], [1, 5, 10]),
+    (["a", "b"], [0, 5, 9]),
+    (["a", "b", "c"], [0, 6, 5, 10]),
+])
+def test_contour_stats_batch_invalid_offsets(ids, offsets):
+    with pytest.raises(ValueError):
+        contour_statistics.calculate_contour_statistics_batch(ids, offsets, numpy.arange(10), numpy.full(10, 5000.0), numpy.zeros(10))
+
+def test_contour_stats_batch_too_short():
+    with pytest.raises(exception_handler.WarningException, match="Contour b"):
+        contour_statistics.calculate_contour_statistics_batch(["a", "b"], [0, 6, 10], numpy.arange(10), numpy.full(10, 5000.0), numpy.zeros(10))
+
+def test_recalculate_contour_files_parallel():
+    """Recalculating in a process pool must give the same results (in the same order) as the serial path."""
+    jobs = [contour_statistics.ContourFileJob(id=f"contour-{i}", name=path, path=path, extension="csv") for i, path in enumerate(_contour_csv_files())]
+    serial_statistics, serial_ctr_data = contour_statistics.recalculate_contour_files(jobs, workers=1)
+    parallel_statistics, parallel_ctr_data = contour_statistics.recalculate_contour_files(jobs, workers=2)
+    pd.testing.assert_frame_equal(serial_statistics, parallel_statistics)
+    assert len(serial_ctr_data) == len(parallel_ctr_data) == len(jobs)
+    for serial_mat, parallel_mat in zip(serial_ctr_data, parallel_ctr_data):
+        assert serial_mat.keys() == parallel_mat.keys()
+        for key in serial_mat:
+            numpy.testing.assert_array_equal(serial_mat[key], parallel_mat[key])
+
+def test_recalculate_contour_files_missing():
+    jobs = [contour_statistics.ContourFileJob(id="contour", name="selection 1", path=os.path.join(BASE_DIR, "missing.csv"), extension="csv")]
+    with pytest.raises(exception_handler.WarningException, match="selection 1"):
+        contour_statistics.recalculate_contour_files(jobs)
+
+@pytest.mark.parametrize("path", _contour_csv_files())
+def test_insert_csv(path):
+    """Parsing a contour CSV directly must give exactly the same arrays as parsing it with pandas
+    (using correctly rounded float conversion)."""
+    expected = contour_statistics.ContourFileHandler()
+    expected.insert_dataframe(pd.read_csv(path, float_precision="round_trip"))
+    actual = contour_statistics.ContourFileHandler()
+    actual.insert_csv(path)
+    for column in expected.contour_file_attrs():
+        numpy.testing.assert_array_equal(getattr(actual.contour_data, column), getattr(expected.contour_data, column))
+        assert getattr(actual.contour_data, column).dtype == getattr(expected.contour_data, column).dtype
+
+CONTOUR_CSV_HEADER = "Time [ms], Peak Frequency [Hz], Duty Cycle, Energy, WindowRMS\n"
+
+def test_insert_csv_reordered_columns():
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_csv(io.StringIO("WindowRMS,Extra,Energy,Duty Cycle,Peak Frequency [Hz],Time [ms]\n 0.5 ,x,0.4,0.3,7000,10\n0.1,y,0.2,0.3,7100.5,13\n"))
+    assert handler.contour_data.time_milliseconds.tolist() == [10, 13]
+    assert handler.contour_data.peak_frequency.tolist() == [7000.0, 7100.5]
+    assert handler.contour_data.duty_cycle.tolist() == [0.3, 0.3]
+    assert handler.contour_data.energy.tolist() == [0.4, 0.2]
+    assert handler.contour_data.window_RMS.tolist() == [0.5, 0.1]
+
+def test_insert_csv_quoted():
+    """Quoted headers and values are parsed as they are by pandas"""
+    contents = '"Time [ms]","Peak Frequency [Hz]", "Duty Cycle","Energy","WindowRMS"\n"10",7000,0.3,"0.4",0.5\n13,"7100.5",0.3,0.2,0.1\n'
+    expected = contour_statistics.ContourFileHandler()
+    expected.insert_dataframe(pd.read_csv(io.StringIO(contents), skipinitialspace=True))
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_csv(io.StringIO(contents))
+    for column in expected.contour_file_attrs():
+        numpy.testing.assert_array_equal(getattr(handler.contour_data, column), getattr(expected.contour_data, column))
+    assert handler.contour_data.peak_frequency.tolist() == [7000.0, 7100.5]
+
+def test_insert_csv_no_rows():
+    handler = contour_statistics.ContourFileHandler()
+    handler.insert_csv(io.StringIO(CONTOUR_CSV_HEADER))
+    assert len(handler.contour_data) == 0
+
+@pytest.mark.parametrize("contents, match", [
+    ("", "empty"),
+    ("Time [ms], Peak Frequency [Hz], Duty Cycle, Energy\n1,2,3,4\n", "Missing column: WindowRMS"),
+    (CONTOUR_CSV_HEADER + "1.5,7000,0.1,0.2,0.3\n", "Incorrect data type"),
+    (CONTOUR_CSV_HEADER + "1,seven,0.1,0.2,0.3\n", "Incorrect data type"),
+    (CONTOUR_CSV_HEADER + "1,7000,0.1,0.2\n", "Incorrect data type"),
+])
+def test_insert_csv_invalid(contents, match):
+    with pytest.raises(exception_handler.WarningException, match=match):
+        contour_statistics.ContourFileHandler().insert_csv(io.StringIO(contents))
+
+def test_load_contour_file_wrong_format():
+    with pytest.raises(exception_handler.WarningException, match="wrong format"):
+        contour_statistics.load_contour_file(next(_contour_csv_files()), "txt")
+
+def _legacy_most_common_difference(arr):
+    differences = []
+    for i in range(len(arr) - 1):
+        differences.append(arr[i + 1] - arr[i])
+    return max(set(differences), key=differences.count)
+
+@pytest.mark.parametrize("values", [
+    [0, 3, 6, 10, 14],
+    [0, 4, 8, 11, 14],
+    [10, 7, 4, 8, 12],
+    [0, 1000, 1003, 2003, 2006],
+    [5, 5, 5],
+    [0, 3],
+])
+def test_most_common_difference_ties(values):
+    assert contour_statistics.most_common_difference(numpy.array(values)) == _legacy_most_common_difference(values)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_most_common_difference_random(seed):
+    rng = numpy.random.default_rng(seed)
+    values = numpy.cumsum(rng.integers(-20, 100, int(rng.integers(2, 200))))
+    assert contour_statistics.most_common_difference(values) == _legacy_most_common_difference(values.tolist())
+
+def test_most_common_difference_too_short():
+    with pytest.raises(ValueError):
+        contour_statistics.most_common_difference(numpy.array([1]))
+
+@pytest.mark.parametrize("path", _contour_csv_files())
+def test_serialise_ctr(path):
+    """The CTR file must be identical to that written by scipy (other than the creation time in the header)."""
+    import scipy.io
+    handler = contour_statistics.load_contour_file(path, "csv")
+    mat_data = handler.get_ctr_data()
+    mat_data["id"] = "0f8fad5b-d9cb-469f-a165-70867728950e"
+    with io.BytesIO() as f:
+        scipy.io.savemat(f, mat_data)
+        expected = f.getvalue()
+    actual = contour_statistics.serialise_ctr(mat_data)
+    assert actual[116:] == expected[116:]
+    assert actual[:48] == expected[:48]
+    loaded = scipy.io.loadmat(io.BytesIO(actual))
+    numpy.testing.assert_array_equal(loaded["freqContour"][0], handler.contour_data.peak_frequency)
+    assert loaded["tempres"][0][0] == mat_data["tempres"]
+    assert loaded["id"][0] == mat_data["id"]
+
+def test_recalculate_contour_files_reuses_pool():
+    """The process pool is started once rather than by every recalculation."""
+    jobs = [contour_statistics.ContourFileJob(id=f"contour-{i}", name=path, path=path, extension="csv") for i, path in enumerate(_contour_csv_files())][:4]
+    contour_statistics.recalculate_contour_files(jobs, workers=2)
+    executor = contour_statistics._get_executor(2)
+    contour_statistics.recalculate_contour_files(jobs, workers=2)
+    assert contour_statistics._get_executor(2) is executor
+    # Fewer jobs than workers, or a single worker, are recalculated in this process
+    assert len(contour_statistics.recalculate_contour_files(jobs[:1], workers=2)[0]) == 1
@@ -1,13 +1,17 @@
 import hashlib
+import flask
 from pytest import fixture
 import pytest
 import os, shutil
+import uuid
 from os.path import join
 
 from . import common
 from . import factories
 from ..app import models
 from ..app import database_handler
+from ..app import exception_handler
+from .factories import db_session
 
 
 
@@ -82,6 +86,26 @@ def test_file_insert_no_extension(filespace, text_file_path):
     assert os.path.exists(data_path("dir1", "file1.txt"))
     assert file.filename_with_extension == "file1.txt"
 
+def test_file_insert_hash(filespace, wav_file, monkeypatch):
+    # The hash is calculated while the file is written rather than by reading it back
+    monkeypatch.setattr(models.File, "calculate_hash", lambda self: pytest.fail("File was read back"))
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file1", extension="wav")
+    with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+        assert file.hash == hashlib.sha256(f.read()).digest()
+
+def test_file_insert_fsync(filespace, wav_file, monkeypatch):
+    synced = []
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file1", extension="wav", fsync_interval=1024)
+    # The file is flushed at most once per chunk that is copied
+    assert len(synced) == 1
+    synced.clear()
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file2", extension="wav")
+    assert synced == []
+
 def test_path_with_root(filespace, text_file):
     file = factories.FileFactory()
     file.insert(text_file, "dir1", "file1", extension = "txt")
@@ -172,3 +196,89 @@ def test_rollback(filespace, text_file):
     assert not os.path.exists(data_path("dir1", "file2.txt"))
     assert not os.path.exists(trash_path("dir1", file.filename_with_extension))
 
+
+def test_file_insert_audio_metadata(filespace, wav_file):
+    import wave
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file1", extension = "wav")
+    with wave.open(os.path.join(BASE_DIR, "test.wav"), "rb") as w:
+        assert file.audio_sampling_rate == w.getframerate()
+        assert file.audio_channels == w.getnchannels()
+        assert file.audio_sample_width == w.getsampwidth()
+        assert file.audio_frames == w.getnframes()
+        assert file.audio_duration == pytest.approx(w.getnframes() / w.getframerate())
+
+def test_file_insert_audio_metadata_long_header(filespace):
+    """The header is read from the file if it does not fit in the first chunk written"""
+    import io, struct
+    junk = b"\0" * (1024 * 1024 + 2)
+    fmt = struct.pack("<HHIIHH", 1, 2, 48000, 48000 * 4, 4, 16)
+    data = b"\0" * 4000
+    body = b"WAVE" + b"junk" + struct.pack("<I", len(junk)) + junk + b"fmt " + struct.pack("<I", len(fmt)) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    file = factories.FileFactory()
+    file.insert(io.BytesIO(b"RIFF" + struct.pack("<I", len(body)) + body), "dir1", "file1", extension = "wav")
+    assert (file.audio_sampling_rate, file.audio_channels, file.audio_sample_width, file.audio_frames) == (48000, 2, 2, 1000)
+
+def test_file_insert_audio_metadata_invalid(filespace, text_file):
+    file = factories.FileFactory()
+    file.insert(text_file, "dir1", "file1", extension = "wav")
+    assert os.path.exists(data_path("dir1", "file1.wav"))
+    assert file.audio_sampling_rate is None and file.audio_frames is None
+    with pytest.raises(exception_handler.WarningException):
+        file.calculate_audio_metadata()
+
+def test_file_insert_not_audio(filespace, text_file_object):
+    assert text_file_object.audio_sampling_rate is None
+
+def test_calculate_audio_metadata(filespace, wav_file):
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file1", extension = "wav")
+    sampling_rate = file.audio_sampling_rate
+    file.set_audio_metadata(None)
+    assert file.audio_sampling_rate is None
+    file.calculate_audio_metadata()
+    assert file.audio_sampling_rate == sampling_rate
+
+def test_file_insert_waveform(filespace, wav_file):
+    from ..app import background_worker
+    from ..app import waveform
+    file = factories.FileFactory()
+    with flask.Flask(__name__).app_context():
+        file.insert(wav_file, "dir1", "file1", extension = "wav")
+        # Nothing is built until the caller queues it after committing
+        background_worker.get_pool().join()
+        assert waveform.get_metadata(file.hash) is None
+        assert file.submit_waveform_build()
+        background_worker.get_pool().join()
+    assert waveform.get_metadata(file.hash)["frames"] == file.audio_frames
+    envelope = file.get_waveform(pixels = 100)
+    assert len(envelope["min"]) >= 100
+
+def test_file_get_waveform_not_built(filespace, wav_file):
+    from ..app import background_worker
+    file = factories.FileFactory()
+    file.insert(wav_file, "dir1", "file1", extension = "wav")
+    assert file.get_waveform(pixels = 100) is None
+    assert not file.submit_waveform_build()
+    with flask.Flask(__name__).app_context():
+        assert file.submit_waveform_build()
+        background_worker.get_pool().join()
+    assert file.get_waveform(pixels = 100) is not None
+
+def test_release_caches(filespace, db_session):
+    from ..app import waveform
+    with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+        file_hash = hashlib.sha256(f.read()).digest()
+    files = [models.File(id=str(uuid.uuid4()), directory="dir1", filename=f"file{i}", extension="wav", hash=file_hash) for i in range(2)]
+    db_session.add_all(files)
+    db_session.commit()
+    waveform.build(file_hash, os.path.join(BASE_DIR, "test.wav"))
+    # The envelope is kept while another file has the same content
+    files[0].release_caches(db_session)
+    db_session.delete(files[0])
+    db_session.commit()
+    assert waveform.get_metadata(file_hash) is not None
+    files[1].release_caches(db_session)
+    db_session.delete(files[1])
+    db_session.commit()
+    assert waveform.get_metadata(file_hash) is None
@@ -0,0 +1,167 @@
+import datetime
+import os
+import uuid
+import flask
+import pytest
+
+from ..app import database_handler
+from ..app import filespace_handler
+from ..app import models
+from ..app.routes import routes_filespace
+from ..app.routes import routes_recording
+from ..app.routes import routes_selection
+from .factories import db_session
+
+def make_tree(root, directories, files_per_directory):
+    """Create a synthetic filespace, returning the records of its files."""
+    records = []
+    for d in range(directories):
+        directory = os.path.join(f"species{d % 7}", f"encounter{d}")
+        os.makedirs(os.path.join(root, directory))
+        for f in range(files_per_directory):
+            open(os.path.join(root, directory, f"selection-{f}.wav"), "wb").close()
+            records.append((f"{d}-{f}", directory, f"selection-{f}", "wav"))
+    return records
+
+def test_scan_files(tmp_path):
+    make_tree(tmp_path, 3, 2)
+    os.symlink(tmp_path / "species0", tmp_path / "link")
+    paths = set(filespace_handler.scan_files(str(tmp_path)))
+    # Symbolic links to directories are not followed
+    assert len(paths) == 6
+    assert os.path.join("species1", "encounter1", "selection-0.wav") in paths
+
+def test_reconcile_records(tmp_path):
+    records = make_tree(tmp_path, 3, 2)
+    orphan = os.path.join("species0", "encounter0", "orphan.csv")
+    open(tmp_path / orphan, "wb").close()
+    missing = ("missing", os.path.join("species0", "encounter0"), "missing", "wav")
+    reconciliation = filespace_handler.reconcile_records(records + [missing], str(tmp_path))
+    assert reconciliation.orphans == [orphan]
+    assert reconciliation.broken_links == {"missing": os.path.join("species0", "encounter0", "missing.wav")}
+    assert (reconciliation.files, reconciliation.records) == (7, 7)
+
+def test_reconcile_records_normalises_directories(tmp_path):
+    records = make_tree(tmp_path, 1, 1)
+    file_id, directory, filename, extension = records[0]
+    reconciliation = filespace_handler.reconcile_records([(file_id, directory + os.sep, filename, extension)], str(tmp_path))
+    assert reconciliation.orphans == [] and reconciliation.broken_links == {}
+
+def test_reconcile_records_no_extension(tmp_path):
+    records = make_tree(tmp_path, 1, 1)
+    directory = records[0][1]
+    open(tmp_path / directory / "README", "wb").close()
+    reconciliation = filespace_handler.reconcile_records(records + [("readme", directory, "README", None)], str(tmp_path))
+    assert reconciliation.orphans == [] and reconciliation.broken_links == {}
+    # The file is not expected with a "None" extension
+    open(tmp_path / directory / "README.None", "wb").close()
+    reconciliation = filespace_handler.reconcile_records(records + [("readme", directory, "README", None)], str(tmp_path))
+    assert reconciliation.orphans == [os.path.join(directory, "README.None")]
+
+def test_reconcile_records_case_insensitive(tmp_path):
+    records = make_tree(tmp_path, 1, 2)
+    file_id, directory, filename, extension = records[0]
+    # The database compares paths case-insensitively, so neither file is orphaned
+    reconciliation = filespace_handler.reconcile_records([(file_id, directory.upper(), filename.upper(), extension.upper()), records[1]], str(tmp_path))
+    assert reconciliation.orphans == [] and reconciliation.broken_links == {}
+    # Orphans are reported with the case of the file itself
+    open(tmp_path / directory / "Orphan.WAV", "wb").close()
+    reconciliation = filespace_handler.reconcile_records(records, str(tmp_path))
+    assert reconciliation.orphans == [os.path.join(directory, "Orphan.WAV")]
+
+def test_reconcile_records_large(tmp_path):
+    records = make_tree(tmp_path, 200, 100)
+    # Every 10th file is removed from the filespace and every 10th record from the database
+    for record in records[::10]:
+        os.remove(os.path.join(tmp_path, record[1], f"{record[2]}.{record[3]}"))
+    reconciliation = filespace_handler.reconcile_records([r for i, r in enumerate(records) if i % 10 != 0], str(tmp_path))
+    assert reconciliation.orphans == [] and reconciliation.broken_links == {}
+    reconciliation = filespace_handler.reconcile_records([r for i, r in enumerate(records) if i % 10 != 5], str(tmp_path))
+    assert len(reconciliation.orphans) == len(records) // 10
+    assert set(reconciliation.broken_links) == {record[0] for record in records[::10]}
+    assert (reconciliation.files, reconciliation.records) == (len(records) - len(records) // 10, len(records) - len(records) // 10)
+    # One pass over 18,000 files and records takes well under a second; a query per file would not
+    assert reconciliation.query_seconds + reconciliation.scan_seconds < 5
+
+def test_parent_query():
+    sql = str(filespace_handler._parent_query(["a", "b"]))
+    # All references are found with one query
+    assert sql.count("UNION ALL") == len(filespace_handler.PARENT_REFERENCES) - 1
+    for _, column in filespace_handler.PARENT_REFERENCES:
+        assert column in sql
+
+def test_choose_parents():
+    rows = [
+        ("file1", 4, "recording", "recording1"),
+        ("file1", 2, "selection", "selection1"),
+        ("file2", 4, "recording", "recording2"),
+        ("file3", 0, "recording", "recording3"),
+    ]
+    assert filespace_handler._choose_parents(rows) == {
+        "file1": ("selection", "selection1"),
+        "file2": ("recording", "recording2"),
+        "file3": ("recording", "recording3"),
+    }
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    app.register_blueprint(routes_recording.routes_recording)
+    app.register_blueprint(routes_selection.routes_selection)
+    app.register_blueprint(routes_filespace.routes_filespace)
+    with app.test_request_context():
+        yield app
+
+def add_recording(session, **kwargs):
+    encounter = models.Encounter(id=uuid.uuid4(), encounter_name="encounter", location="location", project="project",
+                                 species_id=uuid.uuid4(), data_source_id=uuid.uuid4(), recording_platform_id=uuid.uuid4())
+    recording = models.Recording(id=uuid.uuid4(), encounter=encounter, start_time=datetime.datetime(2024, 1, 1), **kwargs)
+    session.add_all([encounter, recording])
+    return recording
+
+def add_file(session, exists=True):
+    file_id = str(uuid.uuid4())
+    file = models.File(id=file_id, directory="dir", filename=file_id, extension="wav", deleted=False)
+    session.add(file)
+    if exists:
+        os.makedirs(os.path.dirname(file._path_with_root), exist_ok=True)
+        open(file._path_with_root, "wb").close()
+    return file_id
+
+def test_resolve_parents(filespace, db_session):
+    recording_audio, table, selection_audio, contour, orphan = [add_file(db_session) for _ in range(5)]
+    recording = add_recording(db_session, recording_file_id=recording_audio, selection_table_file_id=table)
+    selection = models.Selection(recording, id=str(uuid.uuid4()), selection_number=1, selection_file_id=selection_audio, contour_file_id=contour)
+    db_session.add(selection)
+    db_session.commit()
+    parents = filespace_handler._resolve_parents(db_session, [recording_audio, table, selection_audio, contour, orphan])
+    assert {file_id: (type(parent), str(parent.id)) for file_id, parent in parents.items()} == {
+        recording_audio: (models.Recording, str(recording.id)),
+        table: (models.Recording, str(recording.id)),
+        selection_audio: (models.Selection, str(selection.id)),
+        contour: (models.Selection, str(selection.id)),
+    }
+    assert filespace_handler._resolve_parents(db_session, []) == {}
+
+def test_query_file_class(filespace, db_session, app):
+    # Every odd file is missing from the filespace
+    file_ids = [add_file(db_session, exists=i % 2 == 0) for i in range(7)]
+    recording = add_recording(db_session, recording_file_id=file_ids[1])
+    selection = models.Selection(recording, id=str(uuid.uuid4()), selection_number=1, selection_file_id=file_ids[3])
+    db_session.add(selection)
+    db_session.commit()
+    # Batches smaller than the number of files are paginated
+    broken_links = filespace_handler.query_file_class(db_session, deleted=False, batch_size=2)
+    assert set(broken_links) == {file_ids[1], file_ids[3], file_ids[5]}
+    assert broken_links[file_ids[1]]["link"] == flask.url_for("recording.recording_view", recording_id=recording.id)
+    assert broken_links[file_ids[3]]["link"] == flask.url_for("selection.selection_view", selection_id=selection.id)
+    assert broken_links[file_ids[5]]["parent"] is None
+    assert broken_links[file_ids[5]]["delete"] == flask.url_for("filespace.filespace_delete_file", file_id=file_ids[5])
+    assert filespace_handler.query_file_class(db_session, deleted=True) == {}
@@ -0,0 +1,172 @@
+import concurrent.futures
+import hashlib
+import os
+import threading
+import time
+import uuid
+import pytest
+import sqlalchemy.orm
+
+from ..app import database_handler
+from ..app import exception_handler
+from ..app import integrity
+from ..app import models
+from .factories import db_session
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def files(tmp_path):
+    contents = {name: os.urandom(size) for name, size in [("a", 10), ("b", integrity.CHUNK_SIZE * 2 + 1), ("c", 0)]}
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+    return {str(tmp_path / name): data for name, data in contents.items()}
+
+def test_hash_file(files):
+    for path, data in files.items():
+        assert integrity.hash_file(path) == (hashlib.sha256(data).digest(), len(data))
+
+def test_hash_file_missing(tmp_path):
+    assert integrity.hash_file(str(tmp_path / "missing")) == (None, 0)
+
+def test_rate_limiter():
+    limiter = integrity.RateLimiter(1000)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.consume(100)
+    # The first 100 bytes are read immediately and the rest wait for 0.2 s
+    assert time.monotonic() - start == pytest.approx(0.2, abs=0.1)
+
+def test_rate_limiter_unlimited():
+    limiter = integrity.RateLimiter(0)
+    start = time.monotonic()
+    limiter.consume(10 ** 12)
+    assert time.monotonic() - start < 0.1
+
+def test_verify_files(files, tmp_path):
+    (path_a, a), (path_b, b), (path_c, c) = files.items()
+    entries = [
+        ("1", path_a, hashlib.sha256(a).digest()),
+        ("2", path_b, hashlib.sha256(b"other").digest()),
+        ("3", path_c, None),
+        ("4", str(tmp_path / "missing"), hashlib.sha256(a).digest()),
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        results = integrity.verify_files(entries, executor)
+    assert [result.file_id for result in results] == ["1", "2", "3", "4"]
+    assert [result.mismatch for result in results] == [False, True, False, False]
+    assert [result.missing for result in results] == [False, False, False, True]
+    assert results[2].actual == hashlib.sha256(c).digest()
+
+    report = integrity.new_report(total=4)
+    integrity.record_results(report, results)
+    assert (report["checked"], report["mismatched"], report["missing"], report["backfilled"]) == (4, 1, 1, 1)
+    assert report["bytes"] == len(a) + len(b)
+    assert [mismatch["id"] for mismatch in report["mismatches"]] == ["2"]
+
+def test_record_results_limit(monkeypatch):
+    monkeypatch.setattr(integrity, "MAX_REPORTED_MISMATCHES", 1)
+    report = integrity.new_report()
+    integrity.record_results(report, [integrity.FileResult(str(i), "path", b"a", b"b", 1) for i in range(3)])
+    assert report["mismatched"] == 3 and len(report["mismatches"]) == 1
+
+def test_report(filespace):
+    assert integrity.get_report() is None
+    report = integrity.new_report(total=10)
+    report["last_id"] = "abc"
+    integrity.save_report(report)
+    assert integrity.get_report() == report
+    assert report["updated"] is not None
+
+def test_verification_lock(filespace):
+    first, second = integrity.VerificationLock(), integrity.VerificationLock()
+    assert first.acquire()
+    # The lock is held per open file, so it excludes other processes as well as this one
+    assert not second.acquire()
+    assert integrity.is_running()
+    with pytest.raises(exception_handler.WarningException):
+        integrity.run()
+    first.release()
+    assert not integrity.is_running()
+    assert second.acquire()
+    second.release()
+
+class StopAfter(threading.Event):
+    """An event which is set once it has been checked `batches` times."""
+    def __init__(self, batches):
+        super().__init__()
+        self.batches = batches
+
+    def is_set(self):
+        self.batches -= 1
+        return self.batches < 0
+
+@pytest.fixture
+def database(filespace, db_session, monkeypatch):
+    """The application database, holding five files (in the file space) with their hashes."""
+    monkeypatch.setattr(database_handler, "session_instance", sqlalchemy.orm.sessionmaker(bind=db_session.get_bind()))
+    files = []
+    for i in range(5):
+        file = models.File(id=str(uuid.uuid4()), directory="dir", filename=f"file{i}", extension="csv", hash=hashlib.sha256(b"%d" % i).digest())
+        os.makedirs(os.path.dirname(file._path_with_root), exist_ok=True)
+        with open(file._path_with_root, "wb") as f:
+            f.write(b"%d" % i)
+        files.append(file)
+    db_session.add_all(files)
+    db_session.commit()
+    return sorted(files, key=lambda file: file.id)
+
+def test_run_resume(database):
+    report = integrity.run(workers=2, batch_size=2, stop_event=StopAfter(1))
+    # The verification stopped after the first batch, saving its position
+    assert report["finished"] is None
+    assert (report["checked"], report["last_id"]) == (2, database[1].id)
+    assert integrity.get_report() == report
+
+    # A verified file is not checked again, and a remaining one is
+    for file in (database[0], database[2]):
+        with open(file._path_with_root, "wb") as f:
+            f.write(b"corrupted")
+    report = integrity.run(workers=2, batch_size=2)
+    assert report["finished"] is not None
+    assert (report["total"], report["checked"], report["mismatched"]) == (5, 5, 1)
+    assert [mismatch["id"] for mismatch in report["mismatches"]] == [database[2].id]
+    # A new verification starts once the last finished
+    report = integrity.run(workers=2, batch_size=2)
+    assert (report["checked"], report["mismatched"]) == (5, 2)
+
+def test_run_backfills_hashes(database, db_session, monkeypatch):
+    db_session.query(models.File).update({models.File.hash: None})
+    db_session.commit()
+    sessions = []
+    session_instance = database_handler.session_instance
+    def get_session():
+        sessions.append(session_instance())
+        return sessions[-1]
+    verify_files = integrity.verify_files
+    concurrent_hash = hashlib.sha256(b"concurrent").digest()
+    def verify_files_concurrently(files, *args):
+        # No transaction is open while files are read
+        assert not any(session.in_transaction() for session in sessions)
+        results = verify_files(files, *args)
+        # A hash stored while the batch was being read is kept
+        if files[0][0] == database[0].id:
+            with database_handler.get_session() as session:
+                session.query(models.File).filter_by(id=database[0].id).update({models.File.hash: concurrent_hash})
+                session.commit()
+        return results
+    monkeypatch.setattr(database_handler, "session_instance", get_session)
+    monkeypatch.setattr(integrity, "verify_files", verify_files_concurrently)
+    report = integrity.run(workers=2, batch_size=2)
+    assert (report["checked"], report["backfilled"]) == (5, 5)
+    db_session.expire_all()
+    hashes = {file.id: file.hash for file in db_session.query(models.File)}
+    assert hashes[database[0].id] == concurrent_hash
+    for file in database[1:]:
+        with open(file._path_with_root, "rb") as f:
+            assert hashes[file.id] == hashlib.sha256(f.read()).digest()
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import pytest
+
+from ..app import database_handler
+from ..app import plot_cache
+
+PARAMETERS = {"sampling_rate": 44100, "window_size": 1024, "hop_size": 256}
+SELECTION_HASH = hashlib.sha256(b"selection").digest()
+CONTOUR_HASH = hashlib.sha256(b"contour").digest()
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def fingerprint():
+    return plot_cache.make_fingerprint(SELECTION_HASH, CONTOUR_HASH)
+
+def test_make_fingerprint():
+    assert plot_cache.make_fingerprint(None, CONTOUR_HASH) is None
+    assert plot_cache.make_fingerprint(SELECTION_HASH) != plot_cache.make_fingerprint(SELECTION_HASH, CONTOUR_HASH)
+
+def test_get_miss(filespace, fingerprint):
+    misses = plot_cache.get_statistics().misses
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is None
+    assert plot_cache.get_statistics().misses == misses + 1
+
+def test_put_get(filespace, fingerprint):
+    hits = plot_cache.get_statistics().hits
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"plot")
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) == b"plot"
+    assert plot_cache.get("selection1", fingerprint, {**PARAMETERS, "window_size": 2048}) is None
+    assert plot_cache.get("selection2", fingerprint, PARAMETERS) is None
+    statistics = plot_cache.get_statistics()
+    assert statistics.hits == hits + 1
+    assert (statistics.entries, statistics.size) == (1, 4)
+
+def test_put_no_fingerprint(filespace):
+    plot_cache.put("selection1", None, PARAMETERS, b"plot")
+    assert plot_cache.get("selection1", None, PARAMETERS) is None
+    assert plot_cache.get_statistics().entries == 0
+
+def test_put_invalidates_changed_files(filespace, fingerprint):
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"plot")
+    plot_cache.put("selection1", fingerprint, {**PARAMETERS, "window_size": 2048}, b"plot")
+    # Replacing the contour file changes the fingerprint
+    new_fingerprint = plot_cache.make_fingerprint(SELECTION_HASH, hashlib.sha256(b"new contour").digest())
+    plot_cache.put("selection1", new_fingerprint, PARAMETERS, b"new plot")
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is None
+    assert plot_cache.get("selection1", new_fingerprint, PARAMETERS) == b"new plot"
+    assert plot_cache.get_statistics().entries == 1
+
+def test_invalidate(filespace, fingerprint):
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"plot")
+    plot_cache.put("selection2", fingerprint, PARAMETERS, b"plot")
+    plot_cache.invalidate("selection1")
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is None
+    assert plot_cache.get("selection2", fingerprint, PARAMETERS) == b"plot"
+
+def test_evict_least_recently_used(filespace, fingerprint):
+    for i, selection_id in enumerate(["selection1", "selection2", "selection3"]):
+        plot_cache.put(selection_id, fingerprint, PARAMETERS, b"x" * 100)
+        path = plot_cache._get_entry_path(selection_id, fingerprint, PARAMETERS)
+        os.utime(path, (1000 + i, 1000 + i))
+    # Reading an entry makes it the most recently used
+    plot_cache.get("selection1", fingerprint, PARAMETERS)
+    evictions = plot_cache.get_statistics().evictions
+    assert plot_cache.evict(200) == 1
+    assert plot_cache.get_statistics().evictions == evictions + 1
+    assert plot_cache.get("selection2", fingerprint, PARAMETERS) is None
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is not None
+    assert plot_cache.get("selection3", fingerprint, PARAMETERS) is not None
+
+def test_put_evicts(filespace, fingerprint):
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"x" * 100, max_size=150)
+    os.utime(plot_cache._get_entry_path("selection1", fingerprint, PARAMETERS), (1000, 1000))
+    plot_cache.put("selection2", fingerprint, PARAMETERS, b"x" * 100, max_size=150)
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is None
+    assert plot_cache.get("selection2", fingerprint, PARAMETERS) is not None
+
+def test_invalidate_stale_versions(filespace, fingerprint, monkeypatch):
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"plot")
+    old_directory = plot_cache._get_version_directory()
+    monkeypatch.setattr(plot_cache, "RENDERER_VERSION", plot_cache.RENDERER_VERSION + 1)
+    assert plot_cache.get("selection1", fingerprint, PARAMETERS) is None
+    plot_cache.put("selection1", fingerprint, PARAMETERS, b"plot")
+    assert not os.path.exists(old_directory)
+
+def test_make_etag(fingerprint, monkeypatch):
+    etag = plot_cache.make_etag(fingerprint, PARAMETERS)
+    assert plot_cache.make_etag(None, PARAMETERS) is None
+    assert plot_cache.make_etag(fingerprint, dict(reversed(PARAMETERS.items()))) == etag
+    assert plot_cache.make_etag(fingerprint, {**PARAMETERS, "window_size": 2048}) != etag
+    monkeypatch.setattr(plot_cache, "RENDERER_VERSION", plot_cache.RENDERER_VERSION + 1)
+    assert plot_cache.make_etag(fingerprint, PARAMETERS) != etag
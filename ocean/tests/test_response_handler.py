@@ -0,0 +1,113 @@
+import datetime
+import hashlib
+import os
+import flask
+import pytest
+
+from . import factories
+from ..app import database_handler
+from ..app import response_handler
+from ..app import utils
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "files")
+ETAG = hashlib.sha256(b"resource").hexdigest()
+LAST_MODIFIED = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+@pytest.fixture
+def app():
+    return flask.Flask(__name__)
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def wav_file_object(filespace):
+    file = factories.FileFactory()
+    with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+        file.insert(f, "dir1", "file1", extension="wav")
+    file.upload_datetime = LAST_MODIFIED
+    return file
+
+def test_set_caching(app):
+    with app.test_request_context():
+        response = response_handler.set_caching(flask.Response(), ETAG, LAST_MODIFIED, policy="tile")
+    assert response.headers["ETag"] == f'"{ETAG}"'
+    assert response.last_modified == LAST_MODIFIED
+    assert response.cache_control.immutable and response.cache_control.private
+    assert response.cache_control.max_age == response_handler.CACHE_POLICIES["tile"]["max_age"]
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, False),
+    ({"If-None-Match": f'"{ETAG}"'}, True),
+    ({"If-None-Match": f'"other", "{ETAG}"'}, True),
+    ({"If-None-Match": "*"}, True),
+    ({"If-None-Match": '"other"'}, False),
+    # If-None-Match takes precedence over If-Modified-Since
+    ({"If-None-Match": '"other"', "If-Modified-Since": "Tue, 02 Jan 2024 00:00:00 GMT"}, False),
+    ({"If-Modified-Since": "Tue, 02 Jan 2024 00:00:00 GMT"}, True),
+    ({"If-Modified-Since": "Sun, 31 Dec 2023 00:00:00 GMT"}, False),
+])
+def test_not_modified(app, headers, expected):
+    with app.test_request_context(headers=headers):
+        response = response_handler.not_modified(ETAG, LAST_MODIFIED, policy="file")
+    assert (response is not None) == expected
+    if expected:
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{ETAG}"'
+        assert response.cache_control.no_cache
+
+def test_not_modified_no_etag(app):
+    with app.test_request_context(headers={"If-None-Match": "*"}):
+        assert response_handler.not_modified(None) is None
+
+def test_download_file(app, wav_file_object):
+    with app.test_request_context():
+        response = utils.download_file(wav_file_object)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{wav_file_object.hash_hex}"'
+    assert response.cache_control.no_cache
+    response.close()
+
+def test_download_file_not_modified(app, wav_file_object, monkeypatch):
+    # A client with the file is answered without hashing the file
+    monkeypatch.setattr(type(wav_file_object), "verify_hash", lambda *args, **kwargs: pytest.fail("File was read"))
+    with app.test_request_context(headers={"If-None-Match": f'"{wav_file_object.hash_hex}"'}):
+        response = utils.download_file(wav_file_object)
+    assert response.status_code == 304
+    assert response.headers["ETag"] == f'"{wav_file_object.hash_hex}"'
+
+def test_download_file_range(app, wav_file_object, monkeypatch):
+    # Ranged requests are not verified, as each would read the whole file
+    monkeypatch.setattr(type(wav_file_object), "verify_hash", lambda *args, **kwargs: pytest.fail("File was read"))
+    with app.test_request_context(headers={"Range": "bytes=100-199"}):
+        response = utils.download_file(wav_file_object, mimetype="audio/wav")
+        response.direct_passthrough = False
+        body = response.get_data()
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{os.path.getsize(wav_file_object._path_with_root)}"
+    with open(wav_file_object._path_with_root, "rb") as f:
+        f.seek(100)
+        assert body == f.read(100)
+
+def test_download_file_if_range(app, wav_file_object):
+    """A range is only sent if the client's copy (identified by its ETag) is current"""
+    with app.test_request_context(headers={"Range": "bytes=100-199", "If-Range": '"other"'}):
+        response = utils.download_file(wav_file_object)
+    assert response.status_code == 200
+    response.close()
+    with app.test_request_context(headers={"Range": "bytes=100-199", "If-Range": f'"{wav_file_object.hash_hex}"'}):
+        response = utils.download_file(wav_file_object)
+    assert response.status_code == 206
+    response.close()
+
+def test_download_file_streamed(app, wav_file_object):
+    with app.test_request_context():
+        response = utils.download_file(wav_file_object)
+    # The body is an iterator over the open file rather than its bytes
+    assert response.direct_passthrough
+    assert response.headers["Accept-Ranges"] == "bytes"
+    response.close()
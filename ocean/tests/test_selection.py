@@ -274,4 +274,11 @@ def test_unique_name(selection: models.Selection):
 
 
 # TODO: add test9s) for:
-# get_contour_file_handler
\ No newline at end of file
+# get_contour_file_handler
+def test_calculate_sampling_rate_from_audio_metadata(selection: models.Selection):
+    """The sampling rate is taken from the stored audio metadata without reading the file"""
+    file = factories.FileFactory(extension="wav", directory="missing", filename="missing")
+    file.audio_sampling_rate = 96000
+    selection.selection_file = file
+    selection._calculate_sampling_rate()
+    assert selection.sampling_rate == 96000
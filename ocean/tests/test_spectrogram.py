@@ -0,0 +1,64 @@
+import concurrent.futures
+import io
+import numpy
+import pytest
+from PIL import Image
+
+from ..app import exception_handler
+from ..app import spectrogram
+
+SAMPLING_RATE = 44100
+HOP_SIZE = 256
+
+@pytest.fixture(scope="module")
+def spectrogram_db():
+    t = numpy.arange(SAMPLING_RATE // 2) / SAMPLING_RATE
+    audio = numpy.sin(2 * numpy.pi * (5000 * t + 6000 * t ** 2)).astype(numpy.float32)
+    return spectrogram.compute_spectrogram(audio, 1024, HOP_SIZE)
+
+@pytest.fixture
+def contour():
+    time_milliseconds = numpy.arange(0, 500, 2.0)
+    return spectrogram.Contour(time_milliseconds, 5000 + 6 * time_milliseconds)
+
+def open_png(data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(data))
+    assert image.format == "PNG"
+    return image
+
+@pytest.mark.parametrize("renderer", spectrogram.RENDERERS)
+def test_render(spectrogram_db, contour, renderer):
+    without_contour = open_png(spectrogram.render(renderer, spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title"))
+    with_contour = open_png(spectrogram.render(renderer, spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title", contour))
+    # The contour is plotted in a second panel
+    assert with_contour.size != without_contour.size
+
+def test_render_unknown_renderer(spectrogram_db):
+    with pytest.raises(exception_handler.WarningException):
+        spectrogram.render("unknown", spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title")
+
+def test_render_pillow_colormap(spectrogram_db):
+    image = open_png(spectrogram.render("pillow", spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title")).convert("RGB")
+    colours = set(image.getdata())
+    # The loudest and quietest parts of the spectrogram use the ends of the colormap
+    assert tuple(spectrogram.COLORMAP_LUT[0]) in colours
+    assert tuple(spectrogram.COLORMAP_LUT[-1]) in colours
+
+def test_render_pillow_silence():
+    silence = spectrogram.compute_spectrogram(numpy.zeros(SAMPLING_RATE // 10, dtype=numpy.float32), 1024, HOP_SIZE)
+    open_png(spectrogram.render("pillow", silence, SAMPLING_RATE, HOP_SIZE, "Title"))
+
+@pytest.mark.parametrize("renderer", spectrogram.RENDERERS)
+def test_render_concurrent(spectrogram_db, contour, renderer):
+    expected = spectrogram.render(renderer, spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title", contour)
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: spectrogram.render(renderer, spectrogram_db, SAMPLING_RATE, HOP_SIZE, "Title", contour), range(8)))
+    assert all(result == expected for result in results)
+
+@pytest.mark.parametrize("low, high, expected", [
+    (0, 20000, [0, 5000, 10000, 15000, 20000]),
+    (0, 1500, [0, 200, 400, 600, 800, 1000, 1200, 1400]),
+    (0, 0, [0]),
+])
+def test_nice_ticks(low, high, expected):
+    numpy.testing.assert_allclose(spectrogram._nice_ticks(low, high), expected)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import time
+import flask
+import numpy as np
+import pytest
+import soundfile
+from PIL import Image
+
+from ..app import background_worker
+from ..app import database_handler
+from ..app import exception_handler
+from ..app import spectrogram
+from ..app import spectrogram_tiles
+
+FILE_HASH = hashlib.sha256(b"recording").digest()
+SAMPLING_RATE = 8000
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+def write_recording(directory, seconds, sampling_rate=SAMPLING_RATE):
+    t = np.arange(int(seconds * sampling_rate)) / sampling_rate
+    audio = 0.5 * np.sin(2 * np.pi * 1000 * t)
+    path = os.path.join(directory, "recording.wav")
+    soundfile.write(path, audio, sampling_rate)
+    return path
+
+def test_reduce():
+    columns = np.array([[1, 5, 2], [3, 0, 7], [4, 4, 1], [0, 9, 0]], dtype=np.uint8)
+    np.testing.assert_array_equal(spectrogram_tiles._reduce(columns, reduce_rows=False), [[5, 2], [3, 7], [4, 1], [9, 0]])
+    np.testing.assert_array_equal(spectrogram_tiles._reduce(columns, reduce_rows=True), [[5, 7], [9, 1]])
+
+def test_build(filespace):
+    path = write_recording(filespace, 60)
+    assert spectrogram_tiles.get_metadata(FILE_HASH) is None
+    metadata = spectrogram_tiles.build(FILE_HASH, path)
+    assert spectrogram_tiles.get_metadata(FILE_HASH) == metadata
+
+    window_size, hop_size = spectrogram.stft_parameters(SAMPLING_RATE)
+    assert (metadata["window_size"], metadata["hop_size"]) == (window_size, hop_size)
+    assert metadata["frames"] == (60 * SAMPLING_RATE - window_size) // hop_size + 1
+    levels = metadata["levels"]
+    assert len(levels) == spectrogram_tiles._num_levels(metadata["frames"])
+    # The coarsest level fits in one tile and the finest has one column per frame
+    assert levels[0]["x_tiles"] == 1
+    assert levels[-1]["width"] == metadata["frames"]
+    assert levels[-1]["height"] == window_size // 2
+    for coarser, finer in zip(levels, levels[1:]):
+        assert coarser["width"] == -(-finer["width"] // 2)
+
+    for level in levels:
+        for x in range(level["x_tiles"]):
+            for y in range(level["y_tiles"]):
+                assert spectrogram_tiles.get_tile(FILE_HASH, level["level"], x, y) is not None
+        assert spectrogram_tiles.get_tile(FILE_HASH, level["level"], level["x_tiles"], 0) is None
+    with Image.open(spectrogram_tiles.get_tile(FILE_HASH, 0, 0, 0)) as tile:
+        assert tile.size == (levels[0]["width"], min(spectrogram_tiles.TILE_SIZE, levels[0]["height"]))
+    # No temporary build directories are left behind
+    assert os.listdir(spectrogram_tiles._get_version_directory()) == [FILE_HASH.hex()]
+
+def test_build_tone_position(filespace):
+    path = write_recording(filespace, 5)
+    metadata = spectrogram_tiles.build(FILE_HASH, path)
+    finest = metadata["levels"][-1]
+    with Image.open(spectrogram_tiles.get_tile(FILE_HASH, finest["level"], 0, 0)) as tile:
+        column = np.asarray(tile.convert("L"))[:, 0]
+    # The brightest row is the 1 kHz tone (rows run from the highest frequency down)
+    frequency = (finest["height"] - 1 - np.argmax(column)) * SAMPLING_RATE / metadata["window_size"]
+    assert abs(frequency - 1000) <= SAMPLING_RATE / metadata["window_size"]
+
+def test_build_too_short(filespace):
+    path = write_recording(filespace, 0.01)
+    with pytest.raises(exception_handler.WarningException):
+        spectrogram_tiles.build(FILE_HASH, path)
+    assert spectrogram_tiles.get_metadata(FILE_HASH) is None
+
+def test_build_no_hash(filespace):
+    path = write_recording(filespace, 1)
+    with pytest.raises(exception_handler.WarningException):
+        spectrogram_tiles.build(None, path)
+    assert spectrogram_tiles.get_metadata(None) is None
+
+def test_invalidate_stale_versions(filespace, monkeypatch):
+    path = write_recording(filespace, 1)
+    spectrogram_tiles.build(FILE_HASH, path)
+    old_directory = spectrogram_tiles._get_version_directory()
+    monkeypatch.setattr(spectrogram_tiles, "TILE_VERSION", spectrogram_tiles.TILE_VERSION + 1)
+    assert spectrogram_tiles.get_metadata(FILE_HASH) is None
+    spectrogram_tiles.build(FILE_HASH, path)
+    assert not os.path.exists(old_directory)
+
+def test_request_build_failure(filespace, monkeypatch):
+    # The recording is too short to build, so every build fails
+    path = write_recording(filespace, 0.01)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    with flask.Flask(__name__).app_context():
+        assert spectrogram_tiles.request_build(FILE_HASH, path)
+        background_worker.get_pool().join()
+        failure = spectrogram_tiles.get_failure(FILE_HASH)
+        assert failure["failures"] == 1 and "too short" in failure["error"]
+        assert failure["retry"] == now + spectrogram_tiles.RETRY_SECONDS
+        # The build is not queued again until it is due to be retried
+        assert not spectrogram_tiles.request_build(FILE_HASH, path)
+        monkeypatch.setattr(time, "time", lambda: now + spectrogram_tiles.RETRY_SECONDS)
+        assert spectrogram_tiles.get_failure(FILE_HASH) is None
+        assert spectrogram_tiles.request_build(FILE_HASH, path)
+        background_worker.get_pool().join()
+    # Each consecutive failure doubles the time before the next retry
+    failure = spectrogram_tiles.get_failure(FILE_HASH)
+    assert failure["failures"] == 2
+    assert failure["retry"] == now + 3 * spectrogram_tiles.RETRY_SECONDS
+
+def test_request_build_clears_failure(filespace):
+    path = write_recording(filespace, 1)
+    spectrogram_tiles._record_failure(FILE_HASH, "error")
+    with open(spectrogram_tiles._get_failure_path(FILE_HASH)) as f:
+        failure = json.load(f)
+    failure["retry"] = 0
+    with open(spectrogram_tiles._get_failure_path(FILE_HASH), "w") as f:
+        json.dump(failure, f)
+    with flask.Flask(__name__).app_context():
+        assert spectrogram_tiles.request_build(FILE_HASH, path)
+        background_worker.get_pool().join()
+    assert spectrogram_tiles.get_metadata(FILE_HASH) is not None
+    assert not os.path.exists(spectrogram_tiles._get_failure_path(FILE_HASH))
+
+def test_invalidate(filespace):
+    spectrogram_tiles.build(FILE_HASH, write_recording(filespace, 1))
+    spectrogram_tiles._record_failure(FILE_HASH, "error")
+    spectrogram_tiles.invalidate(FILE_HASH)
+    assert spectrogram_tiles.get_metadata(FILE_HASH) is None
+    assert spectrogram_tiles.get_failure(FILE_HASH) is None
+    spectrogram_tiles.invalidate(None)
@@ -0,0 +1,81 @@
+import numpy
+import pandas as pd
+import pytest
+
+from ..app import summary_statistics
+
+
+def assert_identical(actual, expected):
+    """Assert two floats are exactly equal (treating NaN as equal to NaN)."""
+    assert (numpy.isnan(actual) and numpy.isnan(expected)) or actual == expected, f"{actual} != {expected}"
+
+def assert_matches_pandas(values, ddof=1):
+    series = pd.Series(values)
+    actual = summary_statistics.summarise(values, ddof=ddof)
+    assert actual.count == series.count()
+    assert_identical(actual.min, series.min())
+    assert_identical(actual.max, series.max())
+    assert_identical(actual.mean, series.mean())
+    assert_identical(actual.std, series.std(ddof=ddof))
+    assert_identical(actual.median, series.median())
+    assert_identical(actual.quartile1, series.quantile(0.25))
+    assert_identical(actual.quartile3, series.quantile(0.75))
+
+@pytest.mark.parametrize("values", [
+    [1.0],
+    [1.0, 2.0],
+    [3.0, 1.0, 2.0],
+    [5.0, 5.0, 5.0, 5.0],
+    [0.1, 0.2, 0.3, 0.4, 0.5],
+    [7690.4296875, 7653.80859375, 7690.4296875, 7800.0, 7500.25, 7512.5],
+    [1, 2, 3, 4],
+    [-1e300, 1e300, 0.0, 1.0],
+    [numpy.nan, 1.0, 2.0],
+    [numpy.nan, numpy.nan],
+    [numpy.inf, 1.0, 2.0],
+])
+def test_summarise(values):
+    assert_matches_pandas(numpy.array(values))
+
+@pytest.mark.parametrize("seed", range(200))
+def test_summarise_random(seed):
+    rng = numpy.random.default_rng(seed)
+    num_values = int(rng.integers(1, 2000))
+    # A mix of continuous and heavily quantised (tied) values
+    values = rng.normal(8000, 2000, num_values)
+    if seed % 2: values = numpy.round(values / 36.62109375) * 36.62109375
+    assert_matches_pandas(values)
+
+def test_summarise_empty():
+    actual = summary_statistics.summarise(numpy.array([]))
+    assert actual.count == 0
+    assert all(numpy.isnan(value) for value in actual[1:])
+
+@pytest.mark.parametrize("ddof", [0, 1, 2])
+def test_summarise_ddof(ddof):
+    assert_matches_pandas(numpy.array([1.0, 4.0, 9.0, 16.0]), ddof=ddof)
+    assert_matches_pandas(numpy.array([1.0]), ddof=ddof)
+
+def test_summarise_does_not_modify_values():
+    values = numpy.array([3.0, 1.0, 2.0])
+    summary_statistics.summarise(values)
+    assert values.tolist() == [3.0, 1.0, 2.0]
+
+@pytest.mark.parametrize("seed", range(50))
+def test_summarise_segments(seed):
+    """Summarising many segments at once gives exactly the results of summarising each."""
+    rng = numpy.random.default_rng(seed)
+    lengths = rng.integers(0, 300, 20)
+    offsets = numpy.concatenate(([0], numpy.cumsum(lengths)))
+    values = numpy.round(rng.normal(8000, 2000, offsets[-1]) / 36.62109375) * 36.62109375
+    actual = summary_statistics.summarise_segments(values, offsets)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        expected = summary_statistics.summarise(values[start:end])
+        assert actual.count[i] == expected.count
+        for field in summary_statistics.SummaryStatistics._fields[1:]:
+            assert_identical(getattr(actual, field)[i], getattr(expected, field))
+
+def test_summarise_segments_empty():
+    actual = summary_statistics.summarise_segments(numpy.array([]), numpy.array([0, 0]))
+    assert list(actual.count) == [0]
+    assert all(numpy.isnan(value[0]) for value in actual[1:])
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import flask
+import numpy as np
+import pytest
+import soundfile
+
+from ..app import background_worker
+from ..app import database_handler
+from ..app import exception_handler
+from ..app import waveform
+
+FILE_HASH = hashlib.sha256(b"recording").digest()
+SAMPLING_RATE = 8000
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def audio():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.5, 0.5, (SAMPLING_RATE * 60, 2))
+
+@pytest.fixture
+def recording(filespace, audio):
+    path = os.path.join(filespace, "recording.wav")
+    soundfile.write(path, audio, SAMPLING_RATE, subtype="FLOAT")
+    return path
+
+def test_reduce():
+    envelope = np.array([[-1, 1], [-3, 2], [0, 5], [-2, 0], [-4, 1]], dtype=np.int16)
+    np.testing.assert_array_equal(waveform._reduce(envelope, 2), [[-3, 2], [-2, 5], [-4, 1]])
+
+def test_build(recording, audio):
+    assert waveform.get_metadata(FILE_HASH) is None
+    metadata = waveform.build(FILE_HASH, recording)
+    assert waveform.get_metadata(FILE_HASH) == metadata
+    assert (metadata["sampling_rate"], metadata["frames"]) == (SAMPLING_RATE, len(audio))
+    # Levels coarser than the recording are not stored
+    assert metadata["samples_per_pixel"] == [s for s in waveform.SAMPLES_PER_PIXEL if s <= len(audio) or s == waveform.SAMPLES_PER_PIXEL[0]]
+    for samples_per_pixel in metadata["samples_per_pixel"]:
+        envelope = np.load(waveform._get_level_path(waveform._get_envelope_directory(FILE_HASH), samples_per_pixel))
+        assert len(envelope) == -(-len(audio) // samples_per_pixel)
+        # The envelope of the first pair covers the first `samples_per_pixel` frames of both channels
+        first = audio[:samples_per_pixel]
+        np.testing.assert_allclose(envelope[0] / 32767, [first.min(), first.max()], atol=1 / 32767)
+    assert os.listdir(waveform._get_version_directory()) == [FILE_HASH.hex()]
+
+def test_get_slice(recording):
+    assert waveform.get_slice(FILE_HASH) is None
+    waveform.build(FILE_HASH, recording)
+    whole = waveform.get_slice(FILE_HASH, pixels=100)
+    assert len(whole["min"]) >= 100 and len(whole["min"]) == len(whole["max"])
+    assert (whole["start"], whole["end"]) == (0, 60)
+    # Zooming in uses a finer level
+    part = waveform.get_slice(FILE_HASH, start=10, end=11, pixels=100)
+    assert part["samples_per_pixel"] < whole["samples_per_pixel"]
+    assert part["start"] <= 10 and part["end"] >= 11
+    assert len(part["min"]) == pytest.approx((part["end"] - part["start"]) * SAMPLING_RATE / part["samples_per_pixel"], abs=1)
+    # Slices beyond the end of the recording are empty
+    assert waveform.get_slice(FILE_HASH, start=100, pixels=100)["min"] == []
+
+def test_get_slice_invalid_pixels(recording):
+    waveform.build(FILE_HASH, recording)
+    with pytest.raises(exception_handler.WarningException):
+        waveform.get_slice(FILE_HASH, pixels=0)
+    with pytest.raises(exception_handler.WarningException):
+        waveform.get_slice(FILE_HASH, pixels=waveform.MAX_PIXELS + 1)
+
+def test_build_short(filespace):
+    path = os.path.join(filespace, "short.wav")
+    soundfile.write(path, np.full(10, 0.25), SAMPLING_RATE)
+    metadata = waveform.build(FILE_HASH, path)
+    assert metadata["samples_per_pixel"] == [waveform.SAMPLES_PER_PIXEL[0]]
+    assert waveform.get_slice(FILE_HASH)["max"] == [8192]
+
+def test_build_no_hash(recording):
+    with pytest.raises(exception_handler.WarningException):
+        waveform.build(None, recording)
+
+def test_invalidate_stale_versions(recording, monkeypatch):
+    waveform.build(FILE_HASH, recording)
+    old_directory = waveform._get_version_directory()
+    monkeypatch.setattr(waveform, "ENVELOPE_VERSION", waveform.ENVELOPE_VERSION + 1)
+    assert waveform.get_metadata(FILE_HASH) is None
+    waveform.build(FILE_HASH, recording)
+    assert not os.path.exists(old_directory)
+
+def test_request_build(recording):
+    with flask.Flask(__name__).app_context():
+        assert waveform.request_build(FILE_HASH, recording)
+        background_worker.get_pool().join()
+    assert not waveform.is_building(FILE_HASH)
+    assert waveform.get_metadata(FILE_HASH)["frames"] == SAMPLING_RATE * 60
+
+def test_request_build_already_building(recording):
+    with waveform._building_lock:
+        waveform._building.add(FILE_HASH)
+    try:
+        # No second build is queued while the first is running
+        with flask.Flask(__name__).app_context():
+            assert waveform.request_build(FILE_HASH, recording)
+            background_worker.get_pool().join()
+        assert waveform.get_metadata(FILE_HASH) is None
+    finally:
+        with waveform._building_lock:
+            waveform._building.discard(FILE_HASH)
+
+def test_invalidate(recording):
+    waveform.build(FILE_HASH, recording)
+    waveform.invalidate(FILE_HASH)
+    assert waveform.get_metadata(FILE_HASH) is None
+    waveform.invalidate(None)
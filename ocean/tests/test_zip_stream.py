@@ -0,0 +1,107 @@
+import io
+import os
+import zipfile
+import flask
+import pytest
+
+from . import factories
+from ..app import database_handler
+from ..app import utils
+from ..app import zip_stream
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "files")
+
+@pytest.fixture
+def filespace(tmp_path):
+    previous = database_handler.FILE_SPACE_PATH
+    database_handler.FILE_SPACE_PATH = str(tmp_path)
+    yield str(tmp_path)
+    database_handler.FILE_SPACE_PATH = previous
+
+@pytest.fixture
+def wav_path():
+    return os.path.join(BASE_DIR, "test.wav")
+
+def write_archive(members, **kwargs):
+    return b"".join(zip_stream.stream(members, **kwargs))
+
+def test_stream(wav_path):
+    csv = b"time,frequency\n" + b"0.1,1000\n" * 1000
+    archive = write_archive([zip_stream.ZipMember("recording.wav", wav_path), zip_stream.ZipMember("contour.csv", csv)], chunk_size=4096)
+    with zipfile.ZipFile(io.BytesIO(archive)) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == ["recording.wav", "contour.csv"]
+        # Audio is stored and everything else is deflated
+        assert zip_file.getinfo("recording.wav").compress_type == zipfile.ZIP_STORED
+        assert zip_file.getinfo("contour.csv").compress_type == zipfile.ZIP_DEFLATED
+        assert zip_file.getinfo("contour.csv").compress_size < len(csv)
+        with open(wav_path, "rb") as f:
+            assert zip_file.read("recording.wav") == f.read()
+        assert zip_file.read("contour.csv") == csv
+
+def test_stream_empty():
+    with zipfile.ZipFile(io.BytesIO(write_archive([]))) as zip_file:
+        assert zip_file.namelist() == []
+
+def test_stream_lazy():
+    """Members are only consumed as the archive is written"""
+    consumed = []
+    def members():
+        for i in range(3):
+            consumed.append(i)
+            yield zip_stream.ZipMember(f"{i}.txt", b"data")
+    chunks = zip_stream.stream(members())
+    next(chunks)
+    assert consumed == [0]
+
+def test_stream_zip64(wav_path, monkeypatch):
+    monkeypatch.setattr(zip_stream, "ZIP64_LIMIT", 1000)
+    monkeypatch.setattr(zip_stream, "ZIP_MAX_MEMBERS", 3)
+    members = [zip_stream.ZipMember("recording.wav", wav_path)] + [zip_stream.ZipMember(f"{i}.txt", b"small") for i in range(3)]
+    archive = write_archive(members)
+    # The ZIP64 end of central directory record is written
+    assert b"PK\x06\x06" in archive
+    with zipfile.ZipFile(io.BytesIO(archive)) as zip_file:
+        assert zip_file.testzip() is None
+        assert len(zip_file.namelist()) == 4
+        # Members after the first start beyond the (reduced) limit
+        assert zip_file.getinfo("2.txt").header_offset > 1000
+        with open(wav_path, "rb") as f:
+            assert zip_file.read("recording.wav") == f.read()
+
+def test_stream_file_size(tmp_path):
+    """Members larger than the chunk size are written in several chunks"""
+    path = tmp_path / "data.wav"
+    path.write_bytes(os.urandom(10000))
+    chunks = list(zip_stream.stream([zip_stream.ZipMember("data.wav", str(path))], chunk_size=1000))
+    assert max(len(chunk) for chunk in chunks) <= 1000
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zip_file:
+        assert zip_file.read("data.wav") == path.read_bytes()
+
+def test_download_files(filespace):
+    files = []
+    for i in range(2):
+        file = factories.FileFactory()
+        with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+            file.insert(f, "dir1", f"file{i}", extension="wav")
+        files.append(file)
+    os.remove(files[1]._path_with_root)
+    with flask.Flask(__name__).test_request_context():
+        response = utils.download_files(files, ["first", "second"], "files.zip")
+        body = response.get_data()
+    assert response.mimetype == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+        assert zip_file.namelist() == ["first.wav", "ERROR_second.txt"]
+        with open(os.path.join(BASE_DIR, "test.wav"), "rb") as f:
+            assert zip_file.read("first.wav") == f.read()
+
+def test_stream_zip_file():
+    def fail():
+        raise ValueError("no contour")
+    entries = [(lambda: io.BytesIO(b"ctr"), "first.ctr"), (fail, "second.ctr"), (b"data", "third.ctr")]
+    with flask.Flask(__name__).test_request_context():
+        body = utils.stream_zip_file(entries, "ctr_files.zip").get_data()
+    with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+        assert zip_file.namelist() == ["first.ctr", "ERROR_second.ctr.txt", "third.ctr"]
+        assert zip_file.read("first.ctr") == b"ctr"
+        assert b"no contour" in zip_file.read("ERROR_second.ctr.txt")